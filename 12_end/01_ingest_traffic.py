@@ -1,186 +1,464 @@
 # 01_ingest_traffic.py
-# Ingest Brussels Realtime Traffic Counts (1m, t1)
+# Ingest Realtime Traffic Counts (Brussels 1m/t1 and other configured metros)
 # Pairs with 01_ingest_traffic.R
 # Tim Fraser
 #
-# This cron-friendly script fetches the latest traverse-level vehicle counts from
-# the Brussels traffic API and stores normalized rows in SQLite.
+# This cron-friendly script fetches the latest vehicle counts from every source
+# listed in sources.csv that has an adapter in traffic_sources.py, and stores
+# normalized rows in SQLite. Sources are fetched concurrently and all rows are
+# written in one transaction.
+#
+# Two modes:
+# - one-shot (default): fetch once, write, exit. This is what the cron runs.
+# - daemon (--daemon): stay alive, keep one pooled HTTP session and one SQLite
+#   connection open, and poll every --interval seconds (with jitter) so every
+#   published minute is captured without re-spawning the process.
+#
+# With --segments, new rows are written to a small immutable file under
+# data/segments/ instead of into traffic.db, so the cron only ever adds files
+# to git. `python traffic_store.py compact` folds them into traffic.db later.
+#
+# With --all-intervals (opt-in), every interval (1m/5m/15m/60m), traverse
+# block and lane in the payload is also stored in the long traffic_obs table.
+#
+# The `backfill --from --to` subcommand recovers minutes the cron missed by
+# requesting the API's historical data window by window on a worker pool.
+# Finished windows are checkpointed in traffic.db, so a rerun resumes.
 
 # Run from inside the 12_end/ directory so the paths resolve correctly.
 # Git bash: cd 12_end && python 01_ingest_traffic.py
+# Git bash: cd 12_end && python 01_ingest_traffic.py --source brussels_mobility_traffic_counts
+# Git bash: cd 12_end && python 01_ingest_traffic.py --segments
+# Git bash: cd 12_end && python 01_ingest_traffic.py --all-intervals
+# Git bash: cd 12_end && python 01_ingest_traffic.py --daemon --interval 60
+# Git bash: cd 12_end && python 01_ingest_traffic.py backfill --from 2026-05-01 --to 2026-05-07
 # Powershell: Set-Location 12_end; python 01_ingest_traffic.py
 
 # 0. SETUP ###################################
 
 ## 0.1 Load Packages #################################
 
+import argparse
+import random
+import signal
 import sqlite3
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from zoneinfo import ZoneInfo
 
-import requests
+from traffic_sources import HISTORY_ADAPTERS, fetch_all, fetch_history, load_sources, make_session
+from traffic_store import (
+    append_segment,
+    completed_windows,
+    connect_store,
+    insert_obs_rows,
+    insert_rows,
+    load_pending_segments,
+    mark_window_done,
+    new_run,
+    record_run,
+    retention_watermark,
+    write_run_file,
+)
 
 
 # 1. CONFIG ###################################
 
-# Brussels Traffic Vehicle Counts API documentation:
-# https://data.mobility.brussels/traffic/api/counts/
-BASE_URL = "https://data.mobility.brussels/traffic/api/counts/"
-BRUSSELS_METRO_ID = 948
 SCRIPT_DIR = Path(__file__).resolve().parent
 DATA_DIR = SCRIPT_DIR / "data"
 DB_PATH = DATA_DIR / "traffic.db"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-print("\n====================================================")
-print("01_ingest_traffic.py | Brussels realtime ingest")
-print("====================================================")
-print(f"   metro_id: {BRUSSELS_METRO_ID}")
-print(f"   api: {BASE_URL}")
-
-
-def get_with_retry(url: str, params: dict, max_attempts: int = 5, timeout: int = 30) -> requests.Response:
-    """Fetch API payload with retry/backoff for transient failures."""
-    for attempt in range(1, max_attempts + 1):
-        response = requests.get(url, params=params, timeout=timeout)
-        if response.status_code in {429, 500, 502, 503, 504} and attempt < max_attempts:
-            retry_after = response.headers.get("Retry-After")
-            sleep_seconds = int(retry_after) if retry_after and retry_after.isdigit() else min(2 ** attempt, 30)
-            print(
-                f"   warning transient status={response.status_code}; "
-                f"retrying in {sleep_seconds}s (attempt {attempt}/{max_attempts})"
-            )
-            time.sleep(sleep_seconds)
-            continue
-        response.raise_for_status()
-        return response
-    raise RuntimeError("Failed to fetch traffic payload after retries.")
-
-
-def parse_bxl_time_to_utc(end_time: str) -> str | None:
-    """Convert Brussels-local timestamp to UTC string format used in SQLite."""
-    if not end_time:
-        return None
-    for fmt in ("%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M"):
-        try:
-            local_dt = datetime.strptime(end_time, fmt).replace(tzinfo=ZoneInfo("Europe/Brussels"))
-            utc_dt = local_dt.astimezone(ZoneInfo("UTC"))
-            return utc_dt.strftime("%Y-%m-%d %H:%M:%S")
-        except (TypeError, ValueError):
-            continue
-    return None
-
-
-# 2. FETCH DATA ###################################
-
-# Ask the API for the "live" request payload at one-minute interval granularity.
-response = get_with_retry(
-    BASE_URL,
-    params={"request": "live", "includeLanes": "false", "interval": "1"},
-    timeout=30,
-)
-payload = response.json()
-data = payload.get("data", {})
+# Daemon defaults: the Brussels API publishes a new 1m/t1 value every minute.
+DEFAULT_INTERVAL_SECONDS = 60
+DEFAULT_JITTER_SECONDS = 5
 
-# Hard-fail fast if API returns an empty payload so the cron run is visibly red.
-if not data:
-    raise SystemExit("Brussels traffic API returned empty data payload.")
 
-monitors = list(data.keys())
-print(f"   monitors in payload: {len(monitors)}")
+# 2. FETCH + CLEAN DATA ###################################
 
+def fetch_rows(sources: list[dict], run: dict, session=None, with_obs: bool = False) -> tuple[list[tuple], list[dict]]:
+    """Fetch all sources concurrently; return (rows, per-source results) and fill in the run's fetch stats."""
+    results = fetch_all(sources, session=session, with_obs=with_obs)
+    rows = [row for result in results for row in result["rows"]]
+    run["sources"] = len(results)
+    run["sources_failed"] = sum(1 for result in results if result["error"] or not result["rows"])
+    # Sources are fetched concurrently, so the slowest one sets the fetch latency.
+    run["fetch_seconds"] = max((result["fetch_seconds"] for result in results), default=0.0)
+    run["parse_seconds"] = sum(result["parse_seconds"] for result in results)
+    run["candidate_rows"] = len(rows)
+    return rows, results
 
-# 3. CLEAN DATA ###################################
 
-# Convert nested monitor payloads into flat rows with expected schema and types.
-rows = []
-for monitor_id, monitor_payload in data.items():
-    one_min = (monitor_payload.get("results", {}) or {}).get("1m", {}) or {}
-    t1 = one_min.get("t1", {}) or {}
-    vehicles = t1.get("count")
-    speed = t1.get("speed")
-    occupancy = t1.get("occupancy")
-    observed_at_raw = t1.get("end_time", "")
-    observed_at = parse_bxl_time_to_utc(observed_at_raw)
+def report_results(results: list[dict]) -> None:
+    for result in results:
+        status = f"error: {result['error']}" if result["error"] else f"{len(result['rows'])} rows"
+        print(f"   {result['source_name']} (metro {result['metro_id']}): {status} in {result['seconds']:.2f}s")
 
-    # Skip malformed rows early to keep downstream SQL simple and robust.
-    if vehicles is None or observed_at is None or not monitor_id:
-        continue
 
-    try:
-        row = (
-            BRUSSELS_METRO_ID,
-            str(monitor_id),
-            observed_at,
-            int(vehicles),
-            max(float(speed), 0.0) if speed is not None else None,
-            float(occupancy) if occupancy is not None else None,
-        )
-        rows.append(row)
-    except (TypeError, ValueError):
-        continue
+# 3. WRITE TO SQLITE ###################################
+
+def segments_dir_for(db_path: Path) -> Path:
+    """Segments sit next to the database they belong to: data/segments/ for data/traffic.db."""
+    return Path(db_path).parent / "segments"
 
-if not rows:
-    raise SystemExit("No valid 1m/t1 monitor rows parsed from Brussels API payload.")
 
-print(f"   parsed rows: {len(rows)}")
-print(f"   sample row: {rows[0]}")
+def open_store(segments: bool, db_path: Path = DB_PATH) -> sqlite3.Connection:
+    """Open traffic.db; in segments mode also load pending segments so they count as stored."""
+    conn = connect_store(db_path)
+    if segments:
+        load_pending_segments(conn, segments_dir_for(db_path))
+    return conn
 
 
-# 4. WRITE TO SQLITE ###################################
+def finish_run(run: dict, inserted: int, write_started: float) -> None:
+    run["write_seconds"] = time.perf_counter() - write_started
+    run["inserted_rows"] = inserted
+    run["duplicate_rows"] = run["candidate_rows"] - inserted
+    run["finished_at"] = time.time()
 
-# Keep database logic intentionally minimal and easy to read for students.
-conn = sqlite3.connect(str(DB_PATH))
-conn.execute(
+
+def write_rows(
+    conn: sqlite3.Connection,
+    rows: list[tuple],
+    run: dict,
+    segments: bool = False,
+    obs_rows: list[tuple] | None = None,
+    db_path: Path = DB_PATH,
+) -> int:
+    """Store rows from every source in one go, ignoring duplicates; return rows added.
+
+    By default rows go into traffic.db in one transaction; the hourly rollup
+    trigger and the ingest_runs ledger row are written inside that same
+    transaction. In segments mode the new rows go to one immutable file under
+    segments/ next to db_path (plus a small run record) and traffic.db is left untouched
+    (see traffic_store.py). The inserted count comes from the cursor, so no
+    COUNT(*) scan is needed. `obs_rows` (--all-intervals) go into traffic_obs
+    in the same transaction.
     """
-    CREATE TABLE IF NOT EXISTS traffic (
-      metro_id    INTEGER,
-      monitor_id  TEXT,
-      observed_at TEXT,
-      vehicles    INTEGER,
-      speed       REAL,
-      occupancy   REAL,
-      PRIMARY KEY (metro_id, monitor_id, observed_at)
+    write_started = time.perf_counter()
+    if segments:
+        segments_dir = segments_dir_for(db_path)
+        path, inserted = append_segment(conn, rows, segments_dir, token=run["run_id"])
+        finish_run(run, inserted, write_started)
+        write_run_file(run, segments_dir)
+        if path is not None:
+            print(f"   segment written: {path}")
+        return inserted
+    with conn:
+        inserted = insert_rows(conn, rows)
+        if obs_rows:
+            obs_inserted = insert_obs_rows(conn, obs_rows)
+            print(f"   traffic_obs rows: {len(obs_rows)} candidate, {obs_inserted} new")
+        finish_run(run, inserted, write_started)
+        record_run(conn, run)
+    return inserted
+
+
+# 4. RUN MODES ###################################
+
+def run_once(
+    sources: list[dict],
+    segments: bool = False,
+    all_intervals: bool = False,
+    db_path: Path = DB_PATH,
+) -> None:
+    """One-shot cron mode: fetch, parse, write, verify, exit."""
+    run = new_run("segments" if segments else "sqlite")
+    session = make_session()
+    rows, results = fetch_rows(sources, run, session=session, with_obs=all_intervals)
+    obs_rows = [row for result in results for row in result["obs_rows"]]
+    session.close()
+    report_results(results)
+
+    if rows:
+        print(f"   parsed rows: {len(rows)}")
+        print(f"   sample row: {rows[0]}")
+
+    # Record the run even when every source failed, so failures show up in the ledger.
+    conn = open_store(segments, db_path)
+    write_rows(conn, rows, run, segments=segments, obs_rows=obs_rows, db_path=db_path)
+    conn.close()
+
+    print(f"   run id: {run['run_id']}")
+    print(f"   candidate rows this run: {run['candidate_rows']}")
+    print(f"   new rows appended: {run['inserted_rows']}")
+    print(f"   duplicate rows skipped: {run['duplicate_rows']}")
+    print(
+        f"   seconds: fetch {run['fetch_seconds']:.2f}, parse {run['parse_seconds']:.3f}, "
+        f"write {run['write_seconds']:.3f}, total {run['finished_at'] - run['started_at']:.2f}"
     )
-"""
-)
-conn.execute(
+
+    # Hard-fail after writing what we could, so a broken source keeps the cron run visibly red.
+    failed = [result["source_name"] for result in results if result["error"] or not result["rows"]]
+    if failed:
+        raise SystemExit(f"No valid rows from: {', '.join(failed)}")
+
+
+def run_daemon(
+    sources: list[dict],
+    interval: float,
+    jitter: float,
+    segments: bool = False,
+    all_intervals: bool = False,
+    db_path: Path = DB_PATH,
+) -> None:
+    """Long-running poller: one session, one connection, jittered schedule.
+
+    Rows are only written when a monitor's end_time has advanced past the last
+    value seen for that monitor, so idle polls cost one HTTP call per source and no writes.
     """
-    CREATE UNIQUE INDEX IF NOT EXISTS idx_traffic_metro_monitor_observed
-    ON traffic (metro_id, monitor_id, observed_at)
-"""
-)
+    stop = {"requested": False}
 
-# Capture count before insert so we can report new rows appended this run.
-before_count = conn.execute(
-    "SELECT COUNT(*) FROM traffic WHERE metro_id = ?",
-    (BRUSSELS_METRO_ID,),
-).fetchone()[0]
+    def request_stop(signum, frame):
+        stop["requested"] = True
+        print(f"   received signal {signum}; stopping after this poll")
 
-# Insert rows and ignore duplicates so repeated cron runs stay idempotent.
-conn.executemany(
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    session = make_session()
+    conn = open_store(segments, db_path)
+    last_seen: dict[tuple[int, str], int] = {}
+    next_tick = time.monotonic()
+    print(f"   daemon interval: {interval}s (jitter up to {jitter}s)")
+
+    try:
+        while not stop["requested"]:
+            try:
+                run = new_run("daemon")
+                rows, results = fetch_rows(sources, run, session=session, with_obs=all_intervals)
+                for result in results:
+                    if result["error"]:
+                        print(f"   warning {result['source_name']} failed: {result['error']}")
+                fresh = [row for row in rows if row[2] > last_seen.get((row[0], row[1]), 0)]
+                if fresh:
+                    # Idle polls (nothing advanced) write nothing, not even a ledger row.
+                    obs_rows = [row for result in results for row in result["obs_rows"]]
+                    write_rows(conn, fresh, run, segments=segments, obs_rows=obs_rows, db_path=db_path)
+                    for row in fresh:
+                        last_seen[(row[0], row[1])] = row[2]
+                    newest = datetime.fromtimestamp(max(row[2] for row in fresh), tz=timezone.utc)
+                    print(f"   poll ok: {len(fresh)}/{len(rows)} rows advanced (latest {newest:%Y-%m-%d %H:%M} UTC)")
+                else:
+                    print(f"   poll ok: end_time unchanged for {len(rows)} rows; skipping write")
+            except (sqlite3.Error, OSError) as exc:
+                # A daemon should ride out transient failures instead of exiting; with
+                # --segments a full disk or bad permissions surface as OSError.
+                print(f"   warning write failed: {exc}")
+
+            # Schedule from the previous tick so the cadence does not drift, and
+            # add jitter so many pollers do not hit the API in lockstep.
+            next_tick += interval
+            now = time.monotonic()
+            if next_tick < now:
+                next_tick = now
+            sleep_until = next_tick + random.uniform(0, jitter)
+            while not stop["requested"] and time.monotonic() < sleep_until:
+                time.sleep(min(1.0, sleep_until - time.monotonic()))
+    finally:
+        conn.close()
+        session.close()
+        print("   daemon stopped")
+
+
+# 5. BACKFILL ###################################
+
+def backfill_windows(start: date, end: date, window_days: int) -> list[tuple[date, date]]:
+    """Split an inclusive date range into consecutive inclusive windows of `window_days`."""
+    windows = []
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + timedelta(days=window_days - 1), end)
+        windows.append((window_start, window_end))
+        window_start = window_end + timedelta(days=1)
+    return windows
+
+
+def known_monitors(conn: sqlite3.Connection, source: dict, session) -> list[str]:
+    """Monitors already stored for this metro, or the ones in the live payload for a fresh database."""
+    monitors = [
+        row[0]
+        for row in conn.execute(
+            "SELECT monitor_id FROM monitors WHERE metro_id = ? ORDER BY monitor_id",
+            (source["metro_id"],),
+        )
+    ]
+    if monitors:
+        return monitors
+    result = fetch_all([source], session=session)[0]
+    if result["error"]:
+        raise SystemExit(f"Could not list monitors for {source['source_name']}: {result['error']}")
+    return sorted({row[1] for row in result["rows"]})
+
+
+def run_backfill(
+    source: dict,
+    start: date,
+    end: date,
+    window_days: int,
+    workers: int,
+    db_path: Path = DB_PATH,
+) -> None:
+    """Fetch a historical date range window by window on a bounded worker pool.
+
+    Each completed window is inserted (ON CONFLICT DO NOTHING) and checkpointed
+    in backfill_windows in one transaction, so rerunning the same command
+    skips finished windows and retries only failed or missing ones.
+
+    Days before the raw retention watermark are skipped: traffic.db drops
+    those rows on insert (they may already be in the rollups), so fetching
+    them would only checkpoint windows that stored nothing.
     """
-    INSERT INTO traffic (metro_id, monitor_id, observed_at, vehicles, speed, occupancy)
-    VALUES (?, ?, ?, ?, ?, ?)
-    ON CONFLICT(metro_id, monitor_id, observed_at) DO NOTHING
-""",
-    rows,
-)
-conn.commit()
+    if source["source_name"] not in HISTORY_ADAPTERS:
+        raise SystemExit(f"{source['source_name']} has no historical adapter in traffic_sources.py.")
+
+    run = new_run("backfill")
+    run["sources"] = 1
+    session = make_session(pool_size=workers)
+    conn = connect_store(db_path)
+    watermark = retention_watermark(conn, "raw")
+    first_kept = datetime.fromtimestamp(max(watermark, 0) + 86400 - 1, tz=timezone.utc).date()  # first whole day kept raw
+    if end < first_kept:
+        conn.close()
+        session.close()
+        raise SystemExit(f"{start} -> {end} is entirely before the raw retention watermark ({first_kept}); nothing can be stored.")
+    if start < first_kept:
+        print(f"   warning: raw rows before {first_kept} were retained away; backfilling from {first_kept} instead of {start}")
+        start = first_kept
+    monitors = known_monitors(conn, source, session)
+    done = completed_windows(conn, source["source_name"])
+    todo = [
+        (monitor_id, window_start, window_end)
+        for monitor_id in monitors
+        for window_start, window_end in backfill_windows(start, end, window_days)
+        if (monitor_id, window_start.isoformat(), window_end.isoformat()) not in done
+    ]
+    print(f"   backfill: {start} -> {end} in {window_days}-day windows, {len(monitors)} monitors")
+    print(f"   windows to fetch: {len(todo)} ({len(done)} already checkpointed)")
+
+    failed = 0
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = [
+            pool.submit(fetch_history, source, monitor_id, window_start, window_end, session)
+            for monitor_id, window_start, window_end in todo
+        ]
+        # Workers only fetch and parse; this thread is the single SQLite writer.
+        for completed, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            run["fetch_seconds"] += result["fetch_seconds"]
+            run["parse_seconds"] += result["parse_seconds"]
+            if result["error"]:
+                failed += 1
+                print(f"   warning {result['monitor_id']} {result['window'][0]}: {result['error']}")
+                continue
+            write_started = time.perf_counter()
+            with conn:
+                inserted = insert_rows(conn, result["rows"])
+                mark_window_done(
+                    conn, source["source_name"], result["monitor_id"], *result["window"],
+                    fetched_rows=len(result["rows"]), inserted_rows=inserted,
+                )
+            run["write_seconds"] += time.perf_counter() - write_started
+            run["candidate_rows"] += len(result["rows"])
+            run["inserted_rows"] += inserted
+            if completed % 50 == 0 or completed == len(futures):
+                print(f"   progress: {completed}/{len(futures)} windows, {run['inserted_rows']} rows inserted")
+        pool.shutdown()
+    except BaseException:
+        # Ctrl-C or a write error: drop the queued windows instead of fetching
+        # them all just to throw them away. Only the few in flight finish.
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        # Record whatever finished, including an interrupted run.
+        run["sources_failed"] = 1 if failed else 0
+        run["duplicate_rows"] = run["candidate_rows"] - run["inserted_rows"]
+        run["finished_at"] = time.time()
+        with conn:
+            record_run(conn, run)
+        conn.close()
+        session.close()
+
+    print(f"   candidate rows: {run['candidate_rows']}")
+    print(f"   new rows appended: {run['inserted_rows']}")
+    if failed:
+        raise SystemExit(f"{failed} windows failed; rerun the same command to retry them.")
+
+
+def parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {value!r}")
+
 
-# Count rows after insert and calculate net-new inserts for this run.
-total_rows = conn.execute(
-    "SELECT COUNT(*) FROM traffic WHERE metro_id = ?",
-    (BRUSSELS_METRO_ID,),
-).fetchone()[0]
-inserted_rows = max(int(total_rows) - int(before_count), 0)
-conn.close()
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest realtime traffic counts into SQLite.")
+    parser.add_argument(
+        "--source", action="append", dest="sources", metavar="SOURCE_NAME",
+        help="Only ingest this sources.csv source_name (repeatable). Default: every source with an adapter.",
+    )
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="Path to traffic.db (default: data/traffic.db).")
+    parser.add_argument(
+        "--segments", action="store_true",
+        help="Write new rows to an immutable file under segments/ next to --db instead of into it.",
+    )
+    parser.add_argument(
+        "--all-intervals", action="store_true",
+        help="Also store every interval, traverse and lane in traffic_obs (requests includeLanes=true).",
+    )
+    parser.add_argument("--daemon", action="store_true", help="Keep polling instead of exiting after one fetch.")
+    parser.add_argument(
+        "--interval", type=float, default=DEFAULT_INTERVAL_SECONDS,
+        help="Seconds between polls in daemon mode (default: 60).",
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=DEFAULT_JITTER_SECONDS,
+        help="Maximum random delay added to each poll in daemon mode (default: 5).",
+    )
+    commands = parser.add_subparsers(dest="command")
+    backfill = commands.add_parser("backfill", help="Fetch a historical date range (resumable).")
+    backfill.add_argument("--from", dest="start", type=parse_date, required=True, help="First Brussels-local date, YYYY-MM-DD.")
+    backfill.add_argument("--to", dest="end", type=parse_date, required=True, help="Last Brussels-local date (inclusive).")
+    backfill.add_argument("--window-days", type=int, default=1, help="Days per historical request (default: 1).")
+    backfill.add_argument("--workers", type=int, default=4, help="Concurrent historical requests (default: 4).")
+    args = parser.parse_args()
+
+    if args.all_intervals and args.segments:
+        raise SystemExit("--all-intervals writes to traffic.db and cannot be combined with --segments.")
 
+    try:
+        sources = load_sources(only=args.sources)
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    if not sources:
+        raise SystemExit("No configured sources have an adapter in traffic_sources.py.")
+
+    print("\n====================================================")
+    print("01_ingest_traffic.py | realtime traffic ingest")
+    print("====================================================")
+    for source in sources:
+        print(f"   metro_id: {source['metro_id']} ({source['metro_name']}) <- {source['source_name']}")
+        print(f"   api: {source['url']}")
+
+    if args.command == "backfill":
+        if args.end < args.start:
+            raise SystemExit("--to must not be before --from.")
+        history_sources = [source for source in sources if source["source_name"] in HISTORY_ADAPTERS]
+        if not history_sources:
+            raise SystemExit("None of the selected sources has a historical adapter in traffic_sources.py.")
+        for source in history_sources:
+            run_backfill(source, args.start, args.end, max(args.window_days, 1), args.workers, db_path=args.db)
+    elif args.daemon:
+        run_daemon(
+            sources, interval=max(args.interval, 1.0), jitter=max(args.jitter, 0.0),
+            segments=args.segments, all_intervals=args.all_intervals, db_path=args.db,
+        )
+    else:
+        run_once(sources, segments=args.segments, all_intervals=args.all_intervals, db_path=args.db)
 
-# 5. VERIFY ###################################
 
-print(f"   candidate rows this run: {len(rows)}")
-print(f"   new rows appended: {inserted_rows}")
-print(f"   total rows (metro): {int(total_rows)}")
+if __name__ == "__main__":
+    main()
@@ -2,137 +2,1023 @@
 # Train XGBoost Model (Brussels Realtime)
 # Pairs with 02_train_model.R
 # Tim Fraser
+#
+# The only features are day_of_week and hour_of_day, so there are at most
+# 7 x 24 = 168 distinct feature vectors. Three training modes:
+# - stats (default): collapse the data into one row per (day_of_week,
+#   hour_of_day) cell with weight = n and label = mean vehicles, read from the
+#   hourly rollups in traffic.db. Under squared error this gives xgboost the
+#   same gradients as the raw rows, and RMSE, R-squared and the per-cell
+#   standard errors follow exactly from each cell's n, sum and sum of squares.
+#   Time and memory stay constant however many months of minutes accumulate.
+# - raw: the original path, one DMatrix row per stored minute and a random
+#   80/20 row split.
+# - incremental: load only rows newer than the `data_watermark` saved in
+#   validationpy.json, and continue boosting the saved modelpy.json for a few
+#   rounds on their per-cell aggregates (xgboost `xgb_model` continuation), so
+#   a cron retrain costs O(new rows). Every --full-every runs (or when there is
+#   no saved watermark yet) it does a full stats rebuild instead, so the
+#   ensemble does not keep growing and drifting. It also rebuilds when the
+#   continued model scores a worse held-out RMSE than the saved one on the
+#   same cells, since new rounds can shift cells that got no new rows.
+#
+# `tune` searches PARAMS with rolling-origin cross-validation: the stored UTC
+# hours are split in time order, each fold trains on every hour before its
+# origin and validates on the block after it (no future hour leaks into a
+# fit), and every grid point runs on a process pool with early stopping. The
+# winner is written to tuningpy.json next to validationpy.json, and later
+# training runs use it in place of PARAMS / NUM_BOOST_ROUND.
+#
+# `fleet` trains one small booster per monitor_id from that monitor's cell
+# statistics, fanned out over a process pool in batches of monitors, and packs
+# every model into one bundle file (fleetpy.bin, see model_bundle.py) whose
+# index holds each monitor's offset and metrics. Each model is stored as the
+# flat node arrays of 03_fastapi/tree_eval.py, which the API maps straight
+# out of the file. Monitors with too few rows
+# are listed in the index without a model; the API (/predict?monitor_id=...)
+# answers them from the metro model.
+#
+# Every save also evaluates the model once on all 7 x 24 cells and writes
+# predictionspy.json: prediction and standard error tables indexed
+# [day_of_week - 1][hour_of_day], stamped with the SHA-256 of modelpy.json so a
+# consumer answering by array lookup (no xgboost) can tell when it is stale.
+# `table` rebuilds it from the saved model without training.
+#
+# validationpy.json also keeps the count and mean of every cell at training
+# time; `python traffic_store.py drift` compares it with the last 7 days of
+# data so the cron can skip a retrain when nothing moved.
+#
+# `multi` models speed and occupancy together: one SQL pass fills a shared
+# int8 feature matrix and a float32 matrix of both measures, each target is
+# collapsed to weighted per-cell statistics on that one matrix, and the
+# boosters train on parallel threads (xgboost releases the GIL). It writes
+# modelpy_<target>.json, validationpy_<target>.json and
+# predictionspy_<target>.json for each target. Vehicles is not a multi target:
+# modelpy.json comes from train / --mode incremental alone.
+# Known limit: the hourly rollups hold vehicles only, so multi reads raw
+# minutes. Once `traffic_store.py retain` has run, that is the last
+# RAW_RETENTION_DAYS (30) days, which bounds its cost but also its history.
+
+# Git bash: cd 12_end && python 02_train_model.py
+# Git bash: cd 12_end && python 02_train_model.py --mode raw
+# Git bash: cd 12_end && python 02_train_model.py --mode incremental --full-every 4
+# Git bash: cd 12_end && python 02_train_model.py tune --folds 4 --workers 4
+# Git bash: cd 12_end && python 02_train_model.py fleet --workers 4
+# Git bash: cd 12_end && python 02_train_model.py table
+# Git bash: cd 12_end && python 02_train_model.py multi
+# Powershell: Set-Location 12_end; python 02_train_model.py
 
 # 0. SETUP ###################################
 
 ## 0.1 Load Packages #################################
 
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
 import numpy as np
 import pandas as pd
-import sqlite3
 import xgboost as xgb
-import json
-from pathlib import Path
+
+from model_bundle import write_bundle
+from traffic_store import (
+    RAW_RETENTION_DAYS,
+    cell_snapshot,
+    connect_store,
+    count_feature_rows,
+    latest_observed_at,
+    load_pending_segments,
+    read_cell_stats,
+    read_features,
+    read_hour_stats,
+    read_monitor_cell_stats,
+    read_target_features,
+)
+
+# tree_eval (the API's NumPy evaluator) packs fleet models into the form the API loads.
+sys.path.append(str(Path(__file__).resolve().parent / "03_fastapi"))
+from tree_eval import export_model, pack_forest
 
 # 1. CONFIG ###################################
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 DATA_DIR = SCRIPT_DIR / "data"
 DB_PATH = SCRIPT_DIR / "data" / "traffic.db"
+SEGMENTS_DIR = DATA_DIR / "segments"
 MODEL_PATH = DATA_DIR / "modelpy.json"
 VALIDATION_PATH = DATA_DIR / "validationpy.json"
+TUNING_PATH = DATA_DIR / "tuningpy.json"
+FLEET_PATH = DATA_DIR / "fleetpy.bin"
+PREDICTIONS_PATH = DATA_DIR / "predictionspy.json"
 METRO_ID = 948
 
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+FEATURES = ["day_of_week", "hour_of_day"]
+TARGETS = ["vehicles", "speed", "occupancy"]  # columns of read_target_features, in order
+MULTI_TARGETS = TARGETS[1:]  # vehicles has its own train / incremental path
+PREDICTION_KEYS = {"vehicles": "predicted_vehicle_count", "speed": "predicted_speed", "occupancy": "predicted_occupancy"}
+PARAMS = {
+    "objective": "reg:squarederror",
+    "max_depth": 4,
+    "eta": 0.1,
+    "verbosity": 0,
+}
+NUM_BOOST_ROUND = 50
+SEED = 42  # raw mode's 80/20 row split
+
+# Tune: grid searched over PARAMS, rolling-origin folds, and boosting limits.
+TUNE_GRID = {
+    "max_depth": [2, 3, 4, 6],
+    "eta": [0.05, 0.1, 0.3],
+    "min_child_weight": [1, 100],
+}
+TUNE_FOLDS = 4
+TUNE_MIN_TRAIN_SHARE = 0.5  # the first half of the hours is never a validation block
+TUNE_MAX_ROUNDS = 500
+TUNE_EARLY_STOPPING = 20
+TUNE_MAX_BIN = 256
+
+# Fleet: monitors with fewer training rows get no model of their own, and
+# each pool task trains about this many monitors.
+FLEET_MIN_TRAIN_ROWS = 60
+FLEET_BATCH_MONITORS = 64
+FLEET_FORMAT = "tree-eval-v1"  # blobs are tree_eval.pack_forest arrays, meta in models[id]["forest"]
+
+# Stats and incremental modes hold out whole UTC hours, each cell one week in
+# HOLDOUT_FOLDS (see traffic_store.read_cell_stats).
+HOLDOUT_FOLDS = 5
+
+# Raw and incremental modes copy the SQLite cursor into typed arrays this many rows at a time.
+LOAD_CHUNK_ROWS = 65_536
+
+# Incremental mode: extra boosting rounds per run, and runs between full rebuilds.
+INCREMENTAL_ROUNDS = 10
+FULL_REBUILD_EVERY = 4
+
+
 # 2. LOAD DATA ###################################
 
-conn = sqlite3.connect(str(DB_PATH))
-df = pd.read_sql(
-    "SELECT observed_at, vehicles FROM traffic WHERE metro_id = ? ORDER BY observed_at",
+def open_store(db_path: Path = DB_PATH, segments_dir: Path = SEGMENTS_DIR):
+    """Open traffic.db plus any segment files the ingest cron wrote since the last compaction."""
+    conn = connect_store(db_path)
+    load_pending_segments(conn, segments_dir)
+    return conn
+
+
+def load_arrays(
     conn,
-    params=(METRO_ID,),
-)
-conn.close()
+    metro_id: int = METRO_ID,
+    since: int | None = None,
+    until: int | None = None,
+    holdout_folds: int = 0,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Stored minutes as typed arrays: X int8 (day_of_week, hour_of_day), y int32 vehicles, holdout bool.
 
-# 3. FEATURE ENGINEERING ###################################
+    The features are computed in SQL (traffic_store.read_features) and the
+    cursor is copied chunk by chunk into preallocated arrays, so no pandas
+    frame, datetime column or per-row Python object outlives a chunk.
+    """
+    n_rows = count_feature_rows(conn, metro_id, since, until)
+    X = np.empty((n_rows, len(FEATURES)), dtype=np.int8)
+    y = np.empty(n_rows, dtype=np.int32)
+    holdout = np.empty(n_rows, dtype=bool)
+    filled = 0
+    for start, block in cursor_blocks(read_features(conn, metro_id, since, until, holdout_folds), n_rows, np.int32):
+        filled = start + len(block)
+        X[start:filled] = block[:, :2]
+        y[start:filled] = block[:, 2]
+        holdout[start:filled] = block[:, 3]
+    return X[:filled], y[:filled], holdout[:filled]
 
-if df.empty:
-    raise SystemExit("No rows found for configured METRO_ID.")
 
-df["observed_at"] = pd.to_datetime(df["observed_at"], utc=True)
-df["day_of_week"] = df["observed_at"].dt.dayofweek + 1
-df["hour_of_day"] = df["observed_at"].dt.hour
+def cursor_blocks(cursor, n_rows: int, dtype):
+    """Yield (start row, 2-D array) per fetchmany chunk, stopping after n_rows rows. NULL becomes NaN in float blocks."""
+    filled = 0
+    while filled < n_rows:
+        chunk = cursor.fetchmany(LOAD_CHUNK_ROWS)
+        if not chunk:
+            return
+        block = np.array(chunk[: n_rows - filled], dtype=dtype)
+        yield filled, block
+        filled += len(block)
 
-features = ["day_of_week", "hour_of_day"]
 
-# 4. TRAIN/TEST SPLIT ###################################
+def load_target_arrays(
+    conn,
+    metro_id: int = METRO_ID,
+    until: int | None = None,
+    holdout_folds: int = HOLDOUT_FOLDS,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """One pass for every multi target: X int8 features, Y float32 (rows x MULTI_TARGETS, NaN where NULL), holdout bool."""
+    n_rows = count_feature_rows(conn, metro_id, None, until)
+    X = np.empty((n_rows, len(FEATURES)), dtype=np.int8)
+    Y = np.empty((n_rows, len(MULTI_TARGETS)), dtype=np.float32)
+    holdout = np.empty(n_rows, dtype=bool)
+    filled = 0
+    cursor = read_target_features(conn, metro_id, None, until, holdout_folds)
+    for start, block in cursor_blocks(cursor, n_rows, np.float64):
+        filled = start + len(block)
+        X[start:filled] = block[:, :2]
+        holdout[start:filled] = block[:, 2]
+        Y[start:filled] = block[:, 4:]  # speed, occupancy; column 3 is vehicles
+    return X[:filled], Y[:filled], holdout[:filled]
 
-df = df.reset_index(drop=True)
-df["row_id"] = np.arange(1, len(df) + 1)
 
-train_df = df.sample(frac=0.8)
-test_df = df[~df["row_id"].isin(train_df["row_id"])].copy()
+def cell_index(X: np.ndarray) -> np.ndarray:
+    """0..167 cell number per row, (day_of_week - 1) * 24 + hour_of_day."""
+    return (X[:, 0].astype(np.int16) - 1) * 24 + X[:, 1]
 
-train_df = train_df.drop(columns=["row_id"])
-test_df = test_df.drop(columns=["row_id"])
 
-if train_df.empty or test_df.empty:
-    raise SystemExit("Need at least 2 rows so both train and test sets are non-empty.")
+def load_cell_stats(conn, metro_id: int = METRO_ID, holdout_folds: int = HOLDOUT_FOLDS) -> pd.DataFrame:
+    """One row per (holdout, day_of_week, hour_of_day): n, vehicles_sum, vehicles_sumsq."""
+    cells = pd.DataFrame(
+        read_cell_stats(conn, metro_id, holdout_folds).fetchall(),
+        columns=["holdout", "day_of_week", "hour_of_day", "n", "vehicles_sum", "vehicles_sumsq"],
+    )
+    if cells.empty:
+        raise SystemExit("No rows found for configured METRO_ID.")
+    return cells
 
-X_train = train_df[features].to_numpy()
-y_train = train_df["vehicles"].to_numpy()
-X_test = test_df[features].to_numpy()
-y_test = test_df["vehicles"].to_numpy()
 
-# 5. TRAIN MODEL ###################################
+# 3. METRICS ###################################
 
-dtrain = xgb.DMatrix(X_train, label=y_train, feature_names=features)
+def rmse_r_squared(y: np.ndarray, pred: np.ndarray) -> tuple[float, float]:
+    rmse = float(np.sqrt(np.mean((pred - y) ** 2)))
+    r_squared = float(1 - np.sum((y - pred) ** 2) / np.sum((y - np.mean(y)) ** 2))
+    return rmse, r_squared
 
-params = {
-    "objective": "reg:squarederror",
-    "max_depth": 4,
-    "eta": 0.1,
-    "verbosity": 0,
-}
 
-model = xgb.train(params, dtrain, num_boost_round=50)
+def cell_rmse_r_squared(cells: pd.DataFrame, pred: np.ndarray) -> tuple[float, float]:
+    """RMSE and R-squared of a per-cell prediction over every raw row behind the cells.
 
-# 6. EVALUATE ###################################
+    Each cell's squared error splits into its within-cell sum of squares plus
+    n * (mean - prediction)^2, so no raw row is needed.
+    """
+    n = cells["n"].to_numpy(dtype=float)
+    total = cells["vehicles_sum"].to_numpy(dtype=float)
+    sumsq = cells["vehicles_sumsq"].to_numpy(dtype=float)
+    within = sumsq - total ** 2 / n
+    sse = within.sum() + np.sum(n * (total / n - pred) ** 2)
+    n_rows = n.sum()
+    sst = sumsq.sum() - total.sum() ** 2 / n_rows
+    return float(np.sqrt(sse / n_rows)), float(1 - sse / sst)
 
-pred_train = model.predict(dtrain)
-train_rmse = np.sqrt(np.mean((pred_train - y_train) ** 2))
-train_r_squared = 1 - np.sum((y_train - pred_train) ** 2) / np.sum((y_train - np.mean(y_train)) ** 2)
 
-dtest = xgb.DMatrix(X_test, label=y_test, feature_names=features)
-pred_test = model.predict(dtest)
-test_rmse = np.sqrt(np.mean((pred_test - y_test) ** 2))
-test_r_squared = 1 - np.sum((y_test - pred_test) ** 2) / np.sum((y_test - np.mean(y_test)) ** 2)
+def uncertainty_rows(uncertainty_df: pd.DataFrame) -> list[dict]:
+    return [
+        {
+            "day_of_week": int(row.day_of_week),
+            "hour_of_day": int(row.hour_of_day),
+            "standard_error": float(row.standard_error),
+            "n": int(row.n),
+        }
+        for row in uncertainty_df.itertuples(index=False)
+    ]
 
-test_eval = test_df[["day_of_week", "hour_of_day"]].copy()
-test_eval["residual"] = y_test - pred_test
-uncertainty_df = (
-    test_eval.groupby(["day_of_week", "hour_of_day"], as_index=False)
-    .agg(standard_error=("residual", "std"), n=("residual", "size"))
-)
-uncertainty_df["standard_error"] = uncertainty_df["standard_error"].fillna(float(test_rmse))
-uncertainty_rows = [
-    {
-        "day_of_week": int(row.day_of_week),
-        "hour_of_day": int(row.hour_of_day),
-        "standard_error": float(row.standard_error),
-        "n": int(row.n),
+
+# 4. TRAIN MODES ###################################
+
+def training_params() -> tuple[dict, int]:
+    """PARAMS and NUM_BOOST_ROUND, or the winner saved by `tune` when tuningpy.json exists."""
+    if TUNING_PATH.exists():
+        tuning = json.loads(TUNING_PATH.read_text(encoding="utf-8"))
+        return {**PARAMS, **tuning["best_params"]}, int(tuning["best_num_boost_round"])
+    return dict(PARAMS), NUM_BOOST_ROUND
+
+
+def no_mark(stage: str) -> None:
+    """Default stage callback; bench_train.py passes one that times each stage."""
+
+
+def train_raw(conn, mark: Callable[[str], None] = no_mark) -> tuple[xgb.Booster, dict]:
+    """Original path: one DMatrix row per stored minute, random 80/20 row split."""
+    watermark = latest_observed_at(conn, METRO_ID)
+    X, y, _ = load_arrays(conn, until=watermark)
+    if len(y) == 0:
+        raise SystemExit("No rows found for configured METRO_ID.")
+    mark("load")
+
+    order = np.random.default_rng(SEED).permutation(len(y))
+    n_train = int(round(0.8 * len(y)))
+    train_idx, test_idx = order[:n_train], order[n_train:]
+    if len(train_idx) == 0 or len(test_idx) == 0:
+        raise SystemExit("Need at least 2 rows so both train and test sets are non-empty.")
+
+    X_train, y_train = X[train_idx], y[train_idx]
+    X_test, y_test = X[test_idx], y[test_idx]
+    mark("features")
+
+    params, num_boost_round = training_params()
+    dtrain = xgb.DMatrix(X_train, label=y_train, feature_names=FEATURES)
+    dtest = xgb.DMatrix(X_test, label=y_test, feature_names=FEATURES)
+    mark("dmatrix")
+    model = xgb.train(params, dtrain, num_boost_round=num_boost_round)
+    mark("train")
+
+    train_rmse, train_r_squared = rmse_r_squared(y_train, model.predict(dtrain))
+    pred_test = model.predict(dtest)
+    test_rmse, test_r_squared = rmse_r_squared(y_test, pred_test)
+
+    # Residual SD per cell from bincount sums, no groupby.
+    residual = y_test - pred_test.astype(np.float64)
+    cells = cell_index(X_test)
+    n = np.bincount(cells, minlength=168).astype(np.float64)
+    total = np.bincount(cells, weights=residual, minlength=168)
+    sumsq = np.bincount(cells, weights=residual ** 2, minlength=168)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        standard_error = np.where(n > 1, np.sqrt(np.maximum(sumsq - total ** 2 / n, 0.0) / (n - 1)), test_rmse)
+    seen = np.flatnonzero(n)
+    uncertainty_df = pd.DataFrame(
+        {"day_of_week": seen // 24 + 1, "hour_of_day": seen % 24, "standard_error": standard_error[seen], "n": n[seen]}
+    )
+    mark("evaluate")
+
+    return model, {
+        "training_mode": "raw",
+        "params": params,
+        "data_watermark": watermark,
+        "incremental_runs_since_full": 0,
+        "full_rebuild_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "train_rows": len(train_idx),
+        "test_rows": len(test_idx),
+        "test_rmse": test_rmse,
+        "test_r_squared": test_r_squared,
+        "train_rmse": train_rmse,
+        "train_r_squared": train_r_squared,
+        "residual_standard_error_default": test_rmse,
+        "standard_error_method": "Residual SD on held-out test split by day_of_week/hour_of_day; fallback to test RMSE.",
+        "standard_error_by_hour_day": uncertainty_rows(uncertainty_df),
     }
-    for row in uncertainty_df.itertuples(index=False)
-]
-
-print(f"Training RMSE: {train_rmse:.2f}")
-print(f"Training R-squared: {train_r_squared:.3f}")
-print(f"Testing RMSE: {test_rmse:.2f}")
-print(f"Testing R-squared: {test_r_squared:.3f}")
-
-# 7. SAVE MODEL ###################################
-
-model.save_model(str(MODEL_PATH))
-
-validation = {
-    "metro_id": int(METRO_ID),
-    "test_rmse": float(test_rmse),
-    "test_r_squared": float(test_r_squared),
-    "train_rmse": float(train_rmse),
-    "train_r_squared": float(train_r_squared),
-    "residual_standard_error_default": float(test_rmse),
-    "standard_error_method": "Residual SD on held-out test split by day_of_week/hour_of_day; fallback to test RMSE.",
-    "standard_error_by_hour_day": uncertainty_rows,
-}
-VALIDATION_PATH.write_text(json.dumps(validation, indent=2), encoding="utf-8")
-
-print("\n====================================================")
-print("02_train_model.py | Brussels realtime model")
-print("====================================================")
-print(f"   metro_id: {METRO_ID}")
-print(f"   train rows (80%): {len(train_df)}")
-print(f"   test rows (20%): {len(test_df)}")
-print("   features: day_of_week, hour_of_day")
-print(f"   model saved to {MODEL_PATH}")
-print(f"   validation saved to {VALIDATION_PATH}")
+
+
+def train_stats(conn, mark: Callable[[str], None] = no_mark) -> tuple[xgb.Booster, dict]:
+    """Sufficient-statistics path: one weighted row per (day_of_week, hour_of_day) cell."""
+    cells = load_cell_stats(conn)
+    mark("load")
+    train_cells, test_cells = split_cells(cells)
+
+    # Squared error on the cell mean with weight n has the same gradient and
+    # hessian per cell as the n raw rows behind it.
+    features = train_cells[FEATURES].to_numpy()
+    label = (train_cells["vehicles_sum"] / train_cells["n"]).to_numpy()
+    weight = train_cells["n"].to_numpy()
+    mark("features")
+    params, num_boost_round = training_params()
+    dtrain = xgb.DMatrix(features, label=label, weight=weight, feature_names=FEATURES)
+    mark("dmatrix")
+    model = xgb.train(params, dtrain, num_boost_round=num_boost_round)
+    mark("train")
+
+    metrics = evaluate_cells(model, train_cells, test_cells)
+    mark("evaluate")
+    return model, {
+        "training_mode": "stats",
+        "params": params,
+        **metrics,
+        "data_watermark": latest_observed_at(conn, METRO_ID),
+        "incremental_runs_since_full": 0,
+        "full_rebuild_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def evaluate_cells(model: xgb.Booster, train_cells: pd.DataFrame, test_cells: pd.DataFrame) -> dict:
+    """Train/test metrics and per-cell standard errors, all from sufficient statistics."""
+    dtrain = xgb.DMatrix(train_cells[FEATURES].to_numpy(), feature_names=FEATURES)
+    train_rmse, train_r_squared = cell_rmse_r_squared(train_cells, model.predict(dtrain))
+    dtest = xgb.DMatrix(test_cells[FEATURES].to_numpy(), feature_names=FEATURES)
+    test_rmse, test_r_squared = cell_rmse_r_squared(test_cells, model.predict(dtest))
+
+    # Every row in a cell shares one prediction, so the residual SD within a
+    # cell is the sample SD of vehicles there. Pooling the train and held-out
+    # statistics of each cell gives every cell with 2+ rows its own SE, not
+    # only the held-out ones.
+    pooled = (
+        pd.concat([train_cells, test_cells])
+        .groupby(FEATURES, as_index=False)[["n", "vehicles_sum", "vehicles_sumsq"]]
+        .sum()
+    )
+    n = pooled["n"].to_numpy(dtype=float)
+    total = pooled["vehicles_sum"].to_numpy(dtype=float)
+    within = np.maximum(pooled["vehicles_sumsq"].to_numpy(dtype=float) - total ** 2 / n, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        standard_error = np.where(n > 1, np.sqrt(within / (n - 1)), test_rmse)
+    uncertainty_df = pooled[["day_of_week", "hour_of_day", "n"]].assign(standard_error=standard_error)
+
+    return {
+        "train_rows": int(train_cells["n"].sum()),
+        "test_rows": int(test_cells["n"].sum()),
+        "train_cells": len(train_cells),
+        "test_cells": len(test_cells),
+        "test_rmse": test_rmse,
+        "test_r_squared": test_r_squared,
+        "train_rmse": train_rmse,
+        "train_r_squared": train_r_squared,
+        "residual_standard_error_default": test_rmse,
+        "standard_error_method": (
+            "Residual SD by day_of_week/hour_of_day from hourly sufficient statistics "
+            "(n, sum, sum of squares) of all rows in the cell; fallback to test RMSE."
+        ),
+        "standard_error_by_hour_day": uncertainty_rows(uncertainty_df),
+    }
+
+
+def split_cells(cells: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    train_cells = cells[cells["holdout"] == 0].reset_index(drop=True)
+    test_cells = cells[cells["holdout"] == 1].reset_index(drop=True)
+    if train_cells.empty or test_cells.empty:
+        raise SystemExit("Need rows in at least 2 different hours so both train and test sets are non-empty.")
+    return train_cells, test_cells
+
+
+def train_incremental(conn, previous: dict) -> tuple[xgb.Booster, dict] | None:
+    """Continue boosting the saved model on rows newer than its data watermark; None if there are none."""
+    watermark = int(previous["data_watermark"])
+    latest = latest_observed_at(conn, METRO_ID)
+    if latest is None or latest <= watermark:
+        return None
+    X, y, holdout = load_arrays(conn, since=watermark, until=latest, holdout_folds=HOLDOUT_FOLDS)
+    if len(y) == 0:
+        return None
+
+    # Skip held-out hours so the test cells stay unseen by every run.
+    fit = ~holdout
+    cells = cell_index(X[fit])
+    n = np.bincount(cells, minlength=168)
+    total = np.bincount(cells, weights=y[fit], minlength=168)
+    seen = np.flatnonzero(n)
+    params, _ = training_params()
+    if len(seen) == 0:
+        model = xgb.Booster(model_file=str(MODEL_PATH))
+    else:
+        dnew = xgb.DMatrix(
+            np.column_stack([seen // 24 + 1, seen % 24]),
+            label=total[seen] / n[seen],
+            weight=n[seen],
+            feature_names=FEATURES,
+        )
+        model = xgb.train(params, dnew, num_boost_round=INCREMENTAL_ROUNDS, xgb_model=str(MODEL_PATH))
+
+    # Evaluation reads the constant-size cell statistics of the whole history.
+    # The saved model is scored on the same held-out cells, so main() can
+    # tell whether the extra rounds helped.
+    train_cells, test_cells = split_cells(load_cell_stats(conn))
+    metrics = evaluate_cells(model, train_cells, test_cells)
+    saved = xgb.Booster(model_file=str(MODEL_PATH))
+    previous_test_rmse, _ = cell_rmse_r_squared(test_cells, saved.inplace_predict(test_cells[FEATURES].to_numpy()))
+    return model, {
+        "training_mode": "incremental",
+        "params": params,
+        **metrics,
+        "previous_test_rmse": previous_test_rmse,
+        "new_rows": len(y),
+        "new_rows_fitted": int(fit.sum()),
+        "data_watermark": latest,
+        "incremental_runs_since_full": int(previous.get("incremental_runs_since_full", 0)) + 1,
+        "full_rebuild_at": previous.get("full_rebuild_at"),
+    }
+
+
+def load_previous() -> dict | None:
+    """The saved validation, if a model trained with a data watermark exists."""
+    if not (MODEL_PATH.exists() and VALIDATION_PATH.exists()):
+        return None
+    validation = json.loads(VALIDATION_PATH.read_text(encoding="utf-8"))
+    return validation if validation.get("data_watermark") is not None else None
+
+
+TRAIN_MODES = {"stats": train_stats, "raw": train_raw, "incremental": train_incremental}
+
+
+# 5. TUNE ###################################
+
+def load_hour_stats(conn, metro_id: int = METRO_ID) -> np.ndarray:
+    """(obs_date, hour_of_day, n, vehicles_sum, vehicles_sumsq) per stored UTC hour, oldest first."""
+    hours = np.array(read_hour_stats(conn, metro_id).fetchall(), dtype=np.float64).reshape(-1, 5)
+    if len(hours) == 0:
+        raise SystemExit("No rows found for configured METRO_ID.")
+    return hours
+
+
+def hours_to_cells(hours: np.ndarray) -> pd.DataFrame:
+    """Collapse UTC hours into (day_of_week, hour_of_day) cells with n, vehicles_sum, vehicles_sumsq."""
+    frame = pd.DataFrame(hours, columns=["obs_date", "hour_of_day", "n", "vehicles_sum", "vehicles_sumsq"])
+    frame["day_of_week"] = (frame["obs_date"].astype(np.int64) + 3) % 7 + 1
+    frame["hour_of_day"] = frame["hour_of_day"].astype(np.int64)
+    return frame.groupby(FEATURES, as_index=False)[["n", "vehicles_sum", "vehicles_sumsq"]].sum()
+
+
+def hour_epoch(hour_row: np.ndarray) -> int:
+    return int(hour_row[0]) * 86400 + int(hour_row[1]) * 3600
+
+
+def rolling_origin_folds(
+    hours: np.ndarray, n_folds: int = TUNE_FOLDS, min_train_share: float = TUNE_MIN_TRAIN_SHARE
+) -> list[dict]:
+    """Time-ordered folds: fold k trains on every hour before its origin and validates on the next block.
+
+    The hours after the first `min_train_share` are cut into `n_folds`
+    consecutive validation blocks, so the training window grows fold by fold
+    and never contains an hour later than the one it is scored on.
+    """
+    first = max(int(len(hours) * min_train_share), 1)
+    bounds = np.linspace(first, len(hours), n_folds + 1).round().astype(int)
+    folds = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if stop <= start:
+            continue
+        train, valid = hours_to_cells(hours[:start]), hours_to_cells(hours[start:stop])
+        folds.append(
+            {
+                "fold": len(folds) + 1,
+                "train_hours": int(start),
+                "valid_hours": int(stop - start),
+                "train_rows": int(train["n"].sum()),
+                "valid_rows": int(valid["n"].sum()),
+                "origin_utc": datetime.fromtimestamp(hour_epoch(hours[start]), tz=timezone.utc).isoformat(),
+                "valid_end_utc": datetime.fromtimestamp(hour_epoch(hours[stop - 1]) + 3600, tz=timezone.utc).isoformat(),
+                "train": train,
+                "valid": valid,
+            }
+        )
+    if not folds:
+        raise SystemExit("Need at least 2 stored hours for time-ordered cross-validation.")
+    return folds
+
+
+# Per worker process: the folds, and their quantized matrices once built.
+_tune_folds: list[dict] = []
+_tune_matrices: dict[int, tuple] = {}
+
+
+def init_tune_worker(folds: list[dict]) -> None:
+    global _tune_folds
+    _tune_folds = folds
+    _tune_matrices.clear()
+
+
+def fold_matrices(index: int) -> tuple[xgb.QuantileDMatrix, xgb.QuantileDMatrix]:
+    """Quantized train/valid matrices for one fold, built once per worker and shared by every grid point.
+
+    day_of_week and hour_of_day have 7 and 24 values, far fewer than
+    TUNE_MAX_BIN, so quantizing them loses nothing. The validation matrix
+    reuses the training cut points (ref=).
+    """
+    if index not in _tune_matrices:
+        fold = _tune_folds[index]
+        train, valid = fold["train"], fold["valid"]
+        dtrain = xgb.QuantileDMatrix(
+            train[FEATURES].to_numpy(),
+            label=(train["vehicles_sum"] / train["n"]).to_numpy(),
+            weight=train["n"].to_numpy(),
+            feature_names=FEATURES,
+            max_bin=TUNE_MAX_BIN,
+        )
+        dvalid = xgb.QuantileDMatrix(
+            valid[FEATURES].to_numpy(),
+            label=(valid["vehicles_sum"] / valid["n"]).to_numpy(),
+            weight=valid["n"].to_numpy(),
+            feature_names=FEATURES,
+            ref=dtrain,
+        )
+        _tune_matrices[index] = (dtrain, dvalid)
+    return _tune_matrices[index]
+
+
+def run_grid_point(grid_params: dict) -> dict:
+    """Score one parameter set on every fold, early stopping on the validation block.
+
+    The eval metric is the n-weighted RMSE of cell means; it differs from the
+    raw-row RMSE only by each block's fixed within-cell spread, so it stops at
+    the same round. Reported RMSE and R-squared are the exact raw-row values.
+    """
+    params = {**PARAMS, **grid_params, "eval_metric": "rmse", "max_bin": TUNE_MAX_BIN, "nthread": 1}
+    fold_results = []
+    for index, fold in enumerate(_tune_folds):
+        dtrain, dvalid = fold_matrices(index)
+        model = xgb.train(
+            params,
+            dtrain,
+            num_boost_round=TUNE_MAX_ROUNDS,
+            evals=[(dvalid, "valid")],
+            early_stopping_rounds=TUNE_EARLY_STOPPING,
+            verbose_eval=False,
+        )
+        rounds = model.best_iteration + 1
+        train_rmse, _ = cell_rmse_r_squared(
+            fold["train"], model.inplace_predict(fold["train"][FEATURES].to_numpy(), iteration_range=(0, rounds))
+        )
+        valid_rmse, valid_r_squared = cell_rmse_r_squared(
+            fold["valid"], model.inplace_predict(fold["valid"][FEATURES].to_numpy(), iteration_range=(0, rounds))
+        )
+        fold_results.append(
+            {
+                "fold": fold["fold"],
+                "best_num_boost_round": rounds,
+                "train_rmse": train_rmse,
+                "valid_rmse": valid_rmse,
+                "valid_r_squared": valid_r_squared,
+            }
+        )
+    return {
+        "params": grid_params,
+        "mean_valid_rmse": float(np.mean([f["valid_rmse"] for f in fold_results])),
+        "mean_valid_r_squared": float(np.mean([f["valid_r_squared"] for f in fold_results])),
+        "num_boost_round": int(round(np.mean([f["best_num_boost_round"] for f in fold_results]))),
+        "folds": fold_results,
+    }
+
+
+def tune(conn, n_folds: int = TUNE_FOLDS, workers: int | None = None) -> dict:
+    """Run TUNE_GRID over rolling-origin folds on a process pool; return the report for tuningpy.json."""
+    folds = rolling_origin_folds(load_hour_stats(conn), n_folds)
+    grid = [dict(zip(TUNE_GRID, values)) for values in itertools.product(*TUNE_GRID.values())]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(grid)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_tune_worker, initargs=(folds,)) as pool:
+        results = sorted(pool.map(run_grid_point, grid), key=lambda result: result["mean_valid_rmse"])
+    best = results[0]
+    return {
+        "metro_id": int(METRO_ID),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "method": "Rolling-origin CV on UTC hours (expanding window), weighted per-cell aggregates, early stopping.",
+        "workers": workers,
+        "max_rounds": TUNE_MAX_ROUNDS,
+        "early_stopping_rounds": TUNE_EARLY_STOPPING,
+        "grid": TUNE_GRID,
+        "folds": [{key: value for key, value in fold.items() if key not in {"train", "valid"}} for fold in folds],
+        "best_params": best["params"],
+        "best_num_boost_round": best["num_boost_round"],
+        "best_mean_valid_rmse": best["mean_valid_rmse"],
+        "best_mean_valid_r_squared": best["mean_valid_r_squared"],
+        "results": results,
+    }
+
+
+# 6. FLEET ###################################
+
+def load_monitor_cells(conn, metro_id: int = METRO_ID, holdout_folds: int = HOLDOUT_FOLDS) -> list[tuple[str, pd.DataFrame]]:
+    """(monitor_id, cells) per monitor; cells have the load_cell_stats columns."""
+    cells = pd.DataFrame(
+        read_monitor_cell_stats(conn, metro_id, holdout_folds).fetchall(),
+        columns=["monitor_id", "holdout", "day_of_week", "hour_of_day", "n", "vehicles_sum", "vehicles_sumsq"],
+    )
+    if cells.empty:
+        raise SystemExit("No rows found for configured METRO_ID.")
+    return [(str(monitor_id), group.drop(columns="monitor_id")) for monitor_id, group in cells.groupby("monitor_id", sort=True)]
+
+
+def train_monitor_batch(batch: list[tuple[str, pd.DataFrame]], params: dict, num_boost_round: int, min_rows: int) -> list[tuple]:
+    """Pool task: (monitor_id, packed tree_eval arrays or None, metrics) for each monitor in the batch."""
+    params = {**params, "nthread": 1}
+    results = []
+    for monitor_id, cells in batch:
+        train_cells = cells[cells["holdout"] == 0]
+        test_cells = cells[cells["holdout"] == 1]
+        metrics = {"train_rows": int(train_cells["n"].sum()), "test_rows": int(test_cells["n"].sum())}
+        if metrics["train_rows"] < min_rows:
+            results.append((monitor_id, None, {**metrics, "skipped": "too few training rows"}))
+            continue
+        dtrain = xgb.DMatrix(
+            train_cells[FEATURES].to_numpy(),
+            label=(train_cells["vehicles_sum"] / train_cells["n"]).to_numpy(),
+            weight=train_cells["n"].to_numpy(),
+            feature_names=FEATURES,
+        )
+        model = xgb.train(params, dtrain, num_boost_round=num_boost_round)
+        # Only RMSE is kept; R-squared is undefined for a monitor with a constant count.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            metrics["train_rmse"], _ = cell_rmse_r_squared(train_cells, model.inplace_predict(train_cells[FEATURES].to_numpy()))
+            if not test_cells.empty:
+                metrics["test_rmse"], _ = cell_rmse_r_squared(test_cells, model.inplace_predict(test_cells[FEATURES].to_numpy()))
+        # The API scores these arrays with tree_eval as stored, without xgboost or a JSON parse.
+        blob, metrics["forest"] = pack_forest(export_model(json.loads(bytes(model.save_raw("json")))))
+        results.append((monitor_id, blob, metrics))
+    return results
+
+
+def train_fleet(conn, workers: int | None = None, min_rows: int = FLEET_MIN_TRAIN_ROWS) -> tuple[dict, dict[str, bytes]]:
+    """Train one booster per monitor on a process pool; return (bundle index, {monitor_id: model bytes})."""
+    monitors = load_monitor_cells(conn)
+    params, num_boost_round = training_params()
+    workers = workers or os.cpu_count() or 1
+    # Small fleets still spread over every worker; large ones go in batches of FLEET_BATCH_MONITORS.
+    batch_size = max(1, min(FLEET_BATCH_MONITORS, -(-len(monitors) // workers)))
+    batches = [monitors[i: i + batch_size] for i in range(0, len(monitors), batch_size)]
+    workers = max(1, min(workers, len(batches)))
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        batch_results = pool.map(
+            train_monitor_batch, batches,
+            [params] * len(batches), [num_boost_round] * len(batches), [min_rows] * len(batches),
+        )
+        results = [result for batch in batch_results for result in batch]
+    seconds = time.perf_counter() - started
+
+    blobs = {monitor_id: blob for monitor_id, blob, _ in results if blob is not None}
+    index = {
+        "metro_id": int(METRO_ID),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "format": FLEET_FORMAT,
+        "features": FEATURES,
+        "params": params,
+        "num_boost_round": num_boost_round,
+        "min_train_rows": min_rows,
+        "data_watermark": latest_observed_at(conn, METRO_ID),
+        "workers": workers,
+        "train_seconds": seconds,
+        "models": {monitor_id: metrics for monitor_id, _, metrics in results},
+    }
+    return index, blobs
+
+
+# 7. MULTI-TARGET ###################################
+
+def target_cells(X: np.ndarray, values: np.ndarray, holdout: np.ndarray) -> pd.DataFrame:
+    """Per-(holdout, cell) sufficient statistics of one target, skipping NaN.
+
+    Uses the load_cell_stats columns, so vehicles_sum / vehicles_sumsq hold
+    this target's sums and evaluate_cells works unchanged.
+    """
+    keep = ~np.isnan(values)
+    key = holdout[keep].astype(np.int64) * 168 + cell_index(X[keep])
+    value = values[keep].astype(np.float64)
+    n = np.bincount(key, minlength=336)
+    total = np.bincount(key, weights=value, minlength=336)
+    sumsq = np.bincount(key, weights=value ** 2, minlength=336)
+    seen = np.flatnonzero(n)
+    return pd.DataFrame(
+        {
+            "holdout": seen // 168,
+            "day_of_week": seen % 168 // 24 + 1,
+            "hour_of_day": seen % 24,
+            "n": n[seen],
+            "vehicles_sum": total[seen],
+            "vehicles_sumsq": sumsq[seen],
+        }
+    )
+
+
+def train_target(target: str, cells: pd.DataFrame, params: dict, num_boost_round: int) -> tuple[xgb.Booster, dict]:
+    """Thread task: fit one target's weighted cell means, as in stats mode."""
+    train_cells, test_cells = split_cells(cells)
+    dtrain = xgb.DMatrix(
+        train_cells[FEATURES].to_numpy(),
+        label=(train_cells["vehicles_sum"] / train_cells["n"]).to_numpy(),
+        weight=train_cells["n"].to_numpy(),
+        feature_names=FEATURES,
+    )
+    model = xgb.train(params, dtrain, num_boost_round=num_boost_round)
+    return model, {"target": target, "training_mode": "multi", "params": params, **evaluate_cells(model, train_cells, test_cells)}
+
+
+def train_multi(conn) -> dict[str, tuple[xgb.Booster, dict]]:
+    """Train every MULTI_TARGETS model from one load and one shared feature matrix, one thread per target."""
+    watermark = latest_observed_at(conn, METRO_ID)
+    X, Y, holdout = load_target_arrays(conn, until=watermark)
+    if len(X) == 0:
+        raise SystemExit("No rows found for configured METRO_ID.")
+    params, num_boost_round = training_params()
+    # Split the cores between the concurrent boosters instead of oversubscribing them.
+    params["nthread"] = max(1, (os.cpu_count() or 1) // len(MULTI_TARGETS))
+    with ThreadPoolExecutor(max_workers=len(MULTI_TARGETS)) as pool:
+        futures = {
+            target: pool.submit(train_target, target, target_cells(X, Y[:, k], holdout), params, num_boost_round)
+            for k, target in enumerate(MULTI_TARGETS)
+        }
+        results = {target: future.result() for target, future in futures.items()}
+    for _, metrics in results.values():
+        metrics.update(data_watermark=watermark, full_rebuild_at=datetime.now(timezone.utc).isoformat(timespec="seconds"))
+    return results
+
+
+# 8. SAVE MODEL ###################################
+
+def artifact_paths(target: str | None = None) -> tuple[Path, Path, Path]:
+    """(model, validation, prediction table) paths; None is the single-target vehicles model."""
+    if target is None:
+        return MODEL_PATH, VALIDATION_PATH, PREDICTIONS_PATH
+    return tuple(DATA_DIR / f"{stem}_{target}.json" for stem in ("modelpy", "validationpy", "predictionspy"))
+
+
+def save(model: xgb.Booster, metrics: dict, target: str | None = None) -> None:
+    model_path, validation_path, _ = artifact_paths(target)
+    model.save_model(str(model_path))
+    validation = {"metro_id": int(METRO_ID), **metrics, "num_boost_rounds": model.num_boosted_rounds()}
+    if metrics.get("data_watermark") is not None:
+        validation["data_watermark_utc"] = datetime.fromtimestamp(
+            metrics["data_watermark"], tz=timezone.utc
+        ).isoformat(timespec="seconds")
+    validation_path.write_text(json.dumps(validation, indent=2), encoding="utf-8")
+    write_prediction_table(model, validation, target)
+
+
+def model_sha256(path: Path = MODEL_PATH) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def write_prediction_table(model: xgb.Booster, validation: dict, target: str | None = None) -> dict:
+    """Evaluate the model on all 168 cells and write its prediction table next to the model file."""
+    model_path, _, predictions_path = artifact_paths(target)
+    cells = np.arange(168)
+    pred = model.inplace_predict(np.column_stack([cells // 24 + 1, cells % 24]).astype(np.float32))
+    default_standard_error = float(validation.get("residual_standard_error_default", validation.get("test_rmse", 0.0)))
+    standard_error = np.full(168, default_standard_error)
+    for row in validation.get("standard_error_by_hour_day", []):
+        standard_error[(int(row["day_of_week"]) - 1) * 24 + int(row["hour_of_day"])] = float(row["standard_error"])
+    table = {
+        "metro_id": validation.get("metro_id", int(METRO_ID)),
+        "target": target or "vehicles",
+        "model_sha256": model_sha256(model_path),
+        "data_watermark": validation.get("data_watermark"),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "index": "[day_of_week - 1][hour_of_day]; day_of_week 1 = Monday, hour_of_day UTC",
+        "features": FEATURES,
+        "default_standard_error": default_standard_error,
+        "standard_error_method": validation.get("standard_error_method"),
+        PREDICTION_KEYS[target or "vehicles"]: np.round(pred.astype(np.float64), 4).reshape(7, 24).tolist(),
+        "standard_error": np.round(standard_error, 4).reshape(7, 24).tolist(),
+    }
+    predictions_path.write_text(json.dumps(table, separators=(",", ":")), encoding="utf-8")
+    return table
+
+
+def print_tuning(report: dict) -> None:
+    print("\n====================================================")
+    print("02_train_model.py tune | Brussels realtime model")
+    print("====================================================")
+    print(f"   metro_id: {report['metro_id']}")
+    print(f"   grid points: {len(report['results'])} on {report['workers']} worker processes")
+    for fold in report["folds"]:
+        print(
+            f"   fold {fold['fold']}: train {fold['train_rows']} rows ({fold['train_hours']} hours), "
+            f"validate {fold['valid_rows']} rows from {fold['origin_utc']} to {fold['valid_end_utc']}"
+        )
+    print(f"   best params: {report['best_params']}, {report['best_num_boost_round']} rounds")
+    print(f"   mean validation RMSE: {report['best_mean_valid_rmse']:.2f}")
+    print(f"   mean validation R-squared: {report['best_mean_valid_r_squared']:.3f}")
+    for fold in report["results"][0]["folds"]:
+        print(f"   fold {fold['fold']} validation RMSE: {fold['valid_rmse']:.2f} ({fold['best_num_boost_round']} rounds)")
+    print(f"   tuning saved to {TUNING_PATH} (used by the next training run)")
+
+
+def print_fleet(index: dict, bundle_bytes: int) -> None:
+    models = index["models"].values()
+    test_rmse = [meta["test_rmse"] for meta in models if "test_rmse" in meta]
+    print("\n====================================================")
+    print("02_train_model.py fleet | Brussels per-monitor models")
+    print("====================================================")
+    print(f"   metro_id: {index['metro_id']}")
+    print(f"   monitors: {len(index['models'])} ({sum('offset' in meta for meta in models)} models, "
+          f"{sum('skipped' in meta for meta in models)} below {index['min_train_rows']} training rows)")
+    print(f"   trained in {index['train_seconds']:.2f}s on {index['workers']} worker processes")
+    if test_rmse:
+        print(f"   median per-monitor testing RMSE: {float(np.median(test_rmse)):.2f}")
+    print(f"   bundle saved to {FLEET_PATH} ({bundle_bytes:,} bytes)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the Brussels day-of-week/hour-of-day XGBoost model.")
+    parser.add_argument(
+        "command", nargs="?", choices=["train", "tune", "fleet", "table", "multi"], default="train",
+        help=(
+            "train (default); tune: time-ordered CV grid search written to tuningpy.json; "
+            "fleet: one model per monitor packed into fleetpy.bin; "
+            "table: rebuild predictionspy.json from the saved model; "
+            "multi: speed and occupancy models from one load of the raw minutes."
+        ),
+    )
+    parser.add_argument(
+        "--mode", choices=sorted(TRAIN_MODES), default="stats",
+        help=(
+            "stats: weighted per-cell aggregates from the hourly rollups (default); raw: every stored minute; "
+            "incremental: continue the saved model on rows after its data watermark."
+        ),
+    )
+    parser.add_argument(
+        "--full-every", type=int, default=FULL_REBUILD_EVERY,
+        help=f"Incremental mode: do a full stats rebuild after this many incremental runs (default: {FULL_REBUILD_EVERY}).",
+    )
+    parser.add_argument("--folds", type=int, default=TUNE_FOLDS, help=f"Tune: rolling-origin folds (default: {TUNE_FOLDS}).")
+    parser.add_argument("--workers", type=int, help="Tune and fleet: worker processes (default: one per core).")
+    parser.add_argument(
+        "--min-rows", type=int, default=FLEET_MIN_TRAIN_ROWS,
+        help=f"Fleet: skip monitors with fewer training rows (default: {FLEET_MIN_TRAIN_ROWS}).",
+    )
+    args = parser.parse_args()
+
+    if args.command == "tune":
+        conn = open_store()
+        try:
+            report = tune(conn, args.folds, args.workers)
+        finally:
+            conn.close()
+        TUNING_PATH.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print_tuning(report)
+        return
+    if args.command == "fleet":
+        conn = open_store()
+        try:
+            index, blobs = train_fleet(conn, args.workers, args.min_rows)
+        finally:
+            conn.close()
+        bundle_bytes = write_bundle(FLEET_PATH, index, blobs)
+        print_fleet(index, bundle_bytes)
+        return
+    if args.command == "table":
+        if not (MODEL_PATH.exists() and VALIDATION_PATH.exists()):
+            raise SystemExit(f"Train first: {MODEL_PATH} or {VALIDATION_PATH} is missing.")
+        table = write_prediction_table(
+            xgb.Booster(model_file=str(MODEL_PATH)), json.loads(VALIDATION_PATH.read_text(encoding="utf-8"))
+        )
+        print(f"   prediction table for model {table['model_sha256'][:12]} saved to {PREDICTIONS_PATH}")
+        return
+    if args.command == "multi":
+        conn = open_store()
+        try:
+            results = train_multi(conn)
+        finally:
+            conn.close()
+        print("\n====================================================")
+        print("02_train_model.py multi | Brussels realtime models")
+        print("====================================================")
+        print(f"   metro_id: {METRO_ID}")
+        print(f"   data: raw minutes only (the last {RAW_RETENTION_DAYS} days once `traffic_store.py retain` has run)")
+        for target, (model, metrics) in results.items():
+            save(model, metrics, target)
+            print(
+                f"   {target}: testing RMSE {metrics['test_rmse']:.2f}, R-squared {metrics['test_r_squared']:.3f} "
+                f"({metrics['train_rows']} train / {metrics['test_rows']} test rows) -> {artifact_paths(target)[0].name}"
+            )
+        return
+
+    mode = args.mode
+    conn = open_store()
+    try:
+        if mode == "incremental":
+            previous = load_previous()
+            if previous is None:
+                print("   full rebuild: no saved model with a data watermark yet")
+                mode = "stats"
+            elif int(previous.get("incremental_runs_since_full", 0)) >= args.full_every:
+                print(f"   full rebuild: {args.full_every} incremental runs since the last one")
+                mode = "stats"
+        if mode == "incremental":
+            result = train_incremental(conn, previous)
+            if result is None:
+                print(f"   no rows after the data watermark ({previous.get('data_watermark_utc')}); model unchanged")
+                return
+            model, metrics = result
+            if metrics["test_rmse"] > metrics["previous_test_rmse"]:
+                # Continuing can move cells that got no new rows; a worse held-out fit is not worth keeping.
+                print(
+                    f"   full rebuild: incremental testing RMSE {metrics['test_rmse']:.3f} is worse than "
+                    f"the saved model's {metrics['previous_test_rmse']:.3f} on the same held-out cells"
+                )
+                rejected = {"test_rmse": metrics["test_rmse"], "previous_test_rmse": metrics["previous_test_rmse"]}
+                mode = "stats"
+                model, metrics = train_stats(conn)
+                metrics["rejected_incremental"] = rejected
+        else:
+            model, metrics = TRAIN_MODES[mode](conn)
+        metrics["cell_snapshot"] = cell_snapshot(conn, METRO_ID)
+    finally:
+        conn.close()
+
+    print(f"Training RMSE: {metrics['train_rmse']:.2f}")
+    print(f"Training R-squared: {metrics['train_r_squared']:.3f}")
+    print(f"Testing RMSE: {metrics['test_rmse']:.2f}")
+    print(f"Testing R-squared: {metrics['test_r_squared']:.3f}")
+
+    save(model, metrics)
+
+    print("\n====================================================")
+    print("02_train_model.py | Brussels realtime model")
+    print("====================================================")
+    print(f"   metro_id: {METRO_ID}")
+    print(f"   training mode: {mode}")
+    if mode == "incremental":
+        print(f"   new rows since watermark: {metrics['new_rows']} ({metrics['new_rows_fitted']} outside held-out hours)")
+        print(f"   boosting rounds: {model.num_boosted_rounds()} (run {metrics['incremental_runs_since_full']} since full rebuild)")
+    if mode in {"stats", "incremental"}:
+        print(f"   train rows: {metrics['train_rows']} in {metrics['train_cells']} cells")
+        print(f"   test rows: {metrics['test_rows']} in {metrics['test_cells']} cells")
+    else:
+        print(f"   train rows (80%): {metrics['train_rows']}")
+        print(f"   test rows (20%): {metrics['test_rows']}")
+    print("   features: day_of_week, hour_of_day")
+    print(f"   model saved to {MODEL_PATH}")
+    print(f"   validation saved to {VALIDATION_PATH}")
+    print(f"   prediction table saved to {PREDICTIONS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# batcher.py
+# Async micro-batcher: coalesce concurrent requests into one model call
+# Pairs with main.py
+#
+# Each /predict call awaits MicroBatcher.submit with its (day, hour) pair.
+# The first pair to arrive starts a short timer (window_seconds); every pair
+# that arrives before it fires joins the same batch, and a batch that reaches
+# max_batch is flushed at once. A flush calls score_batch once with all the
+# pairs and hands each awaiting handler its own result, so N concurrent
+# requests cost one feature matrix and one predict call instead of N.
+#
+# Runs entirely on the event loop (no threads): score_batch must be a fast,
+# synchronous function. Standard library only.
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import asyncio
+from typing import Any, Callable
+
+## 0.2 Settings #################################
+
+DEFAULT_WINDOW_SECONDS = 0.002
+DEFAULT_MAX_BATCH = 256
+
+
+# 1. BATCHER ###################################
+
+class MicroBatcher:
+    """Queue items for up to `window_seconds` (or `max_batch` items) and score them in one call."""
+
+    def __init__(
+        self,
+        score_batch: Callable[[list], list],
+        window_seconds: float = DEFAULT_WINDOW_SECONDS,
+        max_batch: int = DEFAULT_MAX_BATCH,
+    ) -> None:
+        self.score_batch = score_batch
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self._pending: list[tuple[Any, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result from the next flush."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            results = self.score_batch([item for item, _ in batch])
+        except Exception as error:  # every waiter sees the failure, not just the first
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():  # the client may have gone away
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window_seconds * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else None,
+        }
@@ -0,0 +1,91 @@
+# bench_coalesce.py
+# Load test: /predict throughput and latency with and without coalescing
+# Pairs with main.py, batcher.py and loadme.py
+#
+# For each --windows value this script starts main.py under uvicorn with
+# PREDICT_BATCH_WINDOW_MS set to it (0 = no coalescing: one score call per
+# request in the threadpool), waits for it to answer, then keeps
+# --concurrency async httpx clients calling /predict with random
+# (day_of_week, hour_of_day) pairs for --duration seconds. It reports
+# requests per second, p50 / p99 latency, errors and the server's mean
+# batch size from /predict/batcher.
+
+# Run from inside the 12_end/03_fastapi/ directory so main.py finds ../data/.
+# Git bash: cd 12_end/03_fastapi && python bench_coalesce.py
+# Git bash: cd 12_end/03_fastapi && python bench_coalesce.py --windows 0 1 2 5 --concurrency 64 --json ../data/bench_coalesce.json
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import httpx
+
+from loadme import free_port, run_load, start_server, wait_ready
+
+
+# 1. LOAD ###################################
+
+async def run_setting(base: str, concurrency: int, duration: float) -> dict:
+    """/predict only, uniform pairs; the server's mean batch size comes from /predict/batcher."""
+    report = await run_load(base, concurrency, duration, {"predict": 1.0}, uniform=True)
+    async with httpx.AsyncClient(base_url=base) as client:
+        batcher = (await client.get("/predict/batcher")).json()
+    overall = report["overall"]
+    return {
+        "requests": overall["ok"],
+        "errors": overall["errors"],
+        "seconds": report["duration_seconds"],
+        "requests_per_second": overall["ok"] / report["duration_seconds"],
+        "p50_ms": overall["p50_ms"],
+        "p99_ms": overall["p99_ms"],
+        "mean_batch_size": batcher.get("mean_batch_size"),
+    }
+
+
+# 2. RUN ###################################
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare /predict under load with and without request coalescing.")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 2], help="PREDICT_BATCH_WINDOW_MS values (default: 0 2).")
+    parser.add_argument("--max-batch", type=int, default=256, help="PREDICT_MAX_BATCH (default: 256).")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients (default: 32).")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load per setting (default: 10).")
+    parser.add_argument("--json", type=Path, dest="json_path", help="Write results to this JSON file.")
+    args = parser.parse_args()
+
+    print("\n====================================================")
+    print("bench_coalesce.py | /predict with and without coalescing")
+    print("====================================================")
+    results = []
+    for window_ms in args.windows:
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        server = start_server(port, {"PREDICT_BATCH_WINDOW_MS": str(window_ms), "PREDICT_MAX_BATCH": str(args.max_batch)})
+        try:
+            asyncio.run(wait_ready(base, server))
+            result = {"window_ms": window_ms, "concurrency": args.concurrency, **asyncio.run(run_setting(base, args.concurrency, args.duration))}
+        finally:
+            server.terminate()
+            server.wait()
+        batch = f"{result['mean_batch_size']:.1f}" if result["mean_batch_size"] else "n/a"
+        print(
+            f"   window {window_ms:g} ms: {result['requests_per_second']:,.0f} req/s, "
+            f"p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+            f"{result['errors']} errors, mean batch {batch}"
+        )
+        results.append(result)
+
+    if args.json_path:
+        args.json_path.parent.mkdir(parents=True, exist_ok=True)
+        args.json_path.write_text(json.dumps({"created_at": time.time(), "results": results}, indent=2), encoding="utf-8")
+        print(f"   results written: {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
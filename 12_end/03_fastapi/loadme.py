@@ -0,0 +1,295 @@
+# loadme.py
+# Load-test the prediction API: throughput, latency percentiles, errors, histogram
+# Pairs with main.py, runme.sh and testme.py
+#
+# Keeps --concurrency async httpx clients busy for --duration seconds
+# against a running server (--url) or a uvicorn instance it starts itself
+# (--start, on a free local port). Each request is drawn from --mix, e.g.
+# "predict=8,grid=1,validation=1". /predict pairs follow how people ask
+# about traffic: weekdays more than weekends, and daytime and rush hours
+# more than nights (--uniform draws every day and hour equally). The report
+# has requests per second, p50 / p95 / p99 / max latency, error rate and
+# error kinds, per endpoint and overall, plus a latency histogram. --json
+# writes it to a file. --max-p99-ms and --max-error-rate make the script
+# exit non-zero when a budget is missed, so CI can gate a deploy.
+#
+# pip install httpx uvicorn
+
+# Run from inside the 12_end/03_fastapi/ directory so main.py finds ../data/.
+# Git bash: cd 12_end/03_fastapi && python loadme.py --start --concurrency 32 --duration 20
+# Git bash: cd 12_end/03_fastapi && python loadme.py --url http://localhost:8000 --mix predict=9,validation=1 --json ../data/loadme.json
+# Git bash: cd 12_end/03_fastapi && python loadme.py --start --max-p99-ms 250 --max-error-rate 0.001
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+## 0.2 Settings #################################
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+STARTUP_TIMEOUT_SECONDS = 30
+DEFAULT_MIX = "predict=8,grid=1,validation=1"
+# Upper bucket edges in ms; the last bucket is everything slower.
+HISTOGRAM_EDGES_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+# Relative query weights: Monday..Sunday, and hour 0..23 (rush hours and daytime first).
+DAY_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 1.1, 0.6, 0.5]
+HOUR_WEIGHTS = [
+    0.2, 0.1, 0.1, 0.1, 0.2, 0.5, 1.2, 2.5, 3.0, 2.0, 1.2, 1.0,
+    1.1, 1.0, 1.0, 1.3, 2.2, 2.8, 2.4, 1.5, 0.9, 0.6, 0.4, 0.3,
+]
+
+
+# 1. SERVER ###################################
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, env: dict | None = None, workers: int = 1) -> subprocess.Popen:
+    """uvicorn main:app on 127.0.0.1:`port`, with extra environment variables (e.g. PREDICT_BATCH_WINDOW_MS)."""
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=SCRIPT_DIR, env={**os.environ, **(env or {})},
+    )
+
+
+async def wait_ready(base: str, server: subprocess.Popen | None = None) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    async with httpx.AsyncClient(base_url=base) as client:
+        while time.monotonic() < deadline:
+            if server is not None and server.poll() is not None:
+                raise SystemExit(f"uvicorn exited with code {server.returncode}")
+            try:
+                (await client.get("/validation")).raise_for_status()
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise SystemExit(f"server at {base} did not answer within {STARTUP_TIMEOUT_SECONDS}s")
+
+
+# 2. REQUESTS ###################################
+
+def parse_mix(text: str) -> dict[str, float]:
+    """"predict=8,validation=1" -> {"predict": 8.0, "validation": 1.0}."""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in REQUESTS:
+            raise SystemExit(f"Unknown request {name!r} in --mix; choose from {sorted(REQUESTS)}.")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def draw_pair(rng: random.Random, uniform: bool) -> tuple[int, int]:
+    if uniform:
+        return rng.randint(1, 7), rng.randint(0, 23)
+    return rng.choices(range(1, 8), DAY_WEIGHTS)[0], rng.choices(range(24), HOUR_WEIGHTS)[0]
+
+
+def predict_request(rng: random.Random, uniform: bool) -> tuple[str, dict]:
+    day, hour = draw_pair(rng, uniform)
+    return "/predict", {"day_of_week": day, "hour_of_day": hour}
+
+
+def grid_request(rng: random.Random, uniform: bool) -> tuple[str, dict]:
+    day, _ = draw_pair(rng, uniform)
+    return "/predict/grid", {"days": str(day), "hours": "0-23"}  # one day, as 04_agent_query.py asks
+
+
+def validation_request(rng: random.Random, uniform: bool) -> tuple[str, dict]:
+    return "/validation", {}
+
+
+REQUESTS = {"predict": predict_request, "grid": grid_request, "validation": validation_request}
+
+
+# 3. LOAD ###################################
+
+async def run_load(
+    base: str,
+    concurrency: int,
+    duration: float,
+    mix: dict[str, float] | None = None,
+    uniform: bool = False,
+    seed: int = 0,
+    timeout: float = 30,
+) -> dict:
+    """Drive `base` with `concurrency` clients for `duration` seconds; return the report."""
+    mix = mix or {"predict": 1.0}
+    names, weights = list(mix), list(mix.values())
+    rng = random.Random(seed)
+    latencies = {name: [] for name in names}
+    errors = {name: Counter() for name in names}
+    stop_at = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, weights)[0]
+            path, params = REQUESTS[name](rng, uniform)
+            started = time.perf_counter()
+            try:
+                response = await client.get(path, params=params)
+                error = None if response.status_code == 200 else f"http_{response.status_code}"
+            except httpx.HTTPError as exc:
+                error = type(exc).__name__
+            if error is None:
+                latencies[name].append(time.perf_counter() - started)
+            else:
+                errors[name][error] += 1
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=timeout) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "url": base,
+        "concurrency": concurrency,
+        "duration_seconds": elapsed,
+        "mix": mix,
+        "uniform_pairs": uniform,
+        "overall": summarize([s for name in names for s in latencies[name]], sum(errors.values(), Counter()), elapsed),
+        "endpoints": {name: summarize(latencies[name], errors[name], elapsed) for name in names},
+    }
+    return report
+
+
+def summarize(latencies: list[float], errors: Counter, elapsed: float) -> dict:
+    ms = np.array(latencies) * 1000
+    n_errors = sum(errors.values())
+    total = len(ms) + n_errors
+    counts = np.bincount(np.searchsorted(HISTOGRAM_EDGES_MS, ms), minlength=len(HISTOGRAM_EDGES_MS) + 1)
+    return {
+        "requests": total,
+        "ok": len(ms),
+        "errors": n_errors,
+        "error_rate": n_errors / total if total else 0.0,
+        "error_kinds": dict(errors),
+        "requests_per_second": total / elapsed if elapsed else None,
+        **{
+            f"p{q}_ms": float(np.percentile(ms, q)) if len(ms) else None
+            for q in (50, 95, 99)
+        },
+        "max_ms": float(ms.max()) if len(ms) else None,
+        "histogram": [
+            {"le_ms": edge, "count": int(count)}
+            for edge, count in zip(HISTOGRAM_EDGES_MS + [None], counts)
+        ],
+    }
+
+
+# 4. REPORT ###################################
+
+def print_report(report: dict) -> None:
+    overall = report["overall"]
+    print(f"   url: {report['url']}, {report['concurrency']} clients for {report['duration_seconds']:.1f}s")
+    for name, stats in [("overall", overall), *report["endpoints"].items()]:
+        if not stats["requests"]:
+            continue
+        latency = (
+            f"p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms, max {stats['max_ms']:.1f} ms"
+            if stats["ok"] else "no successful requests"
+        )
+        print(
+            f"   {name}: {stats['requests']:,} requests, {stats['requests_per_second']:,.0f} req/s, "
+            f"{latency}, error rate {stats['error_rate']:.2%}"
+        )
+        if stats["error_kinds"]:
+            print(f"      errors: {stats['error_kinds']}")
+    print("   latency histogram (overall):")
+    peak = max(bucket["count"] for bucket in overall["histogram"]) or 1
+    previous = 0
+    for bucket in overall["histogram"]:
+        label = f"{previous}-{bucket['le_ms']} ms" if bucket["le_ms"] is not None else f">{previous} ms"
+        print(f"   {label:>14} {bucket['count']:>8,} {'#' * round(40 * bucket['count'] / peak)}")
+        previous = bucket["le_ms"]
+
+
+def check_budgets(report: dict, max_p99_ms: float | None, max_error_rate: float | None) -> list[str]:
+    overall = report["overall"]
+    failures = []
+    if max_p99_ms is not None and (overall["p99_ms"] is None or overall["p99_ms"] > max_p99_ms):
+        p99 = "n/a" if overall["p99_ms"] is None else f"{overall['p99_ms']:.1f}"
+        failures.append(f"p99 {p99} ms > budget {max_p99_ms:g} ms")
+    if max_error_rate is not None and overall["error_rate"] > max_error_rate:
+        failures.append(f"error rate {overall['error_rate']:.4f} > budget {max_error_rate:g}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test the prediction API and report throughput and latency.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="Base URL of a running server (default: API_PUBLIC_URL or http://localhost:8000).")
+    target.add_argument("--start", action="store_true", help="Start uvicorn main:app on a free local port for the run.")
+    parser.add_argument("--server-workers", type=int, default=1, help="uvicorn --workers when using --start (default: 1).")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients (default: 16).")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load (default: 10).")
+    parser.add_argument("--warmup", type=float, default=1, help="Unreported seconds of load first (default: 1).")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Request weights (default: {DEFAULT_MIX}).")
+    parser.add_argument("--uniform", action="store_true", help="Draw every (day_of_week, hour_of_day) equally often.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, dest="json_path", help="Write the report to this JSON file.")
+    parser.add_argument("--max-p99-ms", type=float, help="Exit non-zero if overall p99 latency is above this.")
+    parser.add_argument("--max-error-rate", type=float, help="Exit non-zero if the overall error rate is above this (0-1).")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    server = None
+    if args.start:
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        server = start_server(port, workers=args.server_workers)
+    else:
+        base = (args.url or os.getenv("API_PUBLIC_URL", "http://localhost:8000")).rstrip("/")
+
+    print("\n====================================================")
+    print("loadme.py | prediction API load test")
+    print("====================================================")
+    try:
+        asyncio.run(wait_ready(base, server))
+        if args.warmup > 0:
+            asyncio.run(run_load(base, args.concurrency, args.warmup, mix, args.uniform, args.seed + 1))
+        report = asyncio.run(run_load(base, args.concurrency, args.duration, mix, args.uniform, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print_report(report)
+
+    if args.json_path:
+        report.update(created_at=time.time(), python=platform.python_version(), platform=platform.platform())
+        args.json_path.parent.mkdir(parents=True, exist_ok=True)
+        args.json_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"   report written: {args.json_path}")
+
+    failures = check_budgets(report, args.max_p99_ms, args.max_error_rate)
+    if failures:
+        raise SystemExit("Latency budget missed:\n   " + "\n   ".join(failures))
+    if args.max_p99_ms is not None or args.max_error_rate is not None:
+        print("   within latency budget")
+
+
+if __name__ == "__main__":
+    main()
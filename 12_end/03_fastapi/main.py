@@ -2,73 +2,339 @@
 # FastAPI REST Endpoint (Brussels Realtime)
 # Pairs with 03_serve_model.R
 # Tim Fraser
+#
+# Endpoints:
+# - GET  /predict?day_of_week=1&hour_of_day=8    one prediction
+# - GET  /predict?day_of_week=1&hour_of_day=8&monitor_id=...   that monitor's
+#   own vehicles model from fleetpy.bin (`02_train_model.py fleet`); monitors
+#   the fleet skipped for too few rows get the metro prediction
+# - POST /predict/batch   [{"day_of_week": 1, "hour_of_day": 8}, ...]
+# - GET  /predict/grid?days=1,2&hours=0-23        every day x hour combination
+# - GET  /validation
+# Batch and grid call each model once for all rows. Concurrent /predict calls
+# are coalesced the same way by batcher.py: pairs arriving within
+# PREDICT_BATCH_WINDOW_MS (default 2; 0 turns coalescing off) are scored
+# together, up to PREDICT_MAX_BATCH (default 256) pairs per call.
+#
+# Hot reload: every MODEL_RELOAD_SECONDS (default 30; 0 turns it off) the
+# server checks the size and mtime of the model and validation files. Once
+# a change has been stable for one interval, it loads the new models, SE
+# tables and 7 x 24 grid in a worker thread and swaps them in with one
+# assignment. Each request reads `state` once, so in-flight requests finish
+# on the version they started with. Responses carry "model_version", the
+# first 12 hex digits of modelpy.json's SHA-256 (the model_sha256 in
+# predictionspy.json).
 
 # 0. SETUP ###################################
 
-from fastapi import FastAPI
-import xgboost as xgb
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException, Query
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 import numpy as np
 from pathlib import Path
+import asyncio
+import hashlib
 import json
+import os
+import sys
 
+from batcher import MicroBatcher
 
-def resolve_model_path() -> Path:
-    candidates = [
-        Path("data/modelpy.json"),
-        Path("../data/modelpy.json"),
-        Path("12_end/data/modelpy.json"),
-    ]
-    for path in candidates:
-        if path.exists():
-            return path
-    return candidates[0]
+# Scores the exported trees with NumPy, so serving does not need xgboost.
+from tree_eval import load_forest, predict_forest, unpack_forest
 
+TARGETS = ("vehicles", "speed", "occupancy")
+FLEET_FORMAT = "tree-eval-v1"  # index["format"] of a fleetpy.bin holding tree_eval.pack_forest arrays
+RELOAD_SECONDS = float(os.getenv("MODEL_RELOAD_SECONDS", "30"))
 
-def resolve_validation_path() -> Path:
+
+def resolve_data_path(name: str) -> Path:
     candidates = [
-        Path("data/validationpy.json"),
-        Path("../data/validationpy.json"),
-        Path("12_end/data/validationpy.json"),
+        Path("data") / name,
+        Path("../data") / name,
+        Path("12_end/data") / name,
     ]
     for path in candidates:
         if path.exists():
             return path
     return candidates[0]
 
+
+def resolve_target_paths(target: str) -> tuple[Path, Path]:
+    """(model, validation) paths; speed and occupancy come from `02_train_model.py multi`."""
+    suffix = "" if target == "vehicles" else f"_{target}"
+    return resolve_data_path(f"modelpy{suffix}.json"), resolve_data_path(f"validationpy{suffix}.json")
+
+
+def standard_errors(validation: dict) -> tuple[float, dict]:
+    default = float(validation.get("residual_standard_error_default", validation.get("test_rmse", 0.0)))
+    by_hour_day = {
+        (int(row["day_of_week"]), int(row["hour_of_day"])): float(row["standard_error"])
+        for row in validation.get("standard_error_by_hour_day", [])
+    }
+    return default, by_hour_day
+
 # 1. LOAD MODEL ###################################
 
-app = FastAPI()
-model = xgb.Booster()
-model.load_model(str(resolve_model_path()))
-validation_path = resolve_validation_path()
-validation = json.loads(validation_path.read_text(encoding="utf-8"))
-default_standard_error = float(validation.get("residual_standard_error_default", validation.get("test_rmse", 0.0)))
-se_by_hour_day = {
-    (int(row["day_of_week"]), int(row["hour_of_day"])): float(row["standard_error"])
-    for row in validation.get("standard_error_by_hour_day", [])
-}
+def artifact_signature() -> tuple:
+    """(path, mtime_ns, size) of every model, validation and fleet file that exists."""
+    signature = []
+    paths = [path for target in TARGETS for path in resolve_target_paths(target)] + [resolve_data_path("fleetpy.bin")]
+    for path in paths:
+        if path.exists():
+            stat = path.stat()
+            signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
 
-# 2. DEFINE ENDPOINT ###################################
 
-@app.get("/predict")
-def predict(day_of_week: int, hour_of_day: int):
-    features = np.array([[day_of_week, hour_of_day]], dtype=float)
-    dmat = xgb.DMatrix(features, feature_names=["day_of_week", "hour_of_day"])
-    pred = model.predict(dmat)
-    standard_error = se_by_hour_day.get((int(day_of_week), int(hour_of_day)), default_standard_error)
+def load_fleet() -> dict | None:
+    """Per-monitor forests from fleetpy.bin, or None when there is no usable bundle."""
+    path = resolve_data_path("fleetpy.bin")
+    if not path.exists():
+        return None
+    # model_bundle.py sits next to 02_train_model.py; only needed when a bundle exists.
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from model_bundle import read_bundle
+
+    index, blobs = read_bundle(path)
+    if index.get("format") != FLEET_FORMAT:
+        print(f"   {path} holds {index.get('format')} models; retrain with `02_train_model.py fleet` to serve them")
+        return None
     return {
-        "predicted_vehicle_count": round(float(pred[0]), 1),
-        "standard_error": round(float(standard_error), 3),
-        "standard_error_method": validation.get("standard_error_method"),
+        "version": hashlib.sha256(path.read_bytes()).hexdigest()[:12],
+        "models": index.get("models", {}),
+        # Views into the one buffer read_bundle read: nothing is parsed or copied per monitor.
+        "forests": {monitor_id: unpack_forest(blob, index["models"][monitor_id]["forest"]) for monitor_id, blob in blobs.items()},
     }
 
 
+def load_state() -> dict:
+    """Load every model with its SE table and precompute the 7 x 24 grid.
+
+    Raises RuntimeError if a file changed while loading, so a half-written
+    set of artifacts is never served.
+    """
+    signature = artifact_signature()
+    model_path, validation_path = resolve_target_paths("vehicles")
+    validation = json.loads(validation_path.read_text(encoding="utf-8"))
+    # Each target is (forest, default standard error, standard error by (day, hour)).
+    targets = {"vehicles": (load_forest(model_path), *standard_errors(validation))}
+    methods = {"vehicles": validation.get("standard_error_method")}
+    for target in TARGETS[1:]:
+        target_model_path, target_validation_path = resolve_target_paths(target)
+        if target_model_path.exists() and target_validation_path.exists():
+            target_validation = json.loads(target_validation_path.read_text(encoding="utf-8"))
+            targets[target] = (load_forest(target_model_path), *standard_errors(target_validation))
+            methods[target] = target_validation.get("standard_error_method")
+    version = hashlib.sha256(model_path.read_bytes()).hexdigest()[:12]
+    if artifact_signature() != signature:
+        raise RuntimeError("Model files changed while loading.")
+
+    loaded = {
+        "version": version,
+        "loaded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "signature": signature,
+        "validation": validation,
+        "targets": targets,
+        "methods": methods,
+        "fleet": load_fleet(),
+    }
+    cells = range(168)
+    loaded["grid"] = score(loaded, [cell // 24 + 1 for cell in cells], [cell % 24 for cell in cells])
+    return loaded
+
+
+async def reload_loop() -> None:
+    """Poll the artifacts and swap in a new state once a change has settled."""
+    global state
+    seen = failed = state["signature"]
+    while True:
+        await asyncio.sleep(RELOAD_SECONDS)
+        signature = artifact_signature()
+        if signature in (state["signature"], failed) or signature != seen:
+            seen = signature  # unchanged, already failed, or still being written
+            continue
+        try:
+            new_state = await run_in_threadpool(load_state)
+        except (OSError, ValueError, KeyError, RuntimeError) as error:
+            failed = signature
+            print(f"   model reload failed, still serving {state['version']}: {error}")
+            continue
+        state = new_state
+        seen = new_state["signature"]
+        print(f"   model reloaded: {new_state['version']}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    task = asyncio.create_task(reload_loop()) if RELOAD_SECONDS > 0 else None
+    yield
+    if task is not None:
+        task.cancel()
+
+
+# 2. SCORE ###################################
+
+MAX_BATCH_ROWS = 10_000
+
+
+class PredictionRow(BaseModel):
+    day_of_week: int = Field(ge=1, le=7)
+    hour_of_day: int = Field(ge=0, le=23)
+
+
+def score(current: dict, days: list[int], hours: list[int]) -> list[dict]:
+    """One prediction row per (day, hour) pair; each model is called once for the whole batch."""
+    features = np.column_stack([days, hours]).astype(np.float32)
+    rows = [{} for _ in days]
+    # All targets reuse the same feature matrix.
+    for target, (target_model, target_default_se, target_se_by_hour_day) in current["targets"].items():
+        prediction_key, se_key = (
+            ("predicted_vehicle_count", "standard_error") if target == "vehicles"
+            else (f"predicted_{target}", f"{target}_standard_error")
+        )
+        target_pred = predict_forest(target_model, features)
+        for row, day, hour, value in zip(rows, days, hours, target_pred):
+            row[prediction_key] = round(float(value), 1)
+            row[se_key] = round(float(target_se_by_hour_day.get((day, hour), target_default_se)), 3)
+    return rows
+
+
+def method_fields(current: dict) -> dict:
+    """standard_error_method for vehicles, <target>_standard_error_method for the others (each from its own validation file)."""
+    return {
+        ("standard_error_method" if target == "vehicles" else f"{target}_standard_error_method"): method
+        for target, method in current["methods"].items()
+    }
+
+
+def batch_response(current: dict, days: list[int], hours: list[int], rows: list[dict]) -> dict:
+    return {
+        "model_version": current["version"],
+        **method_fields(current),
+        "count": len(rows),
+        "predictions": [{"day_of_week": day, "hour_of_day": hour, **row} for day, hour, row in zip(days, hours, rows)],
+    }
+
+
+def parse_int_list(text: str, name: str, low: int, high: int) -> list[int]:
+    """"1,2,5-7" -> [1, 2, 5, 6, 7]; raises HTTP 422 on a malformed or reversed part or anything outside low..high.
+
+    Each part is checked before it is expanded, so "1-1000000000" is rejected
+    without building the list.
+    """
+    values = []
+    try:
+        for part in text.split(","):
+            first, dash, last = part.strip().partition("-")
+            if dash and not last:
+                raise ValueError(part)  # "1-": no upper bound
+            first, last = int(first), int(last or first)
+            if first < low or last > high:
+                raise HTTPException(status_code=422, detail=f"{name} must be within {low}-{high}; got {text!r}.")
+            if last < first:
+                raise HTTPException(status_code=422, detail=f"{name} range {part.strip()!r} is reversed; write {last}-{first}.")
+            values.extend(range(first, last + 1))
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"{name} must look like 1,2,5-7; got {text!r}.")
+    return values
+
+
+def score_pairs(pairs: list[tuple[int, int]]) -> list[dict]:
+    current = state
+    rows = score(current, [day for day, _ in pairs], [hour for _, hour in pairs])
+    methods = method_fields(current)
+    for row in rows:
+        row.update(methods)
+        row["model_version"] = current["version"]
+    return rows
+
+
+def score_monitor(current: dict, monitor_id: str, pair: tuple[int, int]) -> dict:
+    """One monitor's own vehicles prediction; monitors listed without a model get the metro row."""
+    fleet = current["fleet"]
+    if fleet is None or monitor_id not in fleet["models"]:
+        raise HTTPException(status_code=404, detail=f"No fleet model entry for monitor_id {monitor_id!r}.")
+    forest = fleet["forests"].get(monitor_id)
+    if forest is None:  # skipped by the fleet for too few training rows
+        row = score(current, [pair[0]], [pair[1]])[0]
+        return {"monitor_id": monitor_id, "monitor_model": False, **row, **method_fields(current), "model_version": current["version"]}
+    meta = fleet["models"][monitor_id]
+    prediction = predict_forest(forest, np.array([pair], dtype=np.float32))[0]
+    return {
+        "monitor_id": monitor_id,
+        "monitor_model": True,
+        "predicted_vehicle_count": round(float(prediction), 1),
+        "standard_error": round(float(meta.get("test_rmse", meta["train_rmse"])), 3),
+        "standard_error_method": "This monitor's testing RMSE from the fleet index (training RMSE without held-out rows).",
+        "model_version": fleet["version"],
+    }
+
+
+state = load_state()
+app = FastAPI(lifespan=lifespan)
+
+BATCH_WINDOW_MS = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "2"))
+batcher = MicroBatcher(
+    score_pairs,
+    window_seconds=BATCH_WINDOW_MS / 1000,
+    max_batch=int(os.getenv("PREDICT_MAX_BATCH", "256")),
+)
+
+
+# 3. DEFINE ENDPOINTS ###################################
+
+@app.get("/predict")
+async def predict(
+    day_of_week: int = Query(ge=1, le=7), hour_of_day: int = Query(ge=0, le=23), monitor_id: str | None = None
+):
+    pair = (int(day_of_week), int(hour_of_day))
+    if monitor_id is not None:
+        return await run_in_threadpool(score_monitor, state, monitor_id, pair)
+    if BATCH_WINDOW_MS > 0:
+        return await batcher.submit(pair)
+    # One score call per request in Starlette's threadpool, as a sync handler would.
+    return (await run_in_threadpool(score_pairs, [pair]))[0]
+
+
+@app.get("/predict/batcher")
+def get_batcher():
+    return {"enabled": BATCH_WINDOW_MS > 0, **batcher.stats()}
+
+
+@app.post("/predict/batch")
+def predict_batch(rows: list[PredictionRow]):
+    if len(rows) > MAX_BATCH_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_ROWS} rows per batch.")
+    current = state
+    days, hours = [row.day_of_week for row in rows], [row.hour_of_day for row in rows]
+    return batch_response(current, days, hours, score(current, days, hours))
+
+
+@app.get("/predict/grid")
+def predict_grid(days: str = "1-7", hours: str = "0-23"):
+    day_values = parse_int_list(days, "days", 1, 7)
+    hour_values = parse_int_list(hours, "hours", 0, 23)
+    current = state
+    # Served from the grid precomputed at load time: no model call per request.
+    cell_days = [day for day in day_values for _ in hour_values]
+    cell_hours = [hour for _ in day_values for hour in hour_values]
+    rows = [current["grid"][(day - 1) * 24 + hour] for day, hour in zip(cell_days, cell_hours)]
+    return batch_response(current, cell_days, cell_hours, rows)
+
+
 @app.get("/validation")
 def get_validation():
+    current = state
+    validation = current["validation"]
     return {
         "metro_id": validation.get("metro_id"),
         "test_rmse": validation.get("test_rmse"),
         "test_r_squared": validation.get("test_r_squared"),
         "train_rmse": validation.get("train_rmse"),
         "train_r_squared": validation.get("train_r_squared"),
+        "model_version": current["version"],
+        "model_loaded_at": current["loaded_at"],
     }
@@ -0,0 +1,197 @@
+# serve_prefork.py
+# Preforked multi-worker launcher: load the models once, share them with N workers
+# Pairs with main.py and runme.sh
+#
+# `uvicorn main:app --workers N` starts N fresh interpreters, and each one
+# imports main.py and loads its own forests, SE tables and grid. This
+# launcher imports main.py once in the parent, calls gc.freeze() so the
+# collector stops writing to those objects, then binds the port and forks
+# N workers. Each worker runs uvicorn on the inherited socket. The workers
+# start from the parent's memory, so the loaded models, numpy, FastAPI and
+# pydantic pages stay shared copy-on-write; the kernel spreads connections
+# across the workers.
+#
+# Notes:
+# - POSIX only (os.fork); on Windows use `uvicorn main:app --workers N`.
+# - Each worker still runs main.py's hot reload. A reloaded model is private
+#   to the worker that loaded it until the launcher is restarted.
+# - --load-in-workers imports main.py in each worker after the fork instead,
+#   which matches what `uvicorn --workers` does and gives a baseline.
+#
+# Memory after startup and 20 requests per worker (`--report-memory`, Linux,
+# Python 3.11, 1 CPU). Per-worker MB as RSS / PSS / private; PSS splits each
+# shared page between its sharers, so "total PSS" (parent + workers) is what
+# the pod actually uses. The prefork parent adds ~60 MB RSS / ~21 MB private.
+#   workers |       prefork        | total PSS |   load in workers    | total PSS
+#         1 | 47 / 29 / 12         |     68 MB | 56 / 49 / 45         |     70 MB
+#         4 | 47 / 18 / 11         |    101 MB | 56 / 39 / 34         |    172 MB
+#        16 | 46 / 12 / 10         |    215 MB | 56 / 35 / 34         |    575 MB
+# Size pods as roughly 60 MB + N x 12 MB prefork versus N x 35 MB otherwise.
+# Summing RSS double-counts the shared pages (795 MB at 16 prefork workers).
+
+# Run from inside the 12_end/03_fastapi/ directory so main.py finds ../data/.
+# Git bash: cd 12_end/03_fastapi && python serve_prefork.py --workers 4 --port 8000
+# Git bash: cd 12_end/03_fastapi && python serve_prefork.py --workers 16 --report-memory
+# Git bash: cd 12_end/03_fastapi && python serve_prefork.py --workers 16 --report-memory --load-in-workers
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse
+import gc
+import importlib
+import json
+import os
+import signal
+import socket
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import uvicorn
+
+## 0.2 Settings #################################
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+REPORT_REQUESTS_PER_WORKER = 20
+
+
+# 1. WORKERS ###################################
+
+def listen_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, ready_fd: int, app=None) -> None:
+    """Child process: import the app if the parent did not, tell the parent, then serve."""
+    if app is None:
+        app = importlib.import_module("main").app
+    os.write(ready_fd, b".")
+    os.close(ready_fd)
+    config = uvicorn.Config(app, log_level="warning", lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def fork_workers(sock: socket.socket, workers: int, app=None) -> list[int]:
+    """Fork `workers` children serving on `sock`; return their pids once every one has its app."""
+    read_fd, write_fd = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                run_worker(sock, write_fd, app)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    os.close(write_fd)
+    ready = 0
+    while ready < workers:
+        chunk = os.read(read_fd, workers)
+        if not chunk:
+            raise SystemExit("A worker exited before it was ready.")
+        ready += len(chunk)
+    os.close(read_fd)
+    return pids
+
+
+def stop_workers(pids: list[int]) -> None:
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in pids:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+
+# 2. MEMORY REPORT ###################################
+
+def memory_mb(pid: int) -> dict:
+    """RSS, PSS and private memory of one process from /proc/<pid>/smaps_rollup (Linux)."""
+    fields = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        key, value = line.split(":", 1)
+        fields[key] = int(value.split()[0])  # KiB
+    return {
+        "rss_mb": fields["Rss"] / 1024,
+        "pss_mb": fields["Pss"] / 1024,
+        "private_mb": (fields["Private_Clean"] + fields["Private_Dirty"]) / 1024,
+    }
+
+
+def report_memory(base: str, pids: list[int], load_in_workers: bool) -> dict:
+    """Send a few requests per worker, then measure the parent and every worker."""
+    for k in range(REPORT_REQUESTS_PER_WORKER * len(pids)):
+        url = f"{base}/predict?day_of_week={k % 7 + 1}&hour_of_day={k % 24}"
+        with urllib.request.urlopen(url, timeout=10) as response:
+            response.read()
+    time.sleep(0.5)
+    workers = [memory_mb(pid) for pid in pids]
+    parent = memory_mb(os.getpid())
+    summary = {
+        "workers": len(pids),
+        "mode": "load_in_workers" if load_in_workers else "prefork",
+        "parent": parent,
+        **{f"mean_worker_{key}": sum(w[key] for w in workers) / len(workers) for key in ("rss_mb", "pss_mb", "private_mb")},
+        "total_pss_mb": parent["pss_mb"] + sum(w["pss_mb"] for w in workers),
+        "total_rss_mb": parent["rss_mb"] + sum(w["rss_mb"] for w in workers),
+    }
+    return summary
+
+
+# 3. RUN ###################################
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve main:app from N forked workers that share the loaded models.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--load-in-workers", action="store_true", help="Import main.py in each worker (uvicorn --workers baseline).")
+    parser.add_argument("--report-memory", action="store_true", help="Start, measure per-worker memory, print JSON and exit.")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        raise SystemExit("serve_prefork.py needs os.fork; use `uvicorn main:app --workers N` on this platform.")
+    os.chdir(SCRIPT_DIR)
+    sys.path.insert(0, str(SCRIPT_DIR))
+
+    app = None
+    if not args.load_in_workers:
+        app = importlib.import_module("main").app
+        gc.collect()
+        gc.freeze()  # keep the collector from touching (and un-sharing) the loaded objects
+    host = "127.0.0.1" if args.report_memory and args.host == "0.0.0.0" else args.host
+    sock = listen_socket(host, 0 if args.report_memory else args.port)
+    pids = fork_workers(sock, args.workers, app)
+
+    if args.report_memory:
+        try:
+            summary = report_memory(f"http://{host}:{sock.getsockname()[1]}", pids, args.load_in_workers)
+        finally:
+            stop_workers(pids)
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"   serving on {host}:{args.port} with {args.workers} workers (pids {', '.join(map(str, pids))})")
+    signal.signal(signal.SIGTERM, lambda *_: stop_workers(pids) or sys.exit(0))
+    try:
+        for pid in pids:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        stop_workers(pids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# tree_eval.py
+# Pure-NumPy evaluator for xgboost regression models saved as JSON
+# Pairs with main.py and ../02_train_model.py
+#
+# export_forest reads modelpy.json with the standard library (export_model
+# takes an already-parsed model, e.g. one blob of a fleet bundle) and
+# flattens every tree into parallel arrays, one entry per node across all trees:
+# feature index (-1 on leaves), float32 threshold, left and right child,
+# default direction for missing values and leaf value, plus the root node
+# of each tree and the model's base score. predict_forest scores a whole
+# batch at once: every (row, tree) pair walks one level per step with array
+# indexing, so a batch costs max_depth vectorized steps and no xgboost.
+#
+# Follows xgboost's rules: go left when value < threshold (compared in
+# float32), missing values (NaN) follow default_left, and the prediction is
+# base_score plus the sum of the leaf values (identity link only).
+#
+# pack_forest / unpack_forest store those arrays as one flat blob (the fleet
+# bundle, fleetpy.bin, holds one per monitor), and unpacking is np.frombuffer
+# views into it: no JSON parse and no copy when a server loads the bundle.
+#
+# Usage (from inside 12_end/03_fastapi/):
+#   python tree_eval.py export ../data/modelpy.json ../data/modelpy_trees.npz
+#   python tree_eval.py check ../data/modelpy.json      # compare with Booster.predict (needs xgboost)
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+## 0.2 Settings #################################
+
+# Objectives whose prediction is the raw margin, so no link function is needed.
+IDENTITY_OBJECTIVES = {"reg:squarederror", "reg:absoluteerror", "reg:pseudohubererror"}
+FOREST_KEYS = ("feature", "threshold", "left", "right", "default_left", "value", "roots", "base_score", "max_depth")
+# Blob layout of pack_forest: (key, dtype, length from "nodes" or "trees"); 4-byte arrays first, the bool mask last.
+PACKED_ARRAYS = (
+    ("feature", np.int32, "nodes"),
+    ("threshold", np.float32, "nodes"),
+    ("left", np.int32, "nodes"),
+    ("right", np.int32, "nodes"),
+    ("value", np.float32, "nodes"),
+    ("roots", np.int32, "trees"),
+    ("default_left", np.bool_, "nodes"),
+)
+
+
+# 1. EXPORT ###################################
+
+def parse_base_score(value: str) -> float:
+    """base_score is "1.36E1" in older model files and "[1.36E1]" in newer ones."""
+    return float(str(value).strip("[]").split(",")[0])
+
+
+def export_forest(model_path: Path) -> dict[str, np.ndarray]:
+    """Flatten an xgboost JSON model file into node arrays; raises ValueError for unsupported models."""
+    return export_model(json.loads(Path(model_path).read_text(encoding="utf-8")))
+
+
+def export_model(model: dict) -> dict[str, np.ndarray]:
+    """export_forest for a parsed xgboost JSON model (Booster.save_raw("json") loaded with json.loads)."""
+    learner = model["learner"]
+    objective = learner["objective"]["name"]
+    if objective not in IDENTITY_OBJECTIVES:
+        raise ValueError(f"Objective {objective} needs a link function; only {sorted(IDENTITY_OBJECTIVES)} are supported.")
+    if int(learner["learner_model_param"].get("num_target", 1)) != 1:
+        raise ValueError("Only single-target models are supported.")
+    booster = learner["gradient_booster"]
+    if booster["name"] != "gbtree":
+        raise ValueError(f"Booster {booster['name']} is not supported; train with gbtree.")
+
+    feature, threshold, left, right, default_left, value, roots = [], [], [], [], [], [], []
+    max_depth = 0
+    for tree in booster["model"]["trees"]:
+        if any(tree.get("split_type", [])):
+            raise ValueError("Categorical splits are not supported.")
+        offset = len(feature)
+        roots.append(offset)
+        lefts, rights = tree["left_children"], tree["right_children"]
+        depth = [0] * len(lefts)
+        for node, (left_child, right_child) in enumerate(zip(lefts, rights)):
+            is_leaf = left_child == -1
+            feature.append(-1 if is_leaf else tree["split_indices"][node])
+            threshold.append(tree["split_conditions"][node])  # the leaf value on leaves
+            # Leaves point at themselves, so extra steps in predict_forest are no-ops.
+            left.append(offset + (node if is_leaf else left_child))
+            right.append(offset + (node if is_leaf else right_child))
+            default_left.append(bool(tree["default_left"][node]))
+            value.append(tree["split_conditions"][node] if is_leaf else 0.0)
+            if not is_leaf:
+                depth[left_child] = depth[right_child] = depth[node] + 1
+        max_depth = max(max_depth, max(depth))
+
+    return {
+        "feature": np.asarray(feature, dtype=np.int32),
+        "threshold": np.asarray(threshold, dtype=np.float32),
+        "left": np.asarray(left, dtype=np.int32),
+        "right": np.asarray(right, dtype=np.int32),
+        "default_left": np.asarray(default_left, dtype=bool),
+        "value": np.asarray(value, dtype=np.float32),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "base_score": np.float32(parse_base_score(learner["learner_model_param"]["base_score"])),
+        "max_depth": np.int32(max_depth),
+    }
+
+
+def save_forest(forest: dict[str, np.ndarray], path: Path) -> None:
+    np.savez(path, **forest)
+
+
+def load_forest(path: Path) -> dict[str, np.ndarray]:
+    """Node arrays from a .npz written by save_forest, or straight from an xgboost .json model."""
+    path = Path(path)
+    if path.suffix == ".json":
+        return export_forest(path)
+    with np.load(path) as data:
+        return {key: data[key] for key in FOREST_KEYS}
+
+
+def pack_forest(forest: dict[str, np.ndarray]) -> tuple[bytes, dict]:
+    """Node arrays as one blob, plus the small metadata dict unpack_forest needs."""
+    meta = {
+        "nodes": len(forest["feature"]),
+        "trees": len(forest["roots"]),
+        "base_score": float(forest["base_score"]),
+        "max_depth": int(forest["max_depth"]),
+    }
+    blob = b"".join(np.ascontiguousarray(forest[key], dtype=dtype).tobytes() for key, dtype, _ in PACKED_ARRAYS)
+    return blob, meta
+
+
+def unpack_forest(blob, meta: dict) -> dict[str, np.ndarray]:
+    """Read-only array views into `blob` (bytes or a read_bundle memoryview) written by pack_forest."""
+    forest, offset = {}, 0
+    for key, dtype, length in PACKED_ARRAYS:
+        forest[key] = np.frombuffer(blob, dtype=dtype, count=meta[length], offset=offset)
+        offset += meta[length] * np.dtype(dtype).itemsize
+    forest["base_score"] = np.float32(meta["base_score"])
+    forest["max_depth"] = np.int32(meta["max_depth"])
+    return forest
+
+
+# 2. PREDICT ###################################
+
+def predict_forest(forest: dict[str, np.ndarray], X) -> np.ndarray:
+    """Score rows of X (n_rows x n_features, NaN = missing); returns float32 predictions like Booster.predict."""
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X[np.newaxis, :]
+    n_rows, n_features = X.shape
+    # Flat gathers are cheaper than 2-D fancy indexing: X[row, feature] is
+    # values[row * n_features + feature] and child 0/1 is children[2 * node + go_right].
+    values = X.ravel()
+    row_offset = (np.arange(n_rows, dtype=np.intp) * n_features)[:, np.newaxis]
+    feature = np.maximum(forest["feature"], 0).astype(np.intp)
+    children = np.column_stack([forest["left"], forest["right"]]).astype(np.intp).ravel()
+    threshold = forest["threshold"]
+    has_missing = bool(np.isnan(values).any())
+    node = np.tile(forest["roots"].astype(np.intp), (n_rows, 1))
+    for _ in range(int(forest["max_depth"])):
+        x = values[row_offset + feature[node]]
+        go_right = ~(x < threshold[node])
+        if has_missing:
+            go_right = np.where(np.isnan(x), ~forest["default_left"][node], go_right)
+        node = children[2 * node + go_right]
+    return forest["value"][node].sum(axis=1, dtype=np.float32) + forest["base_score"]
+
+
+# 3. CLI ###################################
+
+def check(model_path: Path, n_random: int = 10_000) -> float:
+    """Largest absolute difference from xgboost on all 168 cells plus random rows with missing values."""
+    import xgboost as xgb
+
+    cells = np.arange(168)
+    grid = np.column_stack([cells // 24 + 1, cells % 24]).astype(np.float32)
+    rng = np.random.default_rng(0)
+    noise = np.column_stack([rng.uniform(0, 8, n_random), rng.uniform(-1, 25, n_random)]).astype(np.float32)
+    noise[rng.random(noise.shape) < 0.1] = np.nan
+    X = np.vstack([grid, noise])
+    booster = xgb.Booster(model_file=str(model_path))
+    expected = booster.predict(xgb.DMatrix(X, missing=np.nan, feature_names=booster.feature_names))
+    return float(np.max(np.abs(predict_forest(export_forest(model_path), X) - expected)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export or check the NumPy evaluator for an xgboost JSON model.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write the node arrays of a model to .npz.")
+    export_parser.add_argument("model", type=Path)
+    export_parser.add_argument("output", type=Path)
+    check_parser = commands.add_parser("check", help="Compare predictions with xgboost's Booster.predict.")
+    check_parser.add_argument("model", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        forest = export_forest(args.model)
+        save_forest(forest, args.output)
+        print(f"   trees: {len(forest['roots'])}, nodes: {len(forest['feature'])}, max depth: {int(forest['max_depth'])}")
+        print(f"   saved to {args.output} ({args.output.stat().st_size:,} bytes)")
+    else:
+        print(f"   max abs difference vs Booster.predict: {check(args.model):.3g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,24 +27,27 @@ UNIT_NOTE = "vehicles observed in one representative minute (1m/t1 interval) wit
 # 2. DEFINE TOOL FUNCTION ###################################
 
 def predict_vehicle_count(day_of_week, hours_of_day):
+    # /predict/grid answers 422 for a day outside 1-7, so catch it here with a clear message.
+    if not 1 <= int(day_of_week) <= 7:
+        raise ValueError(f"day_of_week must be an integer between 1 (Monday) and 7 (Sunday); got {day_of_week!r}.")
     hours = [int(h) for h in hours_of_day if 0 <= int(h) <= 23]
     if not hours:
         raise ValueError("hours_of_day must contain at least one integer between 0 and 23.")
 
-    predictions = []
-    for hour in hours:
-        resp = requests.get(
-            f"{ENDPOINT_URL}/predict",
-            params={"day_of_week": int(day_of_week), "hour_of_day": hour},
-            timeout=10,
-        )
-        resp.raise_for_status()
-        predictions.append(
-            {
-                "hour_of_day": hour,
-                "predicted_vehicle_count": float(resp.json()["predicted_vehicle_count"]),
-            }
-        )
+    # One round-trip for all hours: /predict/grid scores them in a single model call.
+    resp = requests.get(
+        f"{ENDPOINT_URL}/predict/grid",
+        params={"days": str(int(day_of_week)), "hours": ",".join(str(hour) for hour in hours)},
+        timeout=10,
+    )
+    resp.raise_for_status()
+    predictions = [
+        {
+            "hour_of_day": int(row["hour_of_day"]),
+            "predicted_vehicle_count": float(row["predicted_vehicle_count"]),
+        }
+        for row in resp.json()["predictions"]
+    ]
 
     return {
         "day_of_week": int(day_of_week),
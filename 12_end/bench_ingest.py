@@ -0,0 +1,247 @@
+# bench_ingest.py
+# Ingest throughput benchmark against the offline Brussels API stand-in
+# Pairs with 01_ingest_traffic.py and fake_brussels_api.py
+#
+# For each monitor count, this script serves a synthetic live payload from
+# fake_brussels_api.py and times every stage of the ingest path:
+# - fetch: HTTP round trip including the body
+# - decode: response.json()
+# - adapter: parse_brussels_counts on the decoded payload (cold time cache)
+# - time parse: parse_bxl_time_to_utc per end_time, uncached and cached
+# - insert: insert_rows into a fresh traffic.db, new rows and all-duplicate rows
+# - end to end: 01_ingest_traffic.run_once against the stand-in
+# Each stage reports the median of --repeat runs. Save a run with --json and
+# pass it to a later run as --baseline to fail on regressions.
+
+# Run from inside the 12_end/ directory so the paths resolve correctly.
+# Git bash: cd 12_end && python bench_ingest.py
+# Git bash: cd 12_end && python bench_ingest.py --monitors 100 1000 10000 100000 --json data/bench_ingest.json
+# Git bash: cd 12_end && python bench_ingest.py --baseline data/bench_ingest.json --tolerance 1.5
+# Git bash: cd 12_end && python bench_ingest.py --error-429 0.2 --latency-ms 50
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import platform
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from fake_brussels_api import start_in_thread
+from traffic_sources import get_with_retry, load_sources, make_session, parse_bxl_time_to_utc
+from traffic_store import connect_store, insert_rows
+
+ingest = importlib.import_module("01_ingest_traffic")
+
+## 0.2 Settings #################################
+
+SOURCE_NAME = "brussels_mobility_traffic_counts"
+DEFAULT_MONITORS = [100, 1000, 10000]
+
+# Stages compared against --baseline (seconds, lower is better).
+TIMED_STAGES = ("fetch_seconds", "decode_seconds", "adapter_seconds", "insert_seconds", "end_to_end_seconds")
+
+
+# 1. MEASURE ###################################
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    value = fn(*args, **kwargs)
+    return value, time.perf_counter() - started
+
+
+def bench_once(source: dict, session, all_intervals: bool) -> dict:
+    """One pass over every stage; returns seconds per stage plus row counts."""
+    params = dict(source["params"], includeLanes="true") if all_intervals else source["params"]
+    response, fetch_seconds = timed(get_with_retry, source["url"], params=params, session=session)
+    payload, decode_seconds = timed(response.json)
+
+    parse_bxl_time_to_utc.cache_clear()
+    rows, adapter_seconds = timed(source["parse"], payload, source["metro_id"])
+
+    end_times = [
+        ((monitor.get("results") or {}).get("1m") or {}).get("t1", {}).get("end_time", "")
+        for monitor in payload["data"].values()
+    ]
+    uncached = parse_bxl_time_to_utc.__wrapped__
+    _, time_parse_uncached = timed(lambda: [uncached(value) for value in end_times])
+    parse_bxl_time_to_utc.cache_clear()
+    _, time_parse_cached = timed(lambda: [parse_bxl_time_to_utc(value) for value in end_times])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = connect_store(Path(tmp) / "bench.db")
+        with conn:
+            inserted, insert_seconds = timed(insert_rows, conn, rows)
+        with conn:
+            _, duplicate_seconds = timed(insert_rows, conn, rows)
+        conn.close()
+
+        # End to end through the real runner, on its own fresh database.
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            try:
+                ingest.run_once([source], all_intervals=all_intervals, db_path=Path(tmp) / "e2e.db")
+                error = None
+            except SystemExit as exc:
+                error = str(exc)
+            end_to_end_seconds = time.perf_counter() - started
+
+    return {
+        "rows": len(rows),
+        "inserted_rows": inserted,
+        "payload_bytes": len(response.content),
+        "fetch_seconds": fetch_seconds,
+        "decode_seconds": decode_seconds,
+        "adapter_seconds": adapter_seconds,
+        "time_parse_uncached_seconds": time_parse_uncached,
+        "time_parse_cached_seconds": time_parse_cached,
+        "insert_seconds": insert_seconds,
+        "duplicate_insert_seconds": duplicate_seconds,
+        "end_to_end_seconds": end_to_end_seconds,
+        "end_to_end_error": error,
+    }
+
+
+def summarize(passes: list[dict], monitors: int | None) -> dict:
+    """Median of each timing across passes, plus derived rates."""
+    result = {"monitors": monitors, "repeat": len(passes)}
+    for key in passes[0]:
+        values = [p[key] for p in passes]
+        if key.endswith("_seconds"):
+            result[key] = statistics.median(values)
+        elif key == "end_to_end_error":
+            result[key] = next((value for value in values if value), None)
+        else:
+            result[key] = values[-1]
+    rows = max(result["rows"], 1)
+    result["time_parse_uncached_us_per_call"] = result["time_parse_uncached_seconds"] / rows * 1e6
+    result["time_parse_cached_us_per_call"] = result["time_parse_cached_seconds"] / rows * 1e6
+    result["insert_rows_per_second"] = result["rows"] / result["insert_seconds"] if result["insert_seconds"] else None
+    result["duplicate_rows_per_second"] = (
+        result["rows"] / result["duplicate_insert_seconds"] if result["duplicate_insert_seconds"] else None
+    )
+    return result
+
+
+# 2. REPORT ###################################
+
+def print_result(result: dict) -> None:
+    label = f"{result['monitors']} monitors" if result["monitors"] is not None else "external server"
+    print(f"\n   {label}: {result['rows']} rows, {result['payload_bytes']:,} payload bytes (median of {result['repeat']})")
+    print(f"   fetch: {result['fetch_seconds']:.4f}s")
+    print(f"   decode json: {result['decode_seconds']:.4f}s")
+    print(f"   adapter parse: {result['adapter_seconds']:.4f}s")
+    print(
+        f"   parse_bxl_time_to_utc: {result['time_parse_uncached_us_per_call']:.2f} us/call uncached, "
+        f"{result['time_parse_cached_us_per_call']:.2f} us/call cached"
+    )
+    print(f"   insert: {result['insert_seconds']:.4f}s ({result['insert_rows_per_second'] or 0:,.0f} rows/s)")
+    print(
+        f"   duplicate insert: {result['duplicate_insert_seconds']:.4f}s "
+        f"({result['duplicate_rows_per_second'] or 0:,.0f} rows/s)"
+    )
+    print(f"   end to end (run_once): {result['end_to_end_seconds']:.4f}s")
+    if result["end_to_end_error"]:
+        print(f"   end to end error: {result['end_to_end_error']}")
+
+
+def compare_to_baseline(results: list[dict], baseline_path: Path, tolerance: float, all_intervals: bool) -> list[str]:
+    """Return one message per stage slower than `tolerance` x its baseline for the same monitor count."""
+    report = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if report.get("all_intervals", False) != all_intervals:
+        raise SystemExit(f"{baseline_path} was recorded with a different --all-intervals setting.")
+    baseline = {entry["monitors"]: entry for entry in report["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["monitors"])
+        if before is None:
+            continue
+        for stage in TIMED_STAGES:
+            if before.get(stage) and result[stage] > before[stage] * tolerance:
+                regressions.append(
+                    f"{result['monitors']} monitors {stage}: {result[stage]:.4f}s vs baseline {before[stage]:.4f}s"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the ingest path against a local Brussels API stand-in.")
+    parser.add_argument("--monitors", type=int, nargs="+", default=DEFAULT_MONITORS, help="Monitor counts to test.")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes per monitor count; medians are reported (default: 3).")
+    parser.add_argument("--all-intervals", action="store_true", help="Request lanes and time the --all-intervals runner.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Stand-in delay per request.")
+    parser.add_argument("--error-429", type=float, default=0.0, help="Share of stand-in requests answered 429.")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="Share of stand-in requests answered 503.")
+    parser.add_argument("--url", help="Benchmark an already running stand-in (or recorded server) instead of starting one.")
+    parser.add_argument("--json", type=Path, dest="json_path", help="Write results to this JSON file.")
+    parser.add_argument("--baseline", type=Path, help="Earlier --json output to compare against.")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed slowdown vs --baseline (default: 1.5x).")
+    args = parser.parse_args()
+
+    source = next(iter(load_sources(only=[SOURCE_NAME])), None)
+    if source is None:
+        raise SystemExit(f"{SOURCE_NAME} is not configured in sources.csv.")
+
+    print("\n====================================================")
+    print("bench_ingest.py | ingest throughput benchmark")
+    print("====================================================")
+
+    server = None
+    if args.url:
+        source = dict(source, url=args.url)
+        sizes = [None]
+    else:
+        server, url = start_in_thread(
+            latency_ms=args.latency_ms, error_429=args.error_429, error_5xx=args.error_5xx, retry_after=0,
+        )
+        source = dict(source, url=url)
+        sizes = args.monitors
+    print(f"   api: {source['url']}")
+
+    session = make_session()
+    results = []
+    try:
+        for monitors in sizes:
+            if server is not None:
+                server.settings["monitors"] = monitors
+            # One untimed pass warms the payload cache and the connection pool.
+            bench_once(source, session, args.all_intervals)
+            passes = [bench_once(source, session, args.all_intervals) for _ in range(max(args.repeat, 1))]
+            result = summarize(passes, monitors)
+            print_result(result)
+            results.append(result)
+    finally:
+        session.close()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            print(f"\n   stand-in stats: {server.stats}")
+
+    if args.json_path:
+        report = {
+            "created_at": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "all_intervals": args.all_intervals,
+            "results": results,
+        }
+        args.json_path.parent.mkdir(parents=True, exist_ok=True)
+        args.json_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"   results written: {args.json_path}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance, args.all_intervals)
+        if regressions:
+            raise SystemExit("Ingest regressions vs baseline:\n   " + "\n   ".join(regressions))
+        print(f"   no stage slower than {args.tolerance}x baseline")
+
+
+if __name__ == "__main__":
+    main()
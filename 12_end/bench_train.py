@@ -0,0 +1,200 @@
+# bench_train.py
+# Training benchmark: stage timings and peak memory at 1M, 10M, 100M rows
+# Pairs with 02_train_model.py and synth_traffic.py
+#
+# For each --rows size this script builds (once, then reuses) a synthetic
+# traffic.db with synth_traffic.py, then runs each training mode in its own
+# child process so peak RSS is per mode. It calls 02_train_model.py's own
+# train_stats / train_raw, which report these stages through their `mark`
+# callback:
+# - load: rows or cell statistics out of SQLite (raw mode's day_of_week /
+#   hour_of_day are computed in SQL here, see traffic_store.read_features)
+# - features: train/test split and the label / weight / index arrays
+# - dmatrix: xgb.DMatrix construction (train and test in raw mode)
+# - train: xgb.train with PARAMS and NUM_BOOST_ROUND (never tuningpy.json,
+#   so runs stay comparable)
+# - evaluate: predictions, RMSE / R-squared and per-cell standard errors
+# Save a run with --json (it records the git commit) and pass it to a later
+# run as --baseline to fail on regressions, as bench_ingest.py does.
+
+# Run from inside the 12_end/ directory so the paths resolve correctly.
+# Git bash: cd 12_end && python bench_train.py
+# Git bash: cd 12_end && python bench_train.py --rows 1000000 10000000 100000000 --json data/bench_train.json
+# Git bash: cd 12_end && python bench_train.py --baseline data/bench_train.json --tolerance 1.5
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse
+import importlib
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+import xgboost as xgb
+
+from synth_traffic import DEFAULT_MONITORS, count_rows, generate
+
+train = importlib.import_module("02_train_model")
+
+## 0.2 Settings #################################
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DEFAULT_WORKDIR = Path(tempfile.gettempdir()) / "bench_train"
+DEFAULT_ROWS = [1_000_000, 10_000_000]
+MODES = ("stats", "raw")
+STAGES = ("load", "features", "dmatrix", "train", "evaluate")
+MIN_COMPARED_SECONDS = 0.05  # faster stages are timer noise; --baseline skips them
+
+
+# 1. STAGES ###################################
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+RUNNERS = {"stats": train.train_stats, "raw": train.train_raw}
+
+
+def run_worker(mode: str, db_path: Path) -> dict:
+    """Child-process entry point: one mode on one database."""
+    rss_before = peak_rss_mb()
+    seconds = {}
+    last = time.perf_counter()
+
+    def mark(stage: str) -> None:
+        nonlocal last
+        now = time.perf_counter()
+        seconds[stage] = now - last
+        last = now
+
+    # PARAMS / NUM_BOOST_ROUND, never a tuningpy.json, so runs stay comparable.
+    train.TUNING_PATH = db_path.parent / "no_tuning.json"
+    conn = train.open_store(db_path, db_path.parent / "no_segments")
+    _, metrics = RUNNERS[mode](conn, mark)
+    conn.close()
+    rss_after = peak_rss_mb()
+    return {
+        "mode": mode,
+        **{f"{stage}_seconds": seconds[stage] for stage in STAGES},
+        "total_seconds": sum(seconds.values()),
+        "peak_rss_mb": rss_after,
+        "peak_rss_added_mb": rss_after - rss_before if rss_after is not None else None,
+        **{key: metrics[key] for key in ("train_rows", "test_rows", "test_rmse", "test_r_squared")},
+    }
+
+
+# 2. REPORT ###################################
+
+def git_commit() -> str | None:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip()
+
+
+def print_result(result: dict) -> None:
+    stages = ", ".join(f"{stage} {result[f'{stage}_seconds']:.2f}s" for stage in STAGES)
+    rss = f"{result['peak_rss_mb']:,.0f} MB peak RSS" if result["peak_rss_mb"] is not None else "peak RSS n/a"
+    print(f"   {result['mode']}: {result['total_seconds']:.2f}s ({stages}), {rss}, testing RMSE {result['test_rmse']:.2f}")
+
+
+def compare_to_baseline(results: list[dict], baseline_path: Path, tolerance: float) -> list[str]:
+    """Return one message per stage slower than `tolerance` x its baseline for the same rows and mode."""
+    report = json.loads(baseline_path.read_text(encoding="utf-8"))
+    baseline = {(entry["rows"], entry["mode"]): entry for entry in report["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get((result["rows"], result["mode"]))
+        if before is None:
+            continue
+        for key in [f"{stage}_seconds" for stage in STAGES] + ["total_seconds"]:
+            if (before.get(key) or 0) >= MIN_COMPARED_SECONDS and result[key] > before[key] * tolerance:
+                regressions.append(
+                    f"{result['rows']:,} rows {result['mode']} {key}: {result[key]:.3f}s vs baseline {before[key]:.3f}s"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark 02_train_model.py stages on synthetic traffic.db files.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="Database sizes to test (default: 1M 10M).")
+    parser.add_argument("--monitors", type=int, default=DEFAULT_MONITORS, help=f"Synthetic monitors (default: {DEFAULT_MONITORS}).")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR, help=f"Where the synthetic databases live (default: {DEFAULT_WORKDIR}).")
+    parser.add_argument("--json", type=Path, dest="json_path", help="Write results to this JSON file.")
+    parser.add_argument("--baseline", type=Path, help="Earlier --json output to compare against.")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed slowdown vs --baseline (default: 1.5x).")
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--db", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.db)))
+        return
+
+    print("\n====================================================")
+    print("bench_train.py | training stage benchmark")
+    print("====================================================")
+    args.workdir.mkdir(parents=True, exist_ok=True)
+    results = []
+    generation = []
+    for rows in args.rows:
+        db_path = args.workdir / f"synth_{rows}_{args.monitors}.db"
+        if count_rows(db_path) != rows:
+            stats = generate(db_path, rows, args.monitors)
+            generation.append(stats)
+            print(
+                f"\n   generated {rows:,} rows in {stats['insert_seconds'] + stats['rollup_seconds']:.1f}s "
+                f"({stats['rows_per_second']:,.0f} rows/s, {stats['bytes']:,} bytes)"
+            )
+        else:
+            print(f"\n   reusing {db_path} ({rows:,} rows)")
+        for mode in args.modes:
+            completed = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "--worker", mode, "--db", str(db_path)],
+                cwd=SCRIPT_DIR, capture_output=True, text=True, check=True,
+            )
+            result = {"rows": rows, "monitors": args.monitors, **json.loads(completed.stdout.strip().splitlines()[-1])}
+            print_result(result)
+            results.append(result)
+
+    if args.json_path:
+        report = {
+            "created_at": time.time(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "xgboost": xgb.__version__,
+            "platform": platform.platform(),
+            "generation": generation,
+            "results": results,
+        }
+        args.json_path.parent.mkdir(parents=True, exist_ok=True)
+        args.json_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"   results written: {args.json_path}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            raise SystemExit("Training regressions vs baseline:\n   " + "\n   ".join(regressions))
+        print(f"   no stage slower than {args.tolerance}x baseline")
+
+
+if __name__ == "__main__":
+    main()
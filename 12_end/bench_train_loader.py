@@ -0,0 +1,170 @@
+# bench_train_loader.py
+# Time and memory of the raw-mode training loader, pandas path vs typed NumPy path
+# Pairs with 02_train_model.py
+#
+# Builds (once) a scratch traffic.db with --rows synthetic minutes from
+# synth_traffic.py (raw rows only, no rollups), then runs each loader in its
+# own child process so peak RSS is not shared:
+# - pandas: the original 02_train_model.py path. read_traffic -> DataFrame ->
+#   pd.to_datetime -> .dt accessors -> row_id / sample / isin / drop -> to_numpy.
+# - numpy: 02_train_model.load_arrays (features computed in SQL, cursor chunks
+#   copied into preallocated int8/int32 arrays) plus a permutation split.
+# Both stop once X_train, y_train, X_test and y_test exist; no model is trained.
+
+# Run from inside the 12_end/ directory so the paths resolve correctly.
+# Git bash: cd 12_end && python bench_train_loader.py --rows 10000000
+# Git bash: cd 12_end && python bench_train_loader.py --rows 1000000 --json data/bench_train_loader.json
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse
+import importlib
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+from synth_traffic import count_rows, generate
+from traffic_store import connect_store, read_traffic
+
+train = importlib.import_module("02_train_model")
+
+## 0.2 Settings #################################
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DEFAULT_DB = Path(tempfile.gettempdir()) / "bench_train_loader.db"
+LOADERS = ("pandas", "numpy")
+
+
+# 1. LOADERS ###################################
+
+def load_pandas(conn) -> tuple:
+    """The loader 02_train_model.py used before typed arrays, kept here as the baseline."""
+    df = pd.DataFrame(read_traffic(conn, train.METRO_ID).fetchall(), columns=["observed_at", "vehicles"])
+    df["observed_at"] = pd.to_datetime(df["observed_at"], unit="s", utc=True)
+    df["day_of_week"] = df["observed_at"].dt.dayofweek + 1
+    df["hour_of_day"] = df["observed_at"].dt.hour
+    df = df.reset_index(drop=True)
+    df["row_id"] = np.arange(1, len(df) + 1)
+    train_df = df.sample(frac=0.8)
+    test_df = df[~df["row_id"].isin(train_df["row_id"])].copy()
+    train_df = train_df.drop(columns=["row_id"])
+    test_df = test_df.drop(columns=["row_id"])
+    return (
+        train_df[train.FEATURES].to_numpy(), train_df["vehicles"].to_numpy(),
+        test_df[train.FEATURES].to_numpy(), test_df["vehicles"].to_numpy(),
+    )
+
+
+def load_numpy(conn) -> tuple:
+    X, y, _ = train.load_arrays(conn)
+    order = np.random.default_rng().permutation(len(y))
+    n_train = int(round(0.8 * len(y)))
+    train_idx, test_idx = order[:n_train], order[n_train:]
+    return X[train_idx], y[train_idx], X[test_idx], y[test_idx]
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+def run_worker(loader: str, db_path: Path) -> dict:
+    """Child-process entry point: run one loader and report time and memory."""
+    conn = connect_store(db_path)
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    X_train, y_train, X_test, y_test = (load_pandas if loader == "pandas" else load_numpy)(conn)
+    seconds = time.perf_counter() - started
+    rss_after = peak_rss_mb()
+    conn.close()
+    return {
+        "loader": loader,
+        "rows": int(len(y_train) + len(y_test)),
+        "seconds": seconds,
+        "peak_rss_mb": rss_after,
+        "peak_rss_added_mb": rss_after - rss_before if rss_after is not None else None,
+        "array_mb": sum(a.nbytes for a in (X_train, y_train, X_test, y_test)) / 1024 ** 2,
+        "dtypes": {"X": str(X_train.dtype), "y": str(y_train.dtype)},
+    }
+
+
+# 2. RUN ###################################
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the pandas and typed NumPy training loaders.")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Synthetic rows in the scratch database (default: 10M).")
+    parser.add_argument("--monitors", type=int, default=100, help="Monitors the rows are spread over (default: 100).")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB, help=f"Scratch database (default: {DEFAULT_DB}).")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the scratch database even if it has --rows rows.")
+    parser.add_argument("--loaders", nargs="+", choices=LOADERS, default=list(LOADERS))
+    parser.add_argument("--json", type=Path, dest="json_path", help="Write results to this JSON file.")
+    parser.add_argument("--worker", choices=LOADERS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.db)))
+        return
+
+    print("\n====================================================")
+    print("bench_train_loader.py | raw training loader")
+    print("====================================================")
+    existing = 0 if args.rebuild else count_rows(args.db)
+    if existing != args.rows:
+        started = time.perf_counter()
+        generate(args.db, args.rows, args.monitors, rollups=False)  # the loaders read raw rows only
+        print(f"   built {args.db} with {args.rows:,} rows in {time.perf_counter() - started:.1f}s")
+    else:
+        print(f"   reusing {args.db} ({existing:,} rows)")
+
+    results = []
+    for loader in args.loaders:
+        completed = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--worker", loader, "--db", str(args.db)],
+            cwd=SCRIPT_DIR, capture_output=True, text=True, check=True,
+        )
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append(result)
+        rss = f"{result['peak_rss_mb']:,.0f} MB peak RSS (+{result['peak_rss_added_mb']:,.0f} MB while loading)" \
+            if result["peak_rss_mb"] is not None else "peak RSS n/a"
+        print(f"   {loader}: {result['seconds']:.2f}s, {rss}, arrays {result['array_mb']:,.0f} MB "
+              f"(X {result['dtypes']['X']}, y {result['dtypes']['y']})")
+
+    if len(results) == 2:
+        pandas_result, numpy_result = results if results[0]["loader"] == "pandas" else results[::-1]
+        print(f"   speedup: {pandas_result['seconds'] / numpy_result['seconds']:.1f}x")
+        if pandas_result["peak_rss_added_mb"] and numpy_result["peak_rss_added_mb"]:
+            ratio = pandas_result["peak_rss_added_mb"] / max(numpy_result["peak_rss_added_mb"], 1e-9)
+            print(f"   loading memory: {ratio:.1f}x less")
+
+    if args.json_path:
+        report = {
+            "created_at": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rows": args.rows,
+            "monitors": args.monitors,
+            "results": results,
+        }
+        args.json_path.parent.mkdir(parents=True, exist_ok=True)
+        args.json_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"   results written: {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
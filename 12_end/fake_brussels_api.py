@@ -0,0 +1,257 @@
+# fake_brussels_api.py
+# Offline stand-in for the Brussels traffic counts API
+# Pairs with 01_ingest_traffic.py and bench_ingest.py
+#
+# Serves `request=live` and `request=history` payloads shaped like
+# data.mobility.brussels/traffic/api/counts/, so the ingest can be exercised
+# and benchmarked without touching the real API. Payloads are either
+# synthetic (any number of monitors, 100 to 100k) or a recorded live payload
+# saved to a JSON file. Latency and 429/5xx responses can be injected to
+# exercise the retry path in traffic_sources.get_with_retry.
+#
+# Standard library only.
+
+# Run from inside the 12_end/ directory so the paths resolve correctly.
+# Git bash: cd 12_end && python fake_brussels_api.py --monitors 10000 --port 8765
+# Git bash: cd 12_end && python fake_brussels_api.py --recorded data/live_sample.json --error-429 0.1
+# Then point the ingest at it from another shell:
+# Git bash: cd 12_end && python bench_ingest.py --url http://127.0.0.1:8765/traffic/api/counts/
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from zoneinfo import ZoneInfo
+
+## 0.2 Settings #################################
+
+BRUSSELS_TZ = ZoneInfo("Europe/Brussels")
+API_PATH = "/traffic/api/counts/"
+INTERVALS = ("1m", "5m", "15m", "60m")
+TRAVERSES = ("t1", "t2")
+LANES_PER_MONITOR = 2
+
+
+# 1. PAYLOADS ###################################
+
+def monitor_ids(n_monitors: int) -> list[str]:
+    return [f"SYN_{i:06d}" for i in range(n_monitors)]
+
+
+def interval_end(now: float, minutes: int) -> datetime:
+    """Brussels-local end of the last completed `minutes` interval before `now`."""
+    local = datetime.fromtimestamp(now, tz=BRUSSELS_TZ).replace(second=0, microsecond=0)
+    return local - timedelta(minutes=local.minute % minutes)
+
+
+def synthetic_block(rng: random.Random, end_times: dict[str, str], scale: float = 1.0) -> dict:
+    """One `results` mapping: every interval and traverse with plausible counts."""
+    results = {}
+    for interval in INTERVALS:
+        minutes = int(interval[:-1])
+        results[interval] = {
+            traverse: {
+                "count": int(rng.randint(0, 30) * minutes * scale),
+                "speed": round(rng.uniform(-1.0, 90.0), 1),  # the real API uses -1 for "no speed"
+                "occupancy": round(rng.uniform(0.0, 40.0), 1),
+                "end_time": end_times[interval],
+            }
+            for traverse in TRAVERSES
+        }
+    return results
+
+
+@lru_cache(maxsize=8)
+def live_payload(n_monitors: int, minute: int, lanes: bool) -> bytes:
+    """Encoded synthetic live payload; cached per minute because end_time only changes once a minute."""
+    now = minute * 60
+    end_times = {
+        interval: interval_end(now, int(interval[:-1])).strftime("%Y/%m/%d %H:%M") for interval in INTERVALS
+    }
+    rng = random.Random(n_monitors * 1_000_003 + minute)
+    data = {}
+    for monitor_id in monitor_ids(n_monitors):
+        monitor = {"results": synthetic_block(rng, end_times)}
+        if lanes:
+            monitor["lanes"] = {
+                str(lane): {"results": synthetic_block(rng, end_times, scale=1 / LANES_PER_MONITOR)}
+                for lane in range(1, LANES_PER_MONITOR + 1)
+            }
+        data[monitor_id] = monitor
+    return json.dumps({"data": data}, separators=(",", ":")).encode("utf-8")
+
+
+def history_payload(monitor_id: str, start: date, end: date) -> bytes:
+    """One traverse's 1-minute entries for an inclusive Brussels-local date range."""
+    rng = random.Random(f"{monitor_id}:{start}:{end}")
+    local = datetime(start.year, start.month, start.day, tzinfo=BRUSSELS_TZ)
+    stop = datetime(end.year, end.month, end.day, tzinfo=BRUSSELS_TZ) + timedelta(days=1)
+    entries = []
+    while local < stop:
+        local += timedelta(minutes=1)
+        entries.append(
+            {
+                "count": rng.randint(0, 30),
+                "speed": round(rng.uniform(0.0, 90.0), 1),
+                "occupancy": round(rng.uniform(0.0, 40.0), 1),
+                "end_time": local.strftime("%Y/%m/%d %H:%M"),
+            }
+        )
+    return json.dumps({"data": entries}, separators=(",", ":")).encode("utf-8")
+
+
+# 2. SERVER ###################################
+
+class FakeBrusselsHandler(BaseHTTPRequestHandler):
+    """Answers GET requests from the settings dict on `self.server.settings`."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API behind its proxy
+
+    def do_GET(self):
+        settings = self.server.settings
+        stats = self.server.stats
+        with self.server.lock:
+            stats["requests"] += 1
+
+        latency = settings["latency_ms"] + random.uniform(0, settings["jitter_ms"])
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+        roll = random.random()
+        if roll < settings["error_429"]:
+            return self.send_error_status(429, "rate_limited", {"Retry-After": str(settings["retry_after"])})
+        if roll < settings["error_429"] + settings["error_5xx"]:
+            return self.send_error_status(503, "server_errors")
+
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path.rstrip("/") != API_PATH.rstrip("/"):
+            return self.send_error_status(404, "not_found")
+        if query.get("request", "live") == "history":
+            try:
+                start = datetime.strptime(query["startDate"], "%Y%m%d").date()
+                end = datetime.strptime(query["endDate"], "%Y%m%d").date()
+                body = history_payload(query["featureID"], start, end)
+            except (KeyError, ValueError):
+                return self.send_error_status(400, "bad_requests")
+        elif settings["recorded"] is not None:
+            body = settings["recorded"]
+        else:
+            lanes = query.get("includeLanes", "false").lower() == "true"
+            body = live_payload(settings["monitors"], int(time.time()) // 60, lanes)
+
+        with self.server.lock:
+            stats["bytes_sent"] += len(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_status(self, status: int, counter: str, headers: dict | None = None):
+        with self.server.lock:
+            self.server.stats[counter] += 1
+        body = json.dumps({"error": status}).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.settings["verbose"]:
+            super().log_message(format, *args)
+
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    monitors: int = 1000,
+    recorded: Path | None = None,
+    latency_ms: float = 0.0,
+    jitter_ms: float = 0.0,
+    error_429: float = 0.0,
+    error_5xx: float = 0.0,
+    retry_after: int = 1,
+    verbose: bool = False,
+) -> ThreadingHTTPServer:
+    """Build (but do not start) the stand-in. Port 0 picks a free port.
+
+    `server.settings` can be changed between requests, e.g. to step the
+    monitor count in a benchmark. `server.stats` counts requests and errors.
+    """
+    if not 0 <= error_429 + error_5xx <= 1:
+        raise ValueError("error_429 + error_5xx must be between 0 and 1.")
+    server = ThreadingHTTPServer((host, port), FakeBrusselsHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.settings = {
+        "monitors": int(monitors),
+        "recorded": Path(recorded).read_bytes() if recorded else None,
+        "latency_ms": float(latency_ms),
+        "jitter_ms": float(jitter_ms),
+        "error_429": float(error_429),
+        "error_5xx": float(error_5xx),
+        "retry_after": int(retry_after),
+        "verbose": verbose,
+    }
+    server.stats = {"requests": 0, "rate_limited": 0, "server_errors": 0, "not_found": 0, "bad_requests": 0, "bytes_sent": 0}
+    return server
+
+
+def start_in_thread(**settings) -> tuple[ThreadingHTTPServer, str]:
+    """Start the stand-in on a background thread; return (server, API URL). Call server.shutdown() when done."""
+    server = make_server(**settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}{API_PATH}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve fake Brussels traffic API payloads locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--monitors", type=int, default=1000, help="Synthetic monitors per live payload (default: 1000).")
+    parser.add_argument("--recorded", type=Path, help="Serve this saved live payload (JSON) instead of synthetic data.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added delay per request.")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Extra random delay, 0 to this many ms.")
+    parser.add_argument("--error-429", type=float, default=0.0, help="Share of requests answered 429 with Retry-After.")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="Share of requests answered 503.")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429 (default: 1).")
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args()
+
+    try:
+        server = make_server(
+            host=args.host, port=args.port, monitors=args.monitors, recorded=args.recorded,
+            latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_429=args.error_429,
+            error_5xx=args.error_5xx, retry_after=args.retry_after, verbose=args.verbose,
+        )
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    host, port = server.server_address[:2]
+    source = f"recorded payload {args.recorded}" if args.recorded else f"{args.monitors} synthetic monitors"
+    print(f"   serving {source} at http://{host}:{port}{API_PATH} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"   stats: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
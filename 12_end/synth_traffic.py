@@ -0,0 +1,175 @@
+# synth_traffic.py
+# Synthetic traffic.db generator for training benchmarks
+# Pairs with bench_train.py and bench_train_loader.py
+#
+# Writes one-minute rows for many monitors straight into a fresh traffic.db
+# (schema from traffic_store.py), shaped like the Brussels counts:
+# - a 7 x 24 weekly profile in UTC: weekday morning and evening rush hours,
+#   a flatter weekend midday hump, quiet nights
+# - a per-monitor scale, so busy and quiet monitors coexist
+# - per-monitor start days staggered over a week, so every day_of_week /
+#   hour_of_day cell has rows even when each monitor holds only a day or two
+# - noise on every minute; speed drops and occupancy rises with the load
+# Every random value comes from one numpy Generator seeded with --seed, so
+# the same arguments write the same rows. Rows are built as numpy arrays one
+# block of monitors at a time, in primary-key order, and handed to
+# executemany. The hourly-rollup trigger is dropped for the bulk insert and
+# restored at the end; the rollups are rebuilt with one GROUP BY, which is
+# far cheaper than one upsert per row.
+
+# Run from inside the 12_end/ directory so the paths resolve correctly.
+# Git bash: cd 12_end && python synth_traffic.py --rows 10000000 --monitors 500 --db /tmp/synth_traffic.db
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+
+from traffic_store import SCHEMA_V3, connect_store
+
+## 0.2 Settings #################################
+
+METRO_ID = 948
+START_EPOCH = 1_735_689_600  # 2025-01-01 00:00 UTC, a Wednesday
+DEFAULT_MONITORS = 500
+BLOCK_ROWS = 1 << 20  # rows built and inserted per executemany call
+
+
+# 1. PROFILE ###################################
+
+def weekly_profile() -> list[tuple[int, float, float, float]]:
+    """(cell, vehicles, speed, occupancy) per (day_of_week - 1) * 24 + hour_of_day cell, UTC."""
+    profile = []
+    for cell in range(168):
+        day, hour = divmod(cell, 24)
+        if day < 5:
+            load = 2 + 16 * math.exp(-((hour - 7) ** 2) / 3) + 14 * math.exp(-((hour - 16) ** 2) / 4) + 6 * (6 <= hour <= 19)
+        else:
+            load = 2 + 9 * math.exp(-((hour - 13) ** 2) / 12)
+        if day == 4:
+            load *= 1.05  # Friday
+        speed = 55 - 1.1 * load
+        occupancy = 1.2 * load
+        profile.append((cell, load, speed, occupancy))
+    return profile
+
+
+# 2. GENERATE ###################################
+
+def generate(
+    db_path: Path,
+    rows: int,
+    monitors: int = DEFAULT_MONITORS,
+    seed: int = 0,
+    rollups: bool = True,
+    metro_id: int = METRO_ID,
+) -> dict:
+    """Replace `db_path` with a traffic.db holding `rows` synthetic minutes; return timings."""
+    db_path = Path(db_path)
+    db_path.unlink(missing_ok=True)
+    conn = connect_store(db_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("DROP TRIGGER traffic_counts_rollup")
+
+    rng = np.random.default_rng(seed)
+    conn.executemany(
+        "INSERT INTO monitors (monitor_key, metro_id, monitor_id) VALUES (?, ?, ?)",
+        [(key, metro_id, f"SYN_{key:06d}") for key in range(1, monitors + 1)],
+    )
+    conn.commit()
+    _, profile_vehicles, profile_speed, profile_occupancy = (np.array(column) for column in zip(*weekly_profile()))
+    scales = rng.lognormal(0, 0.5, monitors)
+    per_monitor = -(-rows // monitors)
+    block_monitors = max(1, BLOCK_ROWS // per_monitor)
+    minutes = np.arange(per_monitor, dtype=np.int64) * 60
+
+    started = time.perf_counter()
+    written = 0
+    with conn:
+        for first in range(0, monitors, block_monitors):
+            if written >= rows:
+                break
+            keys = np.arange(first + 1, min(first + block_monitors, monitors) + 1)
+            observed_at = (START_EPOCH + (keys[:, None] % 7) * 86400 + minutes).ravel()
+            monitor_key = np.repeat(keys, per_monitor)
+            scale = np.repeat(scales[keys - 1], per_monitor)
+            keep = min(len(observed_at), rows - written)
+            observed_at, monitor_key, scale = observed_at[:keep], monitor_key[:keep], scale[:keep]
+            cell = ((observed_at // 86400 + 3) % 7) * 24 + (observed_at % 86400) // 3600
+            u = rng.random((3, keep))
+            vehicles = (profile_vehicles[cell] * scale * (0.5 + u[0])).astype(np.int64)
+            speed = np.round(np.maximum(profile_speed[cell] * (0.85 + 0.3 * u[1]), 0.0), 1)
+            occupancy = np.round(np.minimum(profile_occupancy[cell] * scale * (0.6 + 0.8 * u[2]), 100.0), 1)
+            conn.executemany(
+                "INSERT INTO traffic_counts (monitor_key, observed_at, vehicles, speed, occupancy) VALUES (?, ?, ?, ?, ?)",
+                zip(monitor_key.tolist(), observed_at.tolist(), vehicles.tolist(), speed.tolist(), occupancy.tolist()),
+            )
+            written += keep
+    insert_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if rollups:
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO traffic_rollup_hourly (
+                  monitor_key, obs_date, hour_of_day, n, vehicles_sum, vehicles_sumsq, vehicles_min, vehicles_max
+                )
+                SELECT monitor_key, observed_at / 86400, (observed_at % 86400) / 3600,
+                       COUNT(*), SUM(vehicles), SUM(vehicles * vehicles), MIN(vehicles), MAX(vehicles)
+                FROM traffic_counts
+                WHERE vehicles IS NOT NULL
+                GROUP BY 1, 2, 3
+            """
+            )
+    conn.executescript(SCHEMA_V3)  # restores the trigger (CREATE ... IF NOT EXISTS), with or without rollups
+    rollup_seconds = time.perf_counter() - started
+    conn.close()
+    return {
+        "rows": rows,
+        "monitors": monitors,
+        "insert_seconds": insert_seconds,
+        "rollup_seconds": rollup_seconds,
+        "rows_per_second": rows / insert_seconds if insert_seconds else None,
+        "bytes": db_path.stat().st_size,
+    }
+
+
+def count_rows(db_path: Path) -> int:
+    """Raw rows in an existing file, 0 if it does not exist."""
+    if not Path(db_path).exists():
+        return 0
+    conn = connect_store(db_path)
+    n = int(conn.execute("SELECT COUNT(*) FROM traffic_counts").fetchone()[0])
+    conn.close()
+    return n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write a synthetic traffic.db for training benchmarks.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="One-minute rows to write (default: 1M).")
+    parser.add_argument("--monitors", type=int, default=DEFAULT_MONITORS, help=f"Monitors (default: {DEFAULT_MONITORS}).")
+    parser.add_argument("--db", type=Path, required=True, help="Output file; replaced if it exists.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the per-monitor scales and every row value.")
+    parser.add_argument("--no-rollups", action="store_true", help="Skip the hourly rollups (raw-only benchmarks).")
+    args = parser.parse_args()
+
+    if args.db.resolve() == (Path(__file__).resolve().parent / "data" / "traffic.db"):
+        raise SystemExit("Refusing to overwrite data/traffic.db; pass a scratch path.")
+    stats = generate(args.db, args.rows, args.monitors, args.seed, rollups=not args.no_rollups)
+    print(f"   db: {args.db}")
+    print(f"   rows: {stats['rows']:,} over {stats['monitors']} monitors")
+    print(f"   insert: {stats['insert_seconds']:.1f}s ({stats['rows_per_second']:,.0f} rows/s)")
+    print(f"   hourly rollups: {stats['rollup_seconds']:.1f}s")
+    print(f"   file size: {stats['bytes']:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
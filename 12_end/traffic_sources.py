@@ -0,0 +1,440 @@
+# traffic_sources.py
+# Source adapters for the traffic ingest
+# Pairs with 01_ingest_traffic.py
+#
+# Each adapter turns one API payload into rows shaped like the `traffic` table:
+#   (metro_id, monitor_id, observed_at, vehicles, speed, occupancy)
+# where observed_at is UTC epoch seconds (see traffic_store.py).
+# Adapters are registered by `source_name` (see sources.csv). The ingest runner
+# fetches every configured source concurrently, so adding a city does not add
+# its fetch latency to the cron wall-clock.
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import csv
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import requests
+from requests.adapters import HTTPAdapter
+
+## 0.2 Paths #################################
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+METROS_PATH = SCRIPT_DIR / "metros.csv"
+SOURCES_PATH = SCRIPT_DIR / "sources.csv"
+
+# Upper bound on concurrent fetches, whatever the number of sources.
+MAX_FETCH_WORKERS = 8
+
+BRUSSELS_TZ = ZoneInfo("Europe/Brussels")
+
+
+# 1. HTTP HELPERS ###################################
+
+def make_session(pool_size: int = MAX_FETCH_WORKERS) -> requests.Session:
+    """Create one HTTP session with a keep-alive pool sized for concurrent fetches."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_with_retry(
+    url: str,
+    params: dict,
+    max_attempts: int = 5,
+    timeout: int = 30,
+    session: requests.Session | None = None,
+) -> requests.Response:
+    """Fetch API payload with retry/backoff for transient failures.
+
+    Pass a `session` to reuse pooled keep-alive connections across calls.
+    """
+    http = session or requests
+    for attempt in range(1, max_attempts + 1):
+        response = http.get(url, params=params, timeout=timeout)
+        if response.status_code in {429, 500, 502, 503, 504} and attempt < max_attempts:
+            retry_after = response.headers.get("Retry-After")
+            sleep_seconds = int(retry_after) if retry_after and retry_after.isdigit() else min(2 ** attempt, 30)
+            print(
+                f"   warning transient status={response.status_code}; "
+                f"retrying in {sleep_seconds}s (attempt {attempt}/{max_attempts})"
+            )
+            time.sleep(sleep_seconds)
+            continue
+        response.raise_for_status()
+        return response
+    raise RuntimeError("Failed to fetch traffic payload after retries.")
+
+
+# 2. TIME HELPERS ###################################
+
+@lru_cache(maxsize=4096)
+def parse_bxl_time_to_utc(end_time: str) -> int | None:
+    """Convert Brussels-local timestamp to UTC epoch seconds as stored in SQLite.
+
+    Cached: every monitor in a payload shares a handful of end_time strings.
+    """
+    if not end_time:
+        return None
+    for fmt in ("%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M"):
+        try:
+            local_dt = datetime.strptime(end_time, fmt).replace(tzinfo=BRUSSELS_TZ)
+            return int(local_dt.timestamp())
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def parse_iso_time_to_utc(timestamp: str) -> int | None:
+    """Convert an ISO-8601 timestamp with offset to UTC epoch seconds as stored in SQLite."""
+    if not timestamp:
+        return None
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        return None
+    return int(parsed.timestamp())
+
+
+# 3. ADAPTER REGISTRY ###################################
+
+# source_name -> {"metro_id", "params", "parse"}
+ADAPTERS: dict[str, dict] = {}
+
+
+def register_adapter(source_name: str, metro_id: int, params: dict | None = None):
+    """Register `parse(payload, metro_id) -> list[row]` for a sources.csv `source_name`."""
+    def decorator(parse):
+        ADAPTERS[source_name] = {"metro_id": int(metro_id), "params": dict(params or {}), "parse": parse}
+        return parse
+    return decorator
+
+
+@register_adapter(
+    "brussels_mobility_traffic_counts",
+    metro_id=948,
+    params={"request": "live", "includeLanes": "false", "interval": "1"},
+)
+def parse_brussels_counts(payload: dict, metro_id: int) -> list[tuple]:
+    """Brussels traverse counts: keep the latest 1m/t1 value per monitor."""
+    data = payload.get("data", {}) or {}
+    if not data:
+        raise ValueError("Brussels traffic API returned empty data payload.")
+
+    rows = []
+    for monitor_id, monitor_payload in data.items():
+        one_min = (monitor_payload.get("results", {}) or {}).get("1m", {}) or {}
+        t1 = one_min.get("t1", {}) or {}
+        vehicles = t1.get("count")
+        speed = t1.get("speed")
+        occupancy = t1.get("occupancy")
+        observed_at = parse_bxl_time_to_utc(t1.get("end_time", ""))
+
+        # Skip malformed rows early to keep downstream SQL simple and robust.
+        if vehicles is None or observed_at is None or not monitor_id:
+            continue
+
+        try:
+            rows.append(
+                (
+                    metro_id,
+                    str(monitor_id),
+                    observed_at,
+                    int(vehicles),
+                    max(float(speed), 0.0) if speed is not None else None,
+                    float(occupancy) if occupancy is not None else None,
+                )
+            )
+        except (TypeError, ValueError):
+            continue
+    return rows
+
+
+@register_adapter("data_gov_sg_taxi_availability", metro_id=955)
+def parse_sg_taxi_availability(payload: dict, metro_id: int) -> list[tuple]:
+    """Singapore LTA taxi availability: one city-wide count of available taxis.
+
+    An empty or malformed feed is a per-source error, like Brussels' empty
+    payload: it is reported for this source and the other sources still write.
+    """
+    try:
+        features = payload.get("features", []) or []
+        if not features:
+            raise ValueError("Singapore taxi availability API returned no features.")
+        rows = []
+        for feature in features:
+            properties = feature.get("properties", {}) or {}
+            vehicles = properties.get("taxi_count")
+            observed_at = parse_iso_time_to_utc(properties.get("timestamp", ""))
+            if vehicles is None or observed_at is None:
+                continue
+            try:
+                rows.append((metro_id, "taxi_availability", observed_at, int(vehicles), None, None))
+            except (TypeError, ValueError):
+                continue
+    except (KeyError, TypeError, AttributeError) as exc:
+        raise ValueError(f"Singapore taxi availability API returned a malformed payload: {exc!r}") from exc
+    return rows
+
+
+# 3.1 Historical adapters ##############################
+
+# Sources whose API can return past data register a second adapter here, used
+# by `01_ingest_traffic.py backfill`:
+# source_name -> {"params": (monitor_id, start, end) -> dict, "parse": (payload, metro_id, monitor_id) -> rows}
+HISTORY_ADAPTERS: dict[str, dict] = {}
+
+
+def register_history_adapter(source_name: str, params):
+    """Register `parse(payload, metro_id, monitor_id) -> list[row]` for historical requests."""
+    def decorator(parse):
+        HISTORY_ADAPTERS[source_name] = {"params": params, "parse": parse}
+        return parse
+    return decorator
+
+
+def brussels_history_params(monitor_id: str, start: date, end: date) -> dict:
+    """One traverse, inclusive Brussels-local date range, 1-minute interval."""
+    return {
+        "request": "history",
+        "featureID": monitor_id,
+        "startDate": start.strftime("%Y%m%d"),
+        "endDate": end.strftime("%Y%m%d"),
+        "interval": "1",
+    }
+
+
+@register_history_adapter("brussels_mobility_traffic_counts", params=brussels_history_params)
+def parse_brussels_history(payload: dict, metro_id: int, monitor_id: str) -> list[tuple]:
+    """Brussels history: a list of 1-minute entries with the same fields as the live t1 block."""
+    data = payload.get("data", []) or []
+    # Accept either a bare list or the live-style {monitor_id: [...]} mapping.
+    entries = data.get(monitor_id, []) if isinstance(data, dict) else data
+    rows = []
+    for entry in entries or []:
+        vehicles = entry.get("count")
+        speed = entry.get("speed")
+        occupancy = entry.get("occupancy")
+        observed_at = parse_bxl_time_to_utc(entry.get("end_time", ""))
+        if vehicles is None or observed_at is None:
+            continue
+        try:
+            rows.append(
+                (
+                    metro_id,
+                    str(monitor_id),
+                    observed_at,
+                    int(vehicles),
+                    max(float(speed), 0.0) if speed is not None else None,
+                    float(occupancy) if occupancy is not None else None,
+                )
+            )
+        except (TypeError, ValueError):
+            continue
+    return rows
+
+
+# 3.2 Observation adapters ##############################
+
+# Opt-in (`--all-intervals`): every interval, traverse and lane in a payload,
+# flattened to rows for the long `traffic_obs` table:
+#   (metro_id, monitor_id, interval, traverse, lane, observed_at, vehicles, speed, occupancy)
+# source_name -> {"params": extra query params, "parse": (payload, metro_id) -> rows}
+OBS_ADAPTERS: dict[str, dict] = {}
+
+INTERVAL_MINUTES = {"1m": 1, "5m": 5, "15m": 15, "60m": 60}
+
+
+def register_obs_adapter(source_name: str, params: dict | None = None):
+    """Register `parse(payload, metro_id) -> list[obs_row]` for the all-intervals mode."""
+    def decorator(parse):
+        OBS_ADAPTERS[source_name] = {"params": dict(params or {}), "parse": parse}
+        return parse
+    return decorator
+
+
+@register_obs_adapter("brussels_mobility_traffic_counts", params={"includeLanes": "true"})
+def parse_brussels_obs(payload: dict, metro_id: int) -> list[tuple]:
+    """Flatten every results[interval][traverse] block, for the traverse and each lane, in one pass.
+
+    The traverse-level block gets lane '' and lanes come from the optional
+    `lanes` mapping ({lane_id: {"results": ...}}) that includeLanes=true adds.
+    """
+    data = payload.get("data", {}) or {}
+    if not data:
+        raise ValueError("Brussels traffic API returned empty data payload.")
+
+    rows = []
+    append = rows.append
+    to_utc = parse_bxl_time_to_utc
+    for monitor_id, monitor_payload in data.items():
+        if not monitor_id:
+            continue
+        monitor_id = str(monitor_id)
+        lanes = monitor_payload.get("lanes") or {}
+        blocks = [("", monitor_payload)]
+        if isinstance(lanes, dict):
+            blocks.extend(lanes.items())
+        for lane, block in blocks:
+            for interval_key, traverses in ((block or {}).get("results") or {}).items():
+                interval = INTERVAL_MINUTES.get(interval_key)
+                if interval is None or not traverses:
+                    continue
+                for traverse, values in traverses.items():
+                    if not values:
+                        continue
+                    vehicles = values.get("count")
+                    observed_at = to_utc(values.get("end_time", ""))
+                    if vehicles is None or observed_at is None:
+                        continue
+                    speed = values.get("speed")
+                    occupancy = values.get("occupancy")
+                    try:
+                        append(
+                            (
+                                metro_id,
+                                monitor_id,
+                                interval,
+                                traverse,
+                                str(lane),
+                                observed_at,
+                                int(vehicles),
+                                max(float(speed), 0.0) if speed is not None else None,
+                                float(occupancy) if occupancy is not None else None,
+                            )
+                        )
+                    except (TypeError, ValueError):
+                        continue
+    return rows
+
+
+# 4. CONFIGURED SOURCES ###################################
+
+def read_csv_rows(path: Path) -> list[dict]:
+    # utf-8-sig strips the byte-order mark these CSVs were saved with.
+    with open(path, newline="", encoding="utf-8-sig") as handle:
+        return list(csv.DictReader(handle))
+
+
+def load_sources(
+    only: list[str] | None = None,
+    sources_path: Path = SOURCES_PATH,
+    metros_path: Path = METROS_PATH,
+) -> list[dict]:
+    """Join sources.csv with the adapter registry.
+
+    Rows without a registered adapter (e.g. traffic camera images) are skipped.
+    Pass `only` to restrict the run to specific `source_name` values.
+    """
+    metro_names = {int(row["metro_id"]): row["name"] for row in read_csv_rows(metros_path)}
+    sources = []
+    for row in read_csv_rows(sources_path):
+        name = row["source_name"].strip()
+        adapter = ADAPTERS.get(name)
+        if adapter is None or (only and name not in only):
+            continue
+        if adapter["metro_id"] not in metro_names:
+            raise ValueError(f"Source {name} maps to metro_id {adapter['metro_id']}, which is not in {metros_path.name}.")
+        sources.append(
+            {
+                "source": int(row["source"]),
+                "source_name": name,
+                "url": row["source_api"].strip(),
+                "metro_id": adapter["metro_id"],
+                "metro_name": metro_names[adapter["metro_id"]],
+                "params": adapter["params"],
+                "parse": adapter["parse"],
+            }
+        )
+    if only:
+        missing = sorted(set(only) - {source["source_name"] for source in sources})
+        if missing:
+            raise ValueError(f"Unknown or adapter-less sources: {', '.join(missing)}")
+    return sources
+
+
+# 5. CONCURRENT FETCH ###################################
+
+def fetch_source(source: dict, session: requests.Session | None = None, with_obs: bool = False) -> dict:
+    """Fetch and parse one source. Errors are returned, not raised, so one city cannot sink the run.
+
+    With `with_obs`, sources that have an observation adapter also return
+    `obs_rows` (all intervals, traverses and lanes) parsed from the same payload.
+    """
+    obs = OBS_ADAPTERS.get(source["source_name"]) if with_obs else None
+    params = {**source["params"], **obs["params"]} if obs else source["params"]
+    result = {
+        "source_name": source["source_name"],
+        "metro_id": source["metro_id"],
+        "rows": [],
+        "obs_rows": [],
+        "error": None,
+        "fetch_seconds": 0.0,
+        "parse_seconds": 0.0,
+    }
+    started = time.perf_counter()
+    try:
+        response = get_with_retry(source["url"], params=params, timeout=30, session=session)
+        fetched = time.perf_counter()
+        result["fetch_seconds"] = fetched - started
+        payload = response.json()
+        result["rows"] = source["parse"](payload, source["metro_id"])
+        if obs:
+            result["obs_rows"] = obs["parse"](payload, source["metro_id"])
+        result["parse_seconds"] = time.perf_counter() - fetched
+    except (requests.RequestException, RuntimeError, ValueError) as exc:
+        result["error"] = str(exc)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def fetch_history(source: dict, monitor_id: str, start: date, end: date, session: requests.Session | None = None) -> dict:
+    """Fetch and parse one historical window for one monitor; errors are returned, not raised."""
+    history = HISTORY_ADAPTERS[source["source_name"]]
+    result = {
+        "source_name": source["source_name"],
+        "metro_id": source["metro_id"],
+        "monitor_id": monitor_id,
+        "window": (start.isoformat(), end.isoformat()),
+        "rows": [],
+        "error": None,
+        "fetch_seconds": 0.0,
+        "parse_seconds": 0.0,
+    }
+    started = time.perf_counter()
+    try:
+        # get_with_retry already honours Retry-After on 429/5xx responses.
+        response = get_with_retry(source["url"], params=history["params"](monitor_id, start, end), timeout=60, session=session)
+        fetched = time.perf_counter()
+        result["fetch_seconds"] = fetched - started
+        result["rows"] = history["parse"](response.json(), source["metro_id"], monitor_id)
+        result["parse_seconds"] = time.perf_counter() - fetched
+    except (requests.RequestException, RuntimeError, ValueError) as exc:
+        result["error"] = str(exc)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def fetch_all(
+    sources: list[dict],
+    session: requests.Session | None = None,
+    max_workers: int = MAX_FETCH_WORKERS,
+    with_obs: bool = False,
+) -> list[dict]:
+    """Fetch every source on a bounded thread pool; results keep the input order."""
+    if not sources:
+        return []
+    workers = max(1, min(max_workers, len(sources)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda source: fetch_source(source, session, with_obs=with_obs), sources))
@@ -0,0 +1,1482 @@
+# traffic_store.py
+# SQLite storage layer for traffic counts (schema v8)
+# Pairs with 01_ingest_traffic.py and 02_train_model.py
+#
+# Schema v2 keeps the database small because it is committed back to git:
+# - `monitors` is a dimension table mapping (metro_id, monitor_id) to an
+#   integer surrogate key, so the long monitor strings are stored once.
+# - `traffic_counts` is a WITHOUT ROWID table clustered on its primary key
+#   (monitor_key, observed_at). observed_at is INTEGER epoch seconds (UTC).
+#   There is no second unique index: the clustered key is the only copy.
+# - `traffic` is a compatibility view with the original v1 columns, so ad hoc
+#   queries and the R scripts keep working. An INSTEAD OF INSERT trigger on
+#   the view routes v1-style inserts into the v2 tables.
+#
+# Schema v3 adds `traffic_rollup_hourly`: count, sum, sum of squares, min and
+# max of vehicles per monitor, UTC date and hour. An AFTER INSERT trigger on
+# `traffic_counts` upserts it inside the same transaction as every raw insert
+# (Python ingest, R ingest through the view, compaction), so training and
+# serving can read a few thousand rollup rows instead of every raw minute.
+# Rows skipped by ON CONFLICT DO NOTHING do not fire the trigger.
+#
+# Schema v4 adds `ingest_runs`, a ledger with one row per ingest run: stage
+# timings and candidate/inserted/duplicate row counts taken from the cursor,
+# so no run needs a COUNT(*) scan. In --segments mode the run record is a
+# small JSON file next to the segment and `compact` loads it into the ledger.
+#
+# Schema v5 adds `backfill_windows`, the checkpoint list of historical
+# (monitor, date window) requests already stored, so an interrupted
+# `01_ingest_traffic.py backfill` resumes where it stopped.
+#
+# Schema v6 adds `traffic_obs`, a long table with every interval (1, 5, 15,
+# 60 minutes), traverse block and lane the live payload contains. It is only
+# filled by the opt-in `01_ingest_traffic.py --all-intervals` mode.
+#
+# Schema v7 adds tiered retention. `retain` folds raw minutes older than
+# --raw-days (default 30) into `traffic_rollup_15m` (count, sum and sum of
+# squares of vehicles, speed and occupancy per monitor and 15-minute bucket),
+# deletes them, and drops 15-minute buckets older than --quarter-days
+# (default 730). Hourly rollups are never expired. Per-tier watermarks in
+# `retention_state` let each run touch only newly expired rows, and the file
+# uses auto_vacuum=INCREMENTAL so freed pages are returned with
+# `PRAGMA incremental_vacuum` instead of a full VACUUM.
+#
+# Schema v8 adds a BEFORE INSERT trigger on `traffic_counts` that drops rows
+# older than the raw-tier watermark. Those minutes were already counted in
+# the hourly rollup and folded into a 15-minute bucket before `retain`
+# deleted them, so re-inserting them (backfill, a late segment, R through
+# the view) would count them twice.
+#
+# Usage (from inside 12_end/):
+#   python traffic_store.py info
+#   python traffic_store.py migrate     # in-place upgrade of data/traffic.db to the latest schema
+#   python traffic_store.py compact     # fold data/segments/ into data/traffic.db
+#   python traffic_store.py runs        # p50/p95 stage latencies over recent ingest runs
+#   python traffic_store.py retain      # downsample and expire old rows (--raw-days 30 --quarter-days 730)
+#   python traffic_store.py drift       # do the last 7 days differ from the last training's cells? (stdlib only)
+#   python traffic_store.py check       # scratch-db checks: retain / re-insert must not change the rollups,
+#                                       # and the drift gate must skip a quiet week
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse
+import gzip
+import json
+import math
+import os
+import secrets
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+## 0.2 Paths #################################
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DATA_DIR = SCRIPT_DIR / "data"
+DB_PATH = DATA_DIR / "traffic.db"
+SEGMENTS_DIR = DATA_DIR / "segments"
+
+SCHEMA_VERSION = 8
+
+# Retention tiers: raw 1-minute rows, then 15-minute buckets, then hourly rollups (kept forever).
+RAW_RETENTION_DAYS = 30
+QUARTER_HOUR_RETENTION_DAYS = 730
+QUARTER_HOUR_SECONDS = 900
+
+# Drift gate: retrain only when the last DRIFT_WINDOW_DAYS whole days of
+# per-cell data differ from the snapshot saved with the last model by more
+# than this (see cell_drift). A fixed window keeps the gate as sensitive after
+# a year of history as after a week.
+# - DRIFT_MEAN_Z2: mean squared standardized change of the cell means. A week
+#   drawn from the same distribution as the snapshot reads about 1 (sampling
+#   noise alone; 0.9-1.4 in `check`). On data/traffic.db the second week
+#   against the first read 1.79 (cell means moved 19% on average), and the
+#   last 7 days against the full history read 0.43.
+# - DRIFT_COUNT_SHIFT: total variation distance of the rows-per-cell shares.
+#   It moves with ingest coverage (monitors dropping in and out): ordinary
+#   weeks of data/traffic.db read 0.16-0.39 against the full history, so the
+#   limit only catches gross changes such as missing days or a new set of
+#   monitors.
+DRIFT_MEAN_Z2 = 1.5
+DRIFT_COUNT_SHIFT = 0.5
+DRIFT_WINDOW_DAYS = 7
+
+
+# 1. SCHEMA ###################################
+
+SCHEMA_V2 = """
+CREATE TABLE IF NOT EXISTS monitors (
+  monitor_key INTEGER PRIMARY KEY,
+  metro_id    INTEGER NOT NULL,
+  monitor_id  TEXT NOT NULL,
+  UNIQUE (metro_id, monitor_id)
+);
+
+CREATE TABLE IF NOT EXISTS traffic_counts (
+  monitor_key INTEGER NOT NULL REFERENCES monitors (monitor_key),
+  observed_at INTEGER NOT NULL,
+  vehicles    INTEGER,
+  speed       REAL,
+  occupancy   REAL,
+  PRIMARY KEY (monitor_key, observed_at)
+) WITHOUT ROWID;
+
+CREATE VIEW IF NOT EXISTS traffic AS
+SELECT
+  m.metro_id AS metro_id,
+  m.monitor_id AS monitor_id,
+  strftime('%Y-%m-%d %H:%M:%S', t.observed_at, 'unixepoch') AS observed_at,
+  t.vehicles AS vehicles,
+  t.speed AS speed,
+  t.occupancy AS occupancy
+FROM traffic_counts AS t
+JOIN monitors AS m ON m.monitor_key = t.monitor_key;
+
+CREATE TRIGGER IF NOT EXISTS traffic_insert
+INSTEAD OF INSERT ON traffic
+BEGIN
+  INSERT OR IGNORE INTO monitors (metro_id, monitor_id)
+  VALUES (NEW.metro_id, NEW.monitor_id);
+  INSERT OR IGNORE INTO traffic_counts (monitor_key, observed_at, vehicles, speed, occupancy)
+  SELECT monitor_key, CAST(strftime('%s', NEW.observed_at) AS INTEGER), NEW.vehicles, NEW.speed, NEW.occupancy
+  FROM monitors
+  WHERE metro_id = NEW.metro_id AND monitor_id = NEW.monitor_id;
+END;
+"""
+
+SCHEMA_V3 = """
+CREATE TABLE IF NOT EXISTS traffic_rollup_hourly (
+  monitor_key    INTEGER NOT NULL REFERENCES monitors (monitor_key),
+  obs_date       INTEGER NOT NULL,  -- UTC days since 1970-01-01
+  hour_of_day    INTEGER NOT NULL,  -- UTC hour, 0-23
+  n              INTEGER NOT NULL,
+  vehicles_sum   INTEGER NOT NULL,
+  vehicles_sumsq INTEGER NOT NULL,
+  vehicles_min   INTEGER NOT NULL,
+  vehicles_max   INTEGER NOT NULL,
+  PRIMARY KEY (monitor_key, obs_date, hour_of_day)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS traffic_counts_rollup
+AFTER INSERT ON traffic_counts
+WHEN NEW.vehicles IS NOT NULL
+BEGIN
+  INSERT INTO traffic_rollup_hourly (
+    monitor_key, obs_date, hour_of_day, n, vehicles_sum, vehicles_sumsq, vehicles_min, vehicles_max
+  )
+  VALUES (
+    NEW.monitor_key, NEW.observed_at / 86400, (NEW.observed_at % 86400) / 3600,
+    1, NEW.vehicles, NEW.vehicles * NEW.vehicles, NEW.vehicles, NEW.vehicles
+  )
+  ON CONFLICT (monitor_key, obs_date, hour_of_day) DO UPDATE SET
+    n = n + 1,
+    vehicles_sum = vehicles_sum + excluded.vehicles_sum,
+    vehicles_sumsq = vehicles_sumsq + excluded.vehicles_sumsq,
+    vehicles_min = min(vehicles_min, excluded.vehicles_min),
+    vehicles_max = max(vehicles_max, excluded.vehicles_max);
+END;
+"""
+
+SCHEMA_V4 = """
+CREATE TABLE IF NOT EXISTS ingest_runs (
+  run_id         TEXT PRIMARY KEY,
+  mode           TEXT NOT NULL,     -- sqlite | segments | daemon
+  started_at     REAL NOT NULL,     -- epoch seconds (UTC)
+  finished_at    REAL NOT NULL,
+  sources        INTEGER NOT NULL,
+  sources_failed INTEGER NOT NULL,
+  fetch_seconds  REAL NOT NULL,     -- slowest source's HTTP time (sources run concurrently)
+  parse_seconds  REAL NOT NULL,     -- payload -> rows, summed over sources
+  write_seconds  REAL NOT NULL,     -- SQLite insert or segment write
+  candidate_rows INTEGER NOT NULL,
+  inserted_rows  INTEGER NOT NULL,
+  duplicate_rows INTEGER NOT NULL
+);
+"""
+
+SCHEMA_V5 = """
+CREATE TABLE IF NOT EXISTS backfill_windows (
+  source_name   TEXT NOT NULL,
+  monitor_id    TEXT NOT NULL,
+  window_start  TEXT NOT NULL,  -- YYYY-MM-DD, inclusive
+  window_end    TEXT NOT NULL,  -- YYYY-MM-DD, inclusive
+  fetched_rows  INTEGER NOT NULL,
+  inserted_rows INTEGER NOT NULL,
+  completed_at  REAL NOT NULL,  -- epoch seconds (UTC)
+  PRIMARY KEY (source_name, monitor_id, window_start, window_end)
+) WITHOUT ROWID;
+"""
+
+SCHEMA_V6 = """
+CREATE TABLE IF NOT EXISTS traffic_obs (
+  monitor_key INTEGER NOT NULL REFERENCES monitors (monitor_key),
+  interval    INTEGER NOT NULL,  -- minutes: 1, 5, 15 or 60
+  traverse    TEXT NOT NULL,     -- result block within the interval, e.g. t1
+  lane        TEXT NOT NULL,     -- '' for the whole traverse, else the lane id
+  observed_at INTEGER NOT NULL,  -- interval end, epoch seconds (UTC)
+  vehicles    INTEGER,
+  speed       REAL,
+  occupancy   REAL,
+  PRIMARY KEY (monitor_key, interval, traverse, lane, observed_at)
+) WITHOUT ROWID;
+"""
+
+SCHEMA_V7 = """
+CREATE TABLE IF NOT EXISTS traffic_rollup_15m (
+  monitor_key     INTEGER NOT NULL REFERENCES monitors (monitor_key),
+  bucket_start    INTEGER NOT NULL,  -- epoch seconds (UTC), multiple of 900
+  n               INTEGER NOT NULL,  -- raw rows folded into the bucket
+  vehicles_n      INTEGER NOT NULL,  -- non-null values per measure
+  vehicles_sum    INTEGER NOT NULL,
+  vehicles_sumsq  INTEGER NOT NULL,
+  speed_n         INTEGER NOT NULL,
+  speed_sum       REAL NOT NULL,
+  speed_sumsq     REAL NOT NULL,
+  occupancy_n     INTEGER NOT NULL,
+  occupancy_sum   REAL NOT NULL,
+  occupancy_sumsq REAL NOT NULL,
+  PRIMARY KEY (monitor_key, bucket_start)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS retention_state (
+  tier       TEXT PRIMARY KEY,  -- raw | 15m
+  watermark  INTEGER NOT NULL,  -- rows of this tier older than this epoch are gone
+  updated_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+SCHEMA_V8 = """
+CREATE TRIGGER IF NOT EXISTS traffic_counts_expired
+BEFORE INSERT ON traffic_counts
+WHEN NEW.observed_at < (SELECT watermark FROM retention_state WHERE tier = 'raw')
+BEGIN
+  SELECT RAISE(IGNORE);
+END;
+"""
+
+RUN_FIELDS = (
+    "run_id", "mode", "started_at", "finished_at", "sources", "sources_failed",
+    "fetch_seconds", "parse_seconds", "write_seconds", "candidate_rows", "inserted_rows", "duplicate_rows",
+)
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Return PRAGMA user_version (SCHEMA_VERSION once migrated), 1 for the original `traffic` table, 0 for an empty file."""
+    version = int(conn.execute("PRAGMA user_version").fetchone()[0])
+    if version:
+        return version
+    legacy = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'traffic'"
+    ).fetchone()
+    return 1 if legacy else 0
+
+
+def migrate_v1_to_v2(conn: sqlite3.Connection) -> int:
+    """Rewrite the v1 `traffic` table into the v2 layout in place; return rows migrated."""
+    conn.executescript(
+        """
+        BEGIN;
+        ALTER TABLE traffic RENAME TO traffic_v1;
+        DROP INDEX IF EXISTS idx_traffic_metro_monitor_observed;
+        """
+        + SCHEMA_V2
+        + """
+        INSERT OR IGNORE INTO monitors (metro_id, monitor_id)
+        SELECT DISTINCT metro_id, monitor_id
+        FROM traffic_v1
+        WHERE metro_id IS NOT NULL AND monitor_id IS NOT NULL
+        ORDER BY metro_id, monitor_id;
+
+        INSERT OR IGNORE INTO traffic_counts (monitor_key, observed_at, vehicles, speed, occupancy)
+        SELECT m.monitor_key, CAST(strftime('%s', v.observed_at) AS INTEGER), v.vehicles, v.speed, v.occupancy
+        FROM traffic_v1 AS v
+        JOIN monitors AS m ON m.metro_id = v.metro_id AND m.monitor_id = v.monitor_id
+        WHERE strftime('%s', v.observed_at) IS NOT NULL
+        ORDER BY m.monitor_key, v.observed_at;
+
+        DROP TABLE traffic_v1;
+        PRAGMA user_version = 2;
+        COMMIT;
+        """
+    )
+    migrated = int(conn.execute("SELECT COUNT(*) FROM traffic_counts").fetchone()[0])
+    # Rebuild the file so the pages freed by the v1 table and index are returned.
+    conn.execute("VACUUM")
+    return migrated
+
+
+def migrate_v2_to_v3(conn: sqlite3.Connection) -> int:
+    """Add the hourly rollup table and trigger, seeded from existing raw rows; return rollup rows."""
+    conn.executescript(
+        "BEGIN;"
+        + SCHEMA_V3
+        + """
+        INSERT INTO traffic_rollup_hourly (
+          monitor_key, obs_date, hour_of_day, n, vehicles_sum, vehicles_sumsq, vehicles_min, vehicles_max
+        )
+        SELECT
+          monitor_key, observed_at / 86400, (observed_at % 86400) / 3600,
+          COUNT(*), SUM(vehicles), SUM(vehicles * vehicles), MIN(vehicles), MAX(vehicles)
+        FROM traffic_counts
+        WHERE vehicles IS NOT NULL
+        GROUP BY 1, 2, 3;
+
+        PRAGMA user_version = 3;
+        COMMIT;
+        """
+    )
+    return int(conn.execute("SELECT COUNT(*) FROM traffic_rollup_hourly").fetchone()[0])
+
+
+def migrate_v3_to_v4(conn: sqlite3.Connection) -> int:
+    """Add the ingest_runs ledger; return 0 (there are no past runs to load)."""
+    conn.executescript("BEGIN;" + SCHEMA_V4 + "PRAGMA user_version = 4; COMMIT;")
+    return 0
+
+
+def migrate_v4_to_v5(conn: sqlite3.Connection) -> int:
+    """Add the backfill checkpoint table; return 0."""
+    conn.executescript("BEGIN;" + SCHEMA_V5 + "PRAGMA user_version = 5; COMMIT;")
+    return 0
+
+
+def migrate_v5_to_v6(conn: sqlite3.Connection) -> int:
+    """Add the long multi-interval/lane table; return 0."""
+    conn.executescript("BEGIN;" + SCHEMA_V6 + "PRAGMA user_version = 6; COMMIT;")
+    return 0
+
+
+def migrate_v6_to_v7(conn: sqlite3.Connection) -> int:
+    """Add the 15-minute tier and retention watermarks, and switch to incremental auto-vacuum; return 0."""
+    conn.executescript("BEGIN;" + SCHEMA_V7 + "PRAGMA user_version = 7; COMMIT;")
+    # auto_vacuum can only change on an empty file or through a full VACUUM, once.
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    return 0
+
+
+def migrate_v7_to_v8(conn: sqlite3.Connection) -> int:
+    """Add the trigger that drops rows below the raw retention watermark; return 0."""
+    conn.executescript("BEGIN;" + SCHEMA_V8 + "PRAGMA user_version = 8; COMMIT;")
+    return 0
+
+
+# from_version -> migration that upgrades the file to from_version + 1
+MIGRATIONS = {
+    1: migrate_v1_to_v2,
+    2: migrate_v2_to_v3,
+    3: migrate_v3_to_v4,
+    4: migrate_v4_to_v5,
+    5: migrate_v5_to_v6,
+    6: migrate_v6_to_v7,
+    7: migrate_v7_to_v8,
+}
+
+
+def connect_store(db_path: Path = DB_PATH) -> sqlite3.Connection:
+    """Open the traffic database in the latest layout, migrating an older file in place if needed."""
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    version = schema_version(conn)
+    if version == 0:
+        # Must be set before the first table is created.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.executescript(
+            SCHEMA_V2 + SCHEMA_V3 + SCHEMA_V4 + SCHEMA_V5 + SCHEMA_V6 + SCHEMA_V7 + SCHEMA_V8
+            + f"PRAGMA user_version = {SCHEMA_VERSION};"
+        )
+        return conn
+    if version > SCHEMA_VERSION:
+        conn.close()
+        raise RuntimeError(f"{db_path} has schema v{version}; this code understands up to v{SCHEMA_VERSION}.")
+    while version < SCHEMA_VERSION:
+        rows = MIGRATIONS[version](conn)
+        version += 1
+        print(f"   migrated traffic.db to schema v{version} ({rows} rows)")
+    return conn
+
+
+# 2. WRITE ###################################
+
+def monitor_keys(conn: sqlite3.Connection, pairs: set[tuple[int, str]]) -> dict[tuple[int, str], int]:
+    """Return surrogate keys for (metro_id, monitor_id) pairs, creating any that are new."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO monitors (metro_id, monitor_id) VALUES (?, ?)",
+        sorted(pairs),
+    )
+    return {
+        (int(metro_id), str(monitor_id)): int(key)
+        for key, metro_id, monitor_id in conn.execute("SELECT monitor_key, metro_id, monitor_id FROM monitors")
+    }
+
+
+def insert_rows(conn: sqlite3.Connection, rows: list[tuple]) -> int:
+    """Insert (metro_id, monitor_id, observed_at, vehicles, speed, occupancy) rows.
+
+    observed_at is epoch seconds (UTC). Duplicates are ignored so repeated runs
+    stay idempotent, and rows older than the raw retention watermark are
+    dropped by the traffic_counts_expired trigger (they are already in the
+    rollups). Returns the number of rows actually inserted. The caller owns
+    the transaction.
+    """
+    if not rows:
+        return 0
+    keys = monitor_keys(conn, {(row[0], row[1]) for row in rows})
+    cursor = conn.executemany(
+        """
+        INSERT INTO traffic_counts (monitor_key, observed_at, vehicles, speed, occupancy)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(monitor_key, observed_at) DO NOTHING
+    """,
+        [(keys[(row[0], row[1])], row[2], row[3], row[4], row[5]) for row in rows],
+    )
+    return max(cursor.rowcount, 0)
+
+
+def insert_obs_rows(conn: sqlite3.Connection, rows: list[tuple]) -> int:
+    """Insert (metro_id, monitor_id, interval, traverse, lane, observed_at, vehicles, speed, occupancy) rows.
+
+    Duplicates are ignored. Returns rows actually inserted. The caller owns the transaction.
+    """
+    if not rows:
+        return 0
+    keys = monitor_keys(conn, {(row[0], row[1]) for row in rows})
+    cursor = conn.executemany(
+        """
+        INSERT INTO traffic_obs (monitor_key, interval, traverse, lane, observed_at, vehicles, speed, occupancy)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(monitor_key, interval, traverse, lane, observed_at) DO NOTHING
+    """,
+        [(keys[(row[0], row[1])],) + row[2:] for row in rows],
+    )
+    return max(cursor.rowcount, 0)
+
+
+# 3. SEGMENTS ###################################
+
+# Append-only segment files hold the rows an ingest run added, as gzipped
+# NDJSON under data/segments/YYYY/MM/DD/. Concurrent runs only ever add new
+# files, so git never has to merge the binary traffic.db. `compact` folds
+# segments into traffic.db and deletes them; readers union both in between.
+
+SEGMENT_FIELDS = ("metro_id", "monitor_id", "observed_at", "vehicles", "speed", "occupancy")
+
+
+def segment_path(
+    segments_dir: Path = SEGMENTS_DIR,
+    tag: str = "py",
+    token: str | None = None,
+    suffix: str = ".ndjson.gz",
+) -> Path:
+    """Return a unique path like segments/2026/05/11/054000-py-1a2b3c4d.ndjson.gz."""
+    now = datetime.now(timezone.utc)
+    name = f"{now:%H%M%S}-{tag}-{token or secrets.token_hex(4)}{suffix}"
+    return Path(segments_dir) / f"{now:%Y}" / f"{now:%m}" / f"{now:%d}" / name
+
+
+def write_segment(
+    rows: list[tuple],
+    segments_dir: Path = SEGMENTS_DIR,
+    tag: str = "py",
+    token: str | None = None,
+) -> Path | None:
+    """Write rows to a new immutable segment file; return its path (None if no rows)."""
+    if not rows:
+        return None
+    path = segment_path(segments_dir, tag=tag, token=token)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = "".join(json.dumps(dict(zip(SEGMENT_FIELDS, row)), separators=(",", ":")) + "\n" for row in rows)
+    # Write to a temp name and rename, so readers never see a half-written segment.
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as handle:
+        # mtime=0 keeps the gzip bytes deterministic for identical rows.
+        with gzip.GzipFile(fileobj=handle, mode="wb", mtime=0) as gz:
+            gz.write(lines.encode("utf-8"))
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_segment(path: Path) -> list[tuple]:
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        return [tuple(record.get(field) for field in SEGMENT_FIELDS) for record in map(json.loads, handle) if record]
+
+
+def list_segments(segments_dir: Path = SEGMENTS_DIR) -> list[Path]:
+    """All segment files, oldest first (paths sort by date and time)."""
+    segments_dir = Path(segments_dir)
+    if not segments_dir.exists():
+        return []
+    return sorted(segments_dir.glob("*/*/*/*.ndjson.gz"))
+
+
+def load_pending_segments(conn: sqlite3.Connection, segments_dir: Path = SEGMENTS_DIR) -> int:
+    """Load not-yet-compacted segments into a TEMP table that `read_traffic` unions in.
+
+    traffic.db itself is not modified. Returns the number of segment files loaded.
+    """
+    conn.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS segment_rows (
+          metro_id    INTEGER NOT NULL,
+          monitor_id  TEXT NOT NULL,
+          observed_at INTEGER NOT NULL,
+          vehicles    INTEGER,
+          speed       REAL,
+          occupancy   REAL,
+          PRIMARY KEY (metro_id, monitor_id, observed_at)
+        ) WITHOUT ROWID
+    """
+    )
+    paths = list_segments(segments_dir)
+    with conn:
+        for path in paths:
+            conn.executemany("INSERT OR IGNORE INTO temp.segment_rows VALUES (?, ?, ?, ?, ?, ?)", read_segment(path))
+    return len(paths)
+
+
+def has_pending_segments(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM temp.sqlite_master WHERE name = 'segment_rows'").fetchone() is not None
+
+
+def filter_new_rows(conn: sqlite3.Connection, rows: list[tuple]) -> list[tuple]:
+    """Drop rows already stored in traffic.db or in a pending segment."""
+    check_segments = has_pending_segments(conn)
+    fresh = []
+    for row in rows:
+        stored = conn.execute(
+            """
+            SELECT 1
+            FROM traffic_counts AS t
+            JOIN monitors AS m ON m.monitor_key = t.monitor_key
+            WHERE m.metro_id = ? AND m.monitor_id = ? AND t.observed_at = ?
+        """,
+            row[:3],
+        ).fetchone()
+        if stored is None and check_segments:
+            stored = conn.execute(
+                "SELECT 1 FROM temp.segment_rows WHERE metro_id = ? AND monitor_id = ? AND observed_at = ?",
+                row[:3],
+            ).fetchone()
+        if stored is None:
+            fresh.append(row)
+    return fresh
+
+
+def append_segment(
+    conn: sqlite3.Connection,
+    rows: list[tuple],
+    segments_dir: Path = SEGMENTS_DIR,
+    token: str | None = None,
+) -> tuple[Path | None, int]:
+    """Write the rows not yet stored anywhere to a new segment; return (path, rows written).
+
+    Call `load_pending_segments` on `conn` first so earlier segments count as stored.
+    """
+    fresh = filter_new_rows(conn, rows)
+    path = write_segment(fresh, segments_dir, token=token)
+    if fresh and has_pending_segments(conn):
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO temp.segment_rows VALUES (?, ?, ?, ?, ?, ?)", fresh)
+    return path, len(fresh)
+
+
+def compact_segments(conn: sqlite3.Connection, segments_dir: Path = SEGMENTS_DIR) -> tuple[int, int]:
+    """Fold every segment and run record into traffic.db in one transaction, then delete the files.
+
+    Returns (segment files compacted, rows inserted).
+    """
+    paths = list_segments(segments_dir)
+    run_paths = list_run_files(segments_dir)
+    inserted = 0
+    with conn:
+        for path in paths:
+            inserted += insert_rows(conn, read_segment(path))
+        for path in run_paths:
+            record_run(conn, json.loads(path.read_text(encoding="utf-8")))
+    for path in paths + run_paths:
+        path.unlink()
+    # Remove the day/month/year folders left empty, deepest first.
+    segments_dir = Path(segments_dir)
+    folders = {parent for path in paths + run_paths for parent in path.parents if segments_dir in parent.parents}
+    for folder in sorted(folders, key=lambda folder: len(folder.parts), reverse=True):
+        if not any(folder.iterdir()):
+            folder.rmdir()
+    return len(paths), inserted
+
+
+# 4. RUN LEDGER ###################################
+
+def new_run(mode: str) -> dict:
+    """Start a ledger record; the ingest fills in timings and row counts as it goes."""
+    run = dict.fromkeys(RUN_FIELDS, 0)
+    run.update({"run_id": secrets.token_hex(4), "mode": mode, "started_at": time.time()})
+    return run
+
+
+def record_run(conn: sqlite3.Connection, run: dict) -> None:
+    """Insert one ledger row. The caller owns the transaction."""
+    conn.execute(
+        f"INSERT OR IGNORE INTO ingest_runs ({', '.join(RUN_FIELDS)}) VALUES ({', '.join('?' * len(RUN_FIELDS))})",
+        [run[field] for field in RUN_FIELDS],
+    )
+
+
+def write_run_file(run: dict, segments_dir: Path = SEGMENTS_DIR, tag: str = "py") -> Path:
+    """Write a run record next to its segment (same run_id), for `compact` to load later."""
+    path = segment_path(segments_dir, tag=tag, token=run["run_id"], suffix=".run.json")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({field: run[field] for field in RUN_FIELDS}, indent=2) + "\n", encoding="utf-8")
+    return path
+
+
+def list_run_files(segments_dir: Path = SEGMENTS_DIR) -> list[Path]:
+    segments_dir = Path(segments_dir)
+    if not segments_dir.exists():
+        return []
+    return sorted(segments_dir.glob("*/*/*/*.run.json"))
+
+
+def recent_runs(conn: sqlite3.Connection, segments_dir: Path = SEGMENTS_DIR, limit: int = 100) -> list[dict]:
+    """The latest `limit` runs from the ledger plus not-yet-compacted run files, oldest first."""
+    runs = {
+        row[0]: dict(zip(RUN_FIELDS, row))
+        for row in conn.execute(
+            f"SELECT {', '.join(RUN_FIELDS)} FROM ingest_runs ORDER BY started_at DESC LIMIT ?",
+            (int(limit),),
+        )
+    }
+    for path in list_run_files(segments_dir):
+        run = json.loads(path.read_text(encoding="utf-8"))
+        runs.setdefault(run["run_id"], run)
+    return sorted(runs.values(), key=lambda run: run["started_at"])[-int(limit):]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0-100); 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return float(ordered[rank - 1])
+
+
+# 5. BACKFILL CHECKPOINTS ###################################
+
+def completed_windows(conn: sqlite3.Connection, source_name: str) -> set[tuple[str, str, str]]:
+    """(monitor_id, window_start, window_end) already stored for this source."""
+    return {
+        (monitor_id, window_start, window_end)
+        for monitor_id, window_start, window_end in conn.execute(
+            "SELECT monitor_id, window_start, window_end FROM backfill_windows WHERE source_name = ?",
+            (source_name,),
+        )
+    }
+
+
+def mark_window_done(
+    conn: sqlite3.Connection,
+    source_name: str,
+    monitor_id: str,
+    window_start: str,
+    window_end: str,
+    fetched_rows: int,
+    inserted_rows: int,
+) -> None:
+    """Checkpoint one window. Call in the same transaction as its row insert."""
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO backfill_windows
+          (source_name, monitor_id, window_start, window_end, fetched_rows, inserted_rows, completed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """,
+        (source_name, monitor_id, window_start, window_end, int(fetched_rows), int(inserted_rows), time.time()),
+    )
+
+
+# 6. RETENTION ###################################
+
+# Both traffic_counts and traffic_rollup_15m are clustered on
+# (monitor_key, time), so expiry runs as one primary-key range per monitor
+# ("observed_at < cutoff") instead of a full table scan. Everything below a
+# tier's watermark was deleted by earlier runs, and the traffic_counts_expired
+# trigger keeps late rows from landing there again, so each range only holds
+# newly expired rows and every raw minute is folded into a bucket once.
+
+def retention_watermark(conn: sqlite3.Connection, tier: str) -> int:
+    row = conn.execute("SELECT watermark FROM retention_state WHERE tier = ?", (tier,)).fetchone()
+    return int(row[0]) if row else -(2 ** 62)
+
+
+def set_retention_watermark(conn: sqlite3.Connection, tier: str, watermark: int) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO retention_state (tier, watermark, updated_at) VALUES (?, ?, ?)",
+        (tier, int(watermark), time.time()),
+    )
+
+
+def apply_retention(
+    conn: sqlite3.Connection,
+    raw_days: float = RAW_RETENTION_DAYS,
+    quarter_days: float = QUARTER_HOUR_RETENTION_DAYS,
+    now: float | None = None,
+) -> dict:
+    """Downsample and expire old rows, then reclaim the freed pages; return counts.
+
+    Raw rows older than `raw_days` are folded into traffic_rollup_15m and
+    deleted in the same transaction. 15-minute buckets older than
+    `quarter_days` are deleted. Hourly rollups are kept forever. Cutoffs are
+    aligned to 15-minute buckets so a bucket is only ever built from whole
+    raw intervals.
+    """
+    if raw_days <= 0 or quarter_days < raw_days:
+        raise ValueError("Retention needs raw_days > 0 and quarter_days >= raw_days.")
+    now = time.time() if now is None else now
+    raw_cutoff = int(now - raw_days * 86400) // QUARTER_HOUR_SECONDS * QUARTER_HOUR_SECONDS
+    quarter_cutoff = int(now - quarter_days * 86400) // QUARTER_HOUR_SECONDS * QUARTER_HOUR_SECONDS
+    stats = {"raw_cutoff": raw_cutoff, "quarter_cutoff": quarter_cutoff, "raw_rows_expired": 0,
+             "buckets_written": 0, "buckets_expired": 0, "pages_freed": 0}
+    all_keys = [int(key) for (key,) in conn.execute("SELECT monitor_key FROM monitors ORDER BY monitor_key")]
+
+    with conn:
+        if raw_cutoff > retention_watermark(conn, "raw"):
+            for key in all_keys:
+                cursor = conn.execute(
+                    f"""
+                    INSERT INTO traffic_rollup_15m (
+                      monitor_key, bucket_start, n, vehicles_n, vehicles_sum, vehicles_sumsq,
+                      speed_n, speed_sum, speed_sumsq, occupancy_n, occupancy_sum, occupancy_sumsq
+                    )
+                    SELECT
+                      monitor_key, observed_at / {QUARTER_HOUR_SECONDS} * {QUARTER_HOUR_SECONDS}, COUNT(*),
+                      COUNT(vehicles), COALESCE(SUM(vehicles), 0), COALESCE(SUM(vehicles * vehicles), 0),
+                      COUNT(speed), COALESCE(SUM(speed), 0.0), COALESCE(SUM(speed * speed), 0.0),
+                      COUNT(occupancy), COALESCE(SUM(occupancy), 0.0), COALESCE(SUM(occupancy * occupancy), 0.0)
+                    FROM traffic_counts
+                    WHERE monitor_key = ? AND observed_at < ?
+                    GROUP BY 1, 2
+                    ON CONFLICT (monitor_key, bucket_start) DO UPDATE SET
+                      n = n + excluded.n,
+                      vehicles_n = vehicles_n + excluded.vehicles_n,
+                      vehicles_sum = vehicles_sum + excluded.vehicles_sum,
+                      vehicles_sumsq = vehicles_sumsq + excluded.vehicles_sumsq,
+                      speed_n = speed_n + excluded.speed_n,
+                      speed_sum = speed_sum + excluded.speed_sum,
+                      speed_sumsq = speed_sumsq + excluded.speed_sumsq,
+                      occupancy_n = occupancy_n + excluded.occupancy_n,
+                      occupancy_sum = occupancy_sum + excluded.occupancy_sum,
+                      occupancy_sumsq = occupancy_sumsq + excluded.occupancy_sumsq
+                """,
+                    (key, raw_cutoff),
+                )
+                stats["buckets_written"] += max(cursor.rowcount, 0)
+                cursor = conn.execute(
+                    "DELETE FROM traffic_counts WHERE monitor_key = ? AND observed_at < ?", (key, raw_cutoff)
+                )
+                stats["raw_rows_expired"] += max(cursor.rowcount, 0)
+            set_retention_watermark(conn, "raw", raw_cutoff)
+
+        if quarter_cutoff > retention_watermark(conn, "15m"):
+            for key in all_keys:
+                cursor = conn.execute(
+                    "DELETE FROM traffic_rollup_15m WHERE monitor_key = ? AND bucket_start < ?", (key, quarter_cutoff)
+                )
+                stats["buckets_expired"] += max(cursor.rowcount, 0)
+            set_retention_watermark(conn, "15m", quarter_cutoff)
+
+    # Return free pages to the OS without rewriting the whole file. executescript
+    # steps the pragma to completion; a single execute() frees only one page.
+    free_pages = int(conn.execute("PRAGMA freelist_count").fetchone()[0])
+    if free_pages:
+        conn.executescript("PRAGMA incremental_vacuum;")
+        stats["pages_freed"] = free_pages - int(conn.execute("PRAGMA freelist_count").fetchone()[0])
+    return stats
+
+
+def rollup_totals(conn: sqlite3.Connection) -> dict:
+    """(rows, vehicles) summed over the hourly and 15-minute rollups."""
+    hourly = conn.execute("SELECT COALESCE(SUM(n), 0), COALESCE(SUM(vehicles_sum), 0) FROM traffic_rollup_hourly").fetchone()
+    quarter = conn.execute("SELECT COALESCE(SUM(n), 0), COALESCE(SUM(vehicles_sum), 0) FROM traffic_rollup_15m").fetchone()
+    return {"hourly": tuple(hourly), "15m": tuple(quarter)}
+
+
+def check_retention(db_path: Path) -> tuple[dict, dict]:
+    """Insert, retain, re-insert the same minutes (Python and the v1 view), retain again.
+
+    Runs on a fresh file at `db_path` and returns rollup totals after the
+    first retain and at the end; they must be equal.
+    """
+    db_path = Path(db_path)
+    db_path.unlink(missing_ok=True)
+    conn = connect_store(db_path)
+    start = 20_000 * 86400  # 2024-10-04 00:00 UTC
+    rows = [(0, "CHECK", start + 60 * minute, 10, 50.0, 5.0) for minute in range(10)]
+    now = start + 60 * 86400
+    with conn:
+        insert_rows(conn, rows)
+    apply_retention(conn, now=now)
+    first = rollup_totals(conn)
+    with conn:
+        insert_rows(conn, rows)
+        conn.executemany(
+            "INSERT INTO traffic (metro_id, monitor_id, observed_at, vehicles, speed, occupancy) VALUES (?, ?, ?, ?, ?, ?)",
+            [row[:2] + (f"{datetime.fromtimestamp(row[2], tz=timezone.utc):%Y-%m-%d %H:%M:%S}",) + row[3:] for row in rows],
+        )
+    apply_retention(conn, now=now + 86400)
+    last = rollup_totals(conn)
+    conn.close()
+    db_path.unlink(missing_ok=True)
+    return first, last
+
+
+# 7. READ ###################################
+
+def read_traffic(
+    conn: sqlite3.Connection,
+    metro_id: int,
+    columns: tuple[str, ...] = ("observed_at", "vehicles"),
+    since: int | None = None,
+) -> sqlite3.Cursor:
+    """Return a cursor over one metro's rows ordered by observed_at (epoch seconds).
+
+    If `load_pending_segments` was called on this connection, rows from
+    not-yet-compacted segments are included (rows already in traffic.db win).
+    With `since`, only rows with observed_at > since are returned.
+    """
+    allowed = {"monitor_id", "observed_at", "vehicles", "speed", "occupancy"}
+    unknown = set(columns) - allowed
+    if unknown:
+        raise ValueError(f"Unknown traffic columns: {', '.join(sorted(unknown))}")
+    select = ", ".join(columns)
+    stored_sql = """
+        SELECT m.metro_id, m.monitor_id, t.observed_at, t.vehicles, t.speed, t.occupancy
+        FROM traffic_counts AS t
+        JOIN monitors AS m ON m.monitor_key = t.monitor_key
+        WHERE m.metro_id = ? AND t.observed_at > ?
+    """
+    lower = int(since) if since is not None else -(2 ** 62)
+    params = [int(metro_id), lower]
+    if has_pending_segments(conn):
+        stored_sql += """
+        UNION ALL
+        SELECT s.metro_id, s.monitor_id, s.observed_at, s.vehicles, s.speed, s.occupancy
+        FROM temp.segment_rows AS s
+        WHERE s.metro_id = ? AND s.observed_at > ?
+          AND NOT EXISTS (
+            SELECT 1
+            FROM monitors AS m
+            JOIN traffic_counts AS t ON t.monitor_key = m.monitor_key
+            WHERE m.metro_id = s.metro_id AND m.monitor_id = s.monitor_id AND t.observed_at = s.observed_at
+          )
+        """
+        params.extend([int(metro_id), lower])
+    return conn.execute(f"SELECT {select} FROM ({stored_sql}) ORDER BY observed_at", params)
+
+
+def latest_observed_at(conn: sqlite3.Connection, metro_id: int) -> int | None:
+    """Newest observed_at for one metro (traffic.db plus loaded pending segments), via one PK seek per monitor."""
+    sql = """
+        SELECT MAX((SELECT MAX(t.observed_at) FROM traffic_counts AS t WHERE t.monitor_key = m.monitor_key))
+        FROM monitors AS m
+        WHERE m.metro_id = ?
+    """
+    latest = conn.execute(sql, (int(metro_id),)).fetchone()[0]
+    if has_pending_segments(conn):
+        pending = conn.execute(
+            "SELECT MAX(observed_at) FROM temp.segment_rows WHERE metro_id = ?", (int(metro_id),)
+        ).fetchone()[0]
+        if pending is not None and (latest is None or pending > latest):
+            latest = pending
+    return int(latest) if latest is not None else None
+
+
+def holdout_expression(holdout_folds: int, obs_date: str, hour_of_day: str) -> str:
+    """SQL for the hour-level holdout flag: hour h of week w is held out when (w + h) % folds == 0.
+
+    Every (day_of_week, hour_of_day) cell is then held out one week in
+    `holdout_folds`. read_cell_stats and read_features share this rule, so
+    raw and aggregated paths agree on which hours are unseen. 0 disables it.
+    """
+    if holdout_folds <= 0:
+        return "0"
+    return f"((({obs_date}) / 7 + ({hour_of_day})) % {int(holdout_folds)} = 0)"
+
+
+def feature_rows_sql(
+    conn: sqlite3.Connection,
+    metro_id: int,
+    since: int | None,
+    until: int | None,
+    select: str,
+) -> tuple[str, list]:
+    """SQL for one metro's non-null vehicle rows in (since, until], unioned with pending segments.
+
+    `select` names the row alias as `{row}`, e.g. "{row}.observed_at / 86400".
+    """
+    lower = int(since) if since is not None else -(2 ** 62)
+    upper = int(until) if until is not None else 2 ** 62
+    sql = f"""
+        SELECT {select.format(row="t")}
+        FROM traffic_counts AS t
+        JOIN monitors AS m ON m.monitor_key = t.monitor_key
+        WHERE m.metro_id = ? AND t.observed_at > ? AND t.observed_at <= ? AND t.vehicles IS NOT NULL
+    """
+    params = [int(metro_id), lower, upper]
+    if has_pending_segments(conn):
+        sql += f"""
+        UNION ALL
+        SELECT {select.format(row="s")}
+        FROM temp.segment_rows AS s
+        WHERE s.metro_id = ? AND s.observed_at > ? AND s.observed_at <= ? AND s.vehicles IS NOT NULL
+          AND NOT EXISTS (
+            SELECT 1
+            FROM monitors AS m
+            JOIN traffic_counts AS t ON t.monitor_key = m.monitor_key
+            WHERE m.metro_id = s.metro_id AND m.monitor_id = s.monitor_id AND t.observed_at = s.observed_at
+          )
+        """
+        params.extend([int(metro_id), lower, upper])
+    return sql, params
+
+
+def count_feature_rows(
+    conn: sqlite3.Connection,
+    metro_id: int,
+    since: int | None = None,
+    until: int | None = None,
+) -> int:
+    """Number of rows read_features will return, for preallocating arrays."""
+    sql, params = feature_rows_sql(conn, metro_id, since, until, "1")
+    return int(conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0])
+
+
+# UTC days since epoch and hour of day of a row's INTEGER epoch observed_at; {row} is the table alias.
+ROW_DATE_HOUR = ("{row}.observed_at / 86400", "({row}.observed_at % 86400) / 3600")
+
+
+def feature_columns_sql() -> str:
+    """day_of_week (1 = Monday .. 7 = Sunday) and hour_of_day, both UTC, for feature_rows_sql."""
+    obs_date, hour_of_day = ROW_DATE_HOUR
+    return f"(({obs_date} + 3) % 7) + 1, {hour_of_day}"
+
+
+def read_features(
+    conn: sqlite3.Connection,
+    metro_id: int,
+    since: int | None = None,
+    until: int | None = None,
+    holdout_folds: int = 0,
+) -> sqlite3.Cursor:
+    """Return a cursor of integer (day_of_week, hour_of_day, vehicles, holdout) training rows.
+
+    The features are computed in SQL from the integer epoch (1 = Monday .. 7 =
+    Sunday and hour 0-23, both UTC, like pandas dayofweek + 1 and hour), so
+    callers can copy fetchmany() chunks straight into typed arrays. Rows are
+    unordered; rows with a NULL vehicles count are skipped.
+    """
+    select = f"{feature_columns_sql()}, {{row}}.vehicles, {holdout_expression(holdout_folds, *ROW_DATE_HOUR)}"
+    sql, params = feature_rows_sql(conn, metro_id, since, until, select)
+    return conn.execute(sql, params)
+
+
+def read_target_features(
+    conn: sqlite3.Connection,
+    metro_id: int,
+    since: int | None = None,
+    until: int | None = None,
+    holdout_folds: int = 0,
+) -> sqlite3.Cursor:
+    """Like read_features for all three measures: (day_of_week, hour_of_day, holdout, vehicles, speed, occupancy).
+
+    Same rows as read_features (vehicles not NULL); speed and occupancy may
+    be NULL.
+    """
+    select = (
+        f"{feature_columns_sql()}, {holdout_expression(holdout_folds, *ROW_DATE_HOUR)}, "
+        "{row}.vehicles, {row}.speed, {row}.occupancy"
+    )
+    sql, params = feature_rows_sql(conn, metro_id, since, until, select)
+    return conn.execute(sql, params)
+
+
+def read_rollups(conn: sqlite3.Connection, metro_id: int, since_date: int | None = None) -> sqlite3.Cursor:
+    """Return a cursor over one metro's hourly rollups.
+
+    Columns: monitor_id, obs_date (UTC days since epoch), hour_of_day, n,
+    vehicles_sum, vehicles_sumsq, vehicles_min, vehicles_max. Rollups cover
+    traffic.db only, not pending segments.
+    """
+    return conn.execute(
+        """
+        SELECT m.monitor_id, r.obs_date, r.hour_of_day, r.n,
+               r.vehicles_sum, r.vehicles_sumsq, r.vehicles_min, r.vehicles_max
+        FROM traffic_rollup_hourly AS r
+        JOIN monitors AS m ON m.monitor_key = r.monitor_key
+        WHERE m.metro_id = ? AND r.obs_date >= ?
+        ORDER BY r.obs_date, r.hour_of_day, m.monitor_id
+    """,
+        (int(metro_id), int(since_date) if since_date is not None else -(2 ** 62)),
+    )
+
+
+def hourly_stats_sql(conn: sqlite3.Connection, metro_id: int) -> tuple[str, list]:
+    """SQL for (monitor_id, obs_date, hour_of_day, n, vehicles_sum, vehicles_sumsq) per monitor-hour.
+
+    Hourly rollups plus any loaded pending segment rows (one row each, n = 1)
+    that traffic.db does not already hold.
+    """
+    sql = """
+        SELECT m.monitor_id, r.obs_date, r.hour_of_day, r.n, r.vehicles_sum, r.vehicles_sumsq
+        FROM traffic_rollup_hourly AS r
+        JOIN monitors AS m ON m.monitor_key = r.monitor_key
+        WHERE m.metro_id = ?
+    """
+    params = [int(metro_id)]
+    if has_pending_segments(conn):
+        sql += """
+        UNION ALL
+        SELECT s.monitor_id, s.observed_at / 86400, (s.observed_at % 86400) / 3600, 1, s.vehicles, s.vehicles * s.vehicles
+        FROM temp.segment_rows AS s
+        WHERE s.metro_id = ?
+          AND s.vehicles IS NOT NULL
+          AND NOT EXISTS (
+            SELECT 1
+            FROM monitors AS m
+            JOIN traffic_counts AS t ON t.monitor_key = m.monitor_key
+            WHERE m.metro_id = s.metro_id AND m.monitor_id = s.monitor_id AND t.observed_at = s.observed_at
+          )
+        """
+        params.append(int(metro_id))
+    return sql, params
+
+
+def read_cell_stats(
+    conn: sqlite3.Connection,
+    metro_id: int,
+    holdout_folds: int = 5,
+    since_date: int | None = None,
+    until_date: int | None = None,
+) -> sqlite3.Cursor:
+    """Return sufficient statistics of vehicles per (holdout, day_of_week, hour_of_day) cell.
+
+    Columns: holdout (0/1), day_of_week (1 = Monday .. 7 = Sunday, UTC),
+    hour_of_day (UTC), n, vehicles_sum, vehicles_sumsq. Built from the hourly
+    rollups plus any loaded pending segment rows, so the result has at most
+    2 x 7 x 24 rows however many raw minutes exist (and survives `retain`).
+    Whole UTC hours go to the holdout (see holdout_expression); pass 0 for
+    no holdout. since_date / until_date (days since 1970-01-01, UTC) keep
+    only hours on or after since_date and before until_date.
+    """
+    holdout = holdout_expression(holdout_folds, "obs_date", "hour_of_day")
+    cells_sql, params = hourly_stats_sql(conn, metro_id)
+    bounds = [(">=", since_date), ("<", until_date)]
+    where = " AND ".join(f"obs_date {op} ?" for op, day in bounds if day is not None)
+    where = f"WHERE {where}" if where else ""
+    params = [*params, *(int(day) for _, day in bounds if day is not None)]
+    return conn.execute(
+        f"""
+        SELECT {holdout} AS holdout, ((obs_date + 3) % 7) + 1 AS day_of_week, hour_of_day,
+               SUM(n), SUM(vehicles_sum), SUM(vehicles_sumsq)
+        FROM ({cells_sql})
+        {where}
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+    """,
+        params,
+    )
+
+
+def read_monitor_cell_stats(conn: sqlite3.Connection, metro_id: int, holdout_folds: int = 5) -> sqlite3.Cursor:
+    """Like read_cell_stats, split by monitor: one row per (monitor_id, holdout, day_of_week, hour_of_day).
+
+    Columns: monitor_id, holdout, day_of_week, hour_of_day, n, vehicles_sum,
+    vehicles_sumsq, ordered by monitor_id so each monitor's cells are
+    contiguous. At most 2 x 7 x 24 rows per monitor.
+    """
+    holdout = holdout_expression(holdout_folds, "obs_date", "hour_of_day")
+    cells_sql, params = hourly_stats_sql(conn, metro_id)
+    return conn.execute(
+        f"""
+        SELECT monitor_id, {holdout} AS holdout, ((obs_date + 3) % 7) + 1 AS day_of_week, hour_of_day,
+               SUM(n), SUM(vehicles_sum), SUM(vehicles_sumsq)
+        FROM ({cells_sql})
+        GROUP BY 1, 2, 3, 4
+        ORDER BY 1, 2, 3, 4
+    """,
+        params,
+    )
+
+
+def read_hour_stats(conn: sqlite3.Connection, metro_id: int) -> sqlite3.Cursor:
+    """Return sufficient statistics of vehicles per UTC hour, oldest first.
+
+    Columns: obs_date (UTC days since epoch), hour_of_day, n, vehicles_sum,
+    vehicles_sumsq, summed over the metro's monitors. Time-ordered
+    cross-validation in 02_train_model.py splits on these hours.
+    """
+    hours_sql, params = hourly_stats_sql(conn, metro_id)
+    return conn.execute(
+        f"""
+        SELECT obs_date, hour_of_day, SUM(n), SUM(vehicles_sum), SUM(vehicles_sumsq)
+        FROM ({hours_sql})
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    """,
+        params,
+    )
+
+
+def read_rollups_15m(conn: sqlite3.Connection, metro_id: int, since: int | None = None) -> sqlite3.Cursor:
+    """Return a cursor over one metro's 15-minute buckets (the tier between raw rows and hourly rollups).
+
+    Columns: monitor_id, bucket_start (epoch seconds), n, then
+    (<measure>_n, <measure>_sum, <measure>_sumsq) for vehicles, speed and
+    occupancy. Pass each triple to `mean_std`.
+    """
+    return conn.execute(
+        """
+        SELECT m.monitor_id, r.bucket_start, r.n,
+               r.vehicles_n, r.vehicles_sum, r.vehicles_sumsq,
+               r.speed_n, r.speed_sum, r.speed_sumsq,
+               r.occupancy_n, r.occupancy_sum, r.occupancy_sumsq
+        FROM traffic_rollup_15m AS r
+        JOIN monitors AS m ON m.monitor_key = r.monitor_key
+        WHERE m.metro_id = ? AND r.bucket_start >= ?
+        ORDER BY r.bucket_start, m.monitor_id
+    """,
+        (int(metro_id), int(since) if since is not None else -(2 ** 62)),
+    )
+
+
+def mean_std(n: int, total: float, sumsq: float) -> tuple[float | None, float | None]:
+    """Mean and population standard deviation from count, sum and sum of squares."""
+    if not n:
+        return None, None
+    mean = total / n
+    return mean, math.sqrt(max(sumsq / n - mean * mean, 0.0))
+
+
+def count_rows_by_metro(conn: sqlite3.Connection) -> dict[int, int]:
+    return {
+        int(metro_id): int(n)
+        for metro_id, n in conn.execute(
+            """
+            SELECT m.metro_id, COUNT(*)
+            FROM traffic_counts AS t
+            JOIN monitors AS m ON m.monitor_key = t.monitor_key
+            GROUP BY m.metro_id
+        """
+        )
+    }
+
+
+# 8. DRIFT ###################################
+
+def cell_snapshot(
+    conn: sqlite3.Connection, metro_id: int, since_date: int | None = None, until_date: int | None = None
+) -> dict:
+    """Count, mean and SD of vehicles in every (day_of_week, hour_of_day) cell, as 168-long lists.
+
+    Index (day_of_week - 1) * 24 + hour_of_day; mean is None for empty cells
+    and sd is None below 2 rows. 02_train_model.py saves this (whole history)
+    in validationpy.json; `drift` compares it with a snapshot of the last few
+    days (since_date / until_date, see read_cell_stats).
+    """
+    n = [0] * 168
+    mean = [None] * 168
+    sd = [None] * 168
+    for _, day_of_week, hour_of_day, count, total, sumsq in read_cell_stats(conn, metro_id, 0, since_date, until_date):
+        cell = (int(day_of_week) - 1) * 24 + int(hour_of_day)
+        n[cell] = int(count)
+        mean[cell] = round(float(total) / count, 4)
+        if count > 1:
+            sd[cell] = round(math.sqrt(max(float(sumsq) - float(total) ** 2 / count, 0.0) / (count - 1)), 4)
+    return {"n": n, "mean": mean, "sd": sd}
+
+
+def cell_drift(previous: dict, current: dict) -> dict:
+    """Shift of a recent snapshot (`current`) from the training snapshot (`previous`).
+
+    - mean_z2: mean over cells of z^2, z = (mean now - mean before) / (sd
+      before / sqrt(n now)). Sampling noise alone gives about 1 however many
+      rows either snapshot holds; inf when no cell can be compared (e.g. a
+      snapshot saved before sd was recorded).
+    - count_shift: total variation distance between the two share-of-rows
+      distributions over cells (0 = same shape, 1 = disjoint).
+    - mean_shift: row-weighted mean absolute change of the cell means,
+      relative to the previous overall mean (reported, not gated).
+    """
+    n_before, n_now = sum(previous["n"]), sum(current["n"])
+    if not n_before or not n_now:
+        return {"rows_before": n_before, "rows_now": n_now, "cells": 0, "mean_z2": math.inf, "count_shift": 1.0, "mean_shift": 1.0}
+    overall_before = sum(n * m for n, m in zip(previous["n"], previous["mean"]) if n) / n_before
+    count_shift = 0.5 * sum(abs(a / n_before - b / n_now) for a, b in zip(previous["n"], current["n"]))
+    moved = sum(
+        n / n_now * abs(m - (before if before is not None else overall_before))
+        for n, m, before in zip(current["n"], current["mean"], previous["mean"])
+        if n
+    )
+    z2 = [
+        (m - before) ** 2 * n / sd ** 2
+        for n, m, before, sd in zip(current["n"], current["mean"], previous["mean"], previous.get("sd", [None] * 168))
+        if n and before is not None and sd
+    ]
+    return {
+        "rows_before": n_before,
+        "rows_now": n_now,
+        "cells": len(z2),
+        "mean_z2": sum(z2) / len(z2) if z2 else math.inf,
+        "count_shift": count_shift,
+        "mean_shift": moved / overall_before if overall_before else 1.0,
+    }
+
+
+def drift_moved(drift: dict, max_mean_z2: float = DRIFT_MEAN_Z2, max_count_shift: float = DRIFT_COUNT_SHIFT) -> bool:
+    return drift["mean_z2"] > max_mean_z2 or drift["count_shift"] > max_count_shift
+
+
+def check_drift(db_path: Path, weeks: int = 8, seed: int = 0) -> tuple[dict, dict]:
+    """Drift of a quiet week and of a week with 15% more traffic against `weeks` weeks of history.
+
+    Writes stationary synthetic minutes (4 monitors, one row per 10 minutes,
+    a weekday rush-hour profile plus Gaussian noise) to a fresh file at
+    `db_path`; the quiet week must not trigger a retrain and the busy week must.
+    """
+    import random
+
+    db_path = Path(db_path)
+    db_path.unlink(missing_ok=True)
+    conn = connect_store(db_path)
+    rng = random.Random(seed)
+    start_date = 20_000 - (20_000 + 3) % 7  # a Monday
+    total_weeks = weeks + 2
+
+    def vehicles(observed_at: int, scale: float) -> int:
+        day, hour = (observed_at // 86400 + 3) % 7, observed_at % 86400 // 3600
+        profile = 20 + (15 if day < 5 and hour in (7, 8, 16, 17) else 0) - (12 if hour < 5 else 0)
+        return max(0, round(rng.gauss(profile * scale, 5)))
+
+    with conn:
+        insert_rows(
+            conn,
+            [
+                (0, f"CHECK_{monitor}", observed_at, vehicles(observed_at, 1.15 if week == weeks + 1 else 1.0), None, None)
+                for week in range(total_weeks)
+                for observed_at in range((start_date + 7 * week) * 86400, (start_date + 7 * week + 7) * 86400, 600)
+                for monitor in range(4)
+            ],
+        )
+    history = cell_snapshot(conn, 0, until_date=start_date + 7 * weeks)
+    quiet = cell_drift(history, cell_snapshot(conn, 0, start_date + 7 * weeks, start_date + 7 * weeks + 7))
+    busy = cell_drift(history, cell_snapshot(conn, 0, start_date + 7 * weeks + 7, start_date + 7 * total_weeks))
+    conn.close()
+    db_path.unlink(missing_ok=True)
+    return quiet, busy
+
+
+# 9. CLI ###################################
+
+def print_info(db_path: Path, segments_dir: Path) -> None:
+    conn = connect_store(db_path)
+    counts = count_rows_by_metro(conn)
+    n_monitors = int(conn.execute("SELECT COUNT(*) FROM monitors").fetchone()[0])
+    n_rollups = int(conn.execute("SELECT COUNT(*) FROM traffic_rollup_hourly").fetchone()[0])
+    n_obs = int(conn.execute("SELECT COUNT(*) FROM traffic_obs").fetchone()[0])
+    n_quarters = int(conn.execute("SELECT COUNT(*) FROM traffic_rollup_15m").fetchone()[0])
+    watermarks = dict(conn.execute("SELECT tier, watermark FROM retention_state").fetchall())
+    conn.close()
+    segments = list_segments(segments_dir)
+    print(f"   db: {db_path}")
+    print(f"   schema: v{SCHEMA_VERSION}")
+    print(f"   monitors: {n_monitors}")
+    for metro_id, n in sorted(counts.items()):
+        print(f"   metro {metro_id}: {n} rows")
+    print(f"   15-minute rollup rows: {n_quarters}")
+    print(f"   hourly rollup rows: {n_rollups}")
+    for tier, watermark in sorted(watermarks.items()):
+        print(f"   {tier} tier watermark: {datetime.fromtimestamp(watermark, tz=timezone.utc):%Y-%m-%d %H:%M} UTC")
+    print(f"   traffic_obs rows: {n_obs}")
+    print(f"   file size: {db_path.stat().st_size:,} bytes")
+    print(f"   pending segments: {len(segments)} ({sum(p.stat().st_size for p in segments):,} bytes)")
+
+
+def print_runs(runs: list[dict]) -> None:
+    if not runs:
+        print("   no ingest runs recorded yet")
+        return
+    first = datetime.fromtimestamp(runs[0]["started_at"], tz=timezone.utc)
+    last = datetime.fromtimestamp(runs[-1]["started_at"], tz=timezone.utc)
+    print(f"   runs: {len(runs)} ({first:%Y-%m-%d %H:%M} -> {last:%Y-%m-%d %H:%M} UTC)")
+    totals = [run["finished_at"] - run["started_at"] for run in runs]
+    stages = {
+        "fetch": [run["fetch_seconds"] for run in runs],
+        "parse": [run["parse_seconds"] for run in runs],
+        "write": [run["write_seconds"] for run in runs],
+        "total": totals,
+    }
+    print(f"   {'stage':<8}{'p50 (s)':>10}{'p95 (s)':>10}")
+    for stage, values in stages.items():
+        print(f"   {stage:<8}{percentile(values, 50):>10.3f}{percentile(values, 95):>10.3f}")
+    rates = [run["inserted_rows"] / total for run, total in zip(runs, totals) if total > 0]
+    print(f"   inserted rows/s: p50 {percentile(rates, 50):.1f}, p95 {percentile(rates, 95):.1f}")
+    print(f"   candidate rows: {sum(run['candidate_rows'] for run in runs)}")
+    print(f"   inserted rows: {sum(run['inserted_rows'] for run in runs)}")
+    print(f"   duplicate rows: {sum(run['duplicate_rows'] for run in runs)}")
+    failed = sum(1 for run in runs if run["sources_failed"])
+    print(f"   runs with a failed source: {failed}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the traffic SQLite store.")
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="Path to traffic.db (default: data/traffic.db).")
+    parser.add_argument(
+        "--segments-dir", type=Path, default=SEGMENTS_DIR,
+        help="Folder of append-only segment files (default: data/segments).",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("info", help="Print schema version, row counts, file size and pending segments.")
+    commands.add_parser("migrate", help="Upgrade an older traffic.db to the latest schema in place.")
+    commands.add_parser("compact", help="Fold pending segment files into traffic.db and delete them.")
+    runs_parser = commands.add_parser("runs", help="Report p50/p95 stage latencies and rows/s over recent ingest runs.")
+    runs_parser.add_argument("--last", type=int, default=100, help="Number of most recent runs (default: 100).")
+    retain_parser = commands.add_parser("retain", help="Downsample and expire old rows, then incrementally vacuum.")
+    retain_parser.add_argument(
+        "--raw-days", type=float, default=RAW_RETENTION_DAYS,
+        help=f"Keep raw 1-minute rows this many days (default: {RAW_RETENTION_DAYS}).",
+    )
+    retain_parser.add_argument(
+        "--quarter-days", type=float, default=QUARTER_HOUR_RETENTION_DAYS,
+        help=f"Keep 15-minute buckets this many days (default: {QUARTER_HOUR_RETENTION_DAYS}); hourly rollups are kept forever.",
+    )
+    drift_parser = commands.add_parser(
+        "drift", help="Compare per-cell counts and means with the last training; print status skipped or retrain.",
+    )
+    drift_parser.add_argument(
+        "--validation", type=Path, default=DATA_DIR / "validationpy.json",
+        help="Validation JSON holding the cell snapshot of the last training (default: data/validationpy.json).",
+    )
+    drift_parser.add_argument(
+        "--window-days", type=int, default=DRIFT_WINDOW_DAYS,
+        help=f"Compare this many most recent days with the snapshot (default: {DRIFT_WINDOW_DAYS}).",
+    )
+    drift_parser.add_argument(
+        "--max-mean-z2", type=float, default=DRIFT_MEAN_Z2,
+        help=f"Retrain above this mean squared standardized shift of the cell means (default: {DRIFT_MEAN_Z2}).",
+    )
+    drift_parser.add_argument(
+        "--max-count-shift", type=float, default=DRIFT_COUNT_SHIFT,
+        help=f"Retrain above this shift of the rows-per-cell distribution (default: {DRIFT_COUNT_SHIFT}).",
+    )
+    check_parser = commands.add_parser(
+        "check", help="On a scratch db: fail if re-inserted rows are counted twice, or if the drift gate misjudges a quiet or busier week.",
+    )
+    check_parser.add_argument(
+        "--scratch", type=Path, default=Path(tempfile.gettempdir()) / "traffic_store_check.db",
+        help="Scratch database path, replaced and removed (default: in the temp folder).",
+    )
+    args = parser.parse_args()
+
+    if args.command in {"info", "migrate"}:
+        if not args.db.exists():
+            raise SystemExit(f"No database at {args.db}")
+        conn = sqlite3.connect(str(args.db))
+        version = schema_version(conn)
+        conn.close()
+        if args.command == "info" and version == 1:
+            print(f"   db: {args.db}")
+            print(f"   schema: v1 ({args.db.stat().st_size:,} bytes); run `python traffic_store.py migrate` to upgrade")
+            return
+        if args.command == "migrate":
+            size_before = args.db.stat().st_size
+            connect_store(args.db).close()
+            if version < SCHEMA_VERSION:
+                print(f"   file size: {size_before:,} -> {args.db.stat().st_size:,} bytes")
+            else:
+                print(f"   already schema v{version}; nothing to migrate")
+            return
+        print_info(args.db, args.segments_dir)
+
+    elif args.command == "compact":
+        conn = connect_store(args.db)
+        n_segments, inserted = compact_segments(conn, args.segments_dir)
+        conn.close()
+        print(f"   compacted segments: {n_segments}")
+        print(f"   rows added to traffic.db: {inserted}")
+
+    elif args.command == "runs":
+        conn = connect_store(args.db)
+        runs = recent_runs(conn, args.segments_dir, limit=args.last)
+        conn.close()
+        print_runs(runs)
+
+    elif args.command == "retain":
+        conn = connect_store(args.db)
+        size_before = args.db.stat().st_size
+        try:
+            stats = apply_retention(conn, raw_days=args.raw_days, quarter_days=args.quarter_days)
+        except ValueError as exc:
+            raise SystemExit(str(exc))
+        finally:
+            conn.close()
+        raw_from = datetime.fromtimestamp(stats["raw_cutoff"], tz=timezone.utc)
+        print(f"   raw rows kept from: {raw_from:%Y-%m-%d %H:%M} UTC")
+        print(f"   raw rows folded into 15-minute buckets: {stats['raw_rows_expired']}")
+        print(f"   15-minute buckets written: {stats['buckets_written']}")
+        print(f"   15-minute buckets expired: {stats['buckets_expired']}")
+        print(f"   pages freed: {stats['pages_freed']}")
+        print(f"   file size: {size_before:,} -> {args.db.stat().st_size:,} bytes")
+
+    elif args.command == "drift":
+        validation = json.loads(args.validation.read_text(encoding="utf-8")) if args.validation.exists() else {}
+        previous = validation.get("cell_snapshot")
+        if previous is None:
+            status = "retrain"
+            print(f"   no cell snapshot in {args.validation}")
+        else:
+            conn = connect_store(args.db)
+            load_pending_segments(conn, args.segments_dir)
+            metro_id = int(validation["metro_id"])
+            latest = latest_observed_at(conn, metro_id)
+            trained_until = validation.get("data_watermark")
+            if latest is None or (trained_until is not None and latest <= int(trained_until)):
+                conn.close()
+                status = "skipped"
+                print("   no rows since the last training")
+            else:
+                # Whole UTC days before the newest row's day: the window follows the
+                # data, not the clock, and a partial day does not skew the counts.
+                until_date = latest // 86400
+                drift = cell_drift(previous, cell_snapshot(conn, metro_id, until_date - args.window_days, until_date))
+                conn.close()
+                print(f"   rows: {drift['rows_before']} at last training, {drift['rows_now']} in the last {args.window_days} whole days")
+                print(f"   mean z^2: {drift['mean_z2']:.2f} over {drift['cells']} cells (max {args.max_mean_z2})")
+                print(f"   count shift: {drift['count_shift']:.4f} (max {args.max_count_shift})")
+                print(f"   mean shift: {drift['mean_shift']:.4f} (reported only)")
+                status = "retrain" if drift_moved(drift, args.max_mean_z2, args.max_count_shift) else "skipped"
+        print(f"   status: {status}")
+        # GitHub Actions reads step outputs from this file.
+        if os.environ.get("GITHUB_OUTPUT"):
+            with open(os.environ["GITHUB_OUTPUT"], "a", encoding="utf-8") as handle:
+                handle.write(f"status={status}\n")
+
+    elif args.command == "check":
+        first, last = check_retention(args.scratch)
+        for tier in ("hourly", "15m"):
+            print(f"   {tier} rollup rows / vehicles: {first[tier]} after retain, {last[tier]} after re-insert")
+        if first != last:
+            raise SystemExit("Re-inserted rows below the retention watermark were counted twice.")
+        print("   ok: rows below the raw watermark are not counted again")
+        quiet, busy = check_drift(args.scratch)
+        for name, drift in (("quiet week", quiet), ("week +15%", busy)):
+            print(f"   {name}: mean z^2 {drift['mean_z2']:.2f}, count shift {drift['count_shift']:.4f}")
+        if drift_moved(quiet) or not drift_moved(busy):
+            raise SystemExit("Drift gate: a quiet week must be skipped and a 15% busier week retrained.")
+        print("   ok: drift gate skips a quiet week and retrains on a busier one")
+
+
+if __name__ == "__main__":
+    main()